@@ -0,0 +1,83 @@
+# anonymize.py
+# 얼굴/번호판 비식별화 커널.
+# - 박스는 이미지 범위로 자르고, 겹치거나 맞닿은 박스는 외접 사각형 하나로 합쳐 한 번만 처리한다
+# - 입력 배열을 직접 수정한다 (전체 이미지 복사 없음)
+# - gaussian: 커널이 max_kernel 보다 크면 ROI 를 줄여서 블러한 뒤 다시 키운다 (비용이 커널 크기에 거의 무관)
+# - pixelate: 축소 → 최근접 확대 한 쌍
+# - fill: 단색 채우기
+from typing import List, Sequence, Tuple
+
+import cv2
+import numpy as np
+
+METHODS = ("gaussian", "pixelate", "fill")
+
+
+def clip_boxes(boxes_xyxy: np.ndarray, w: int, h: int) -> List[List[int]]:
+    """정수 [x1, y1, x2, y2] 목록으로 변환 + 이미지 범위로 자르기 + 빈 박스 제거"""
+    b = np.asarray(boxes_xyxy, dtype=np.float64).reshape(-1, 4)
+    lo = np.clip(np.floor(b[:, :2]), 0, (w, h))
+    hi = np.clip(np.ceil(b[:, 2:]), 0, (w, h))
+    return [box for box in np.hstack([lo, hi]).astype(int).tolist() if box[2] > box[0] and box[3] > box[1]]
+
+
+def merge_boxes(boxes: List[List[int]]) -> List[List[int]]:
+    """겹치거나 맞닿은 박스를 외접 사각형으로 합친다 (합친 결과가 다시 겹치지 않을 때까지, 박스 수가 적으므로 O(n^2))"""
+    out = [list(b) for b in boxes]
+    merged = True
+    while merged and len(out) > 1:
+        merged = False
+        res: List[List[int]] = []
+        for b in out:
+            for r in res:
+                if b[0] <= r[2] and r[0] <= b[2] and b[1] <= r[3] and r[1] <= b[3]:
+                    r[0], r[1], r[2], r[3] = min(r[0], b[0]), min(r[1], b[1]), max(r[2], b[2]), max(r[3], b[3])
+                    merged = True
+                    break
+            else:
+                res.append(b)
+        out = res
+    return out
+
+
+def _odd(k: int) -> int:
+    return k if k % 2 == 1 else k + 1
+
+
+def _blur_roi(roi: np.ndarray, k: int, max_kernel: int) -> np.ndarray:
+    h, w = roi.shape[:2]
+    f = -(-k // max_kernel)
+    if f <= 1 or min(w, h) < 2 * f:
+        return cv2.GaussianBlur(roi, (k, k), 0)
+    small = cv2.resize(roi, (max(1, w // f), max(1, h // f)), interpolation=cv2.INTER_AREA)
+    small = cv2.GaussianBlur(small, (_odd(k // f), _odd(k // f)), 0)
+    return cv2.resize(small, (w, h), interpolation=cv2.INTER_LINEAR)
+
+
+def anonymize(img_bgr: np.ndarray, boxes_xyxy: np.ndarray, method: str = "gaussian",
+              blur_strength: int = 31, pixel_size: int = 16, fill_color: Sequence[int] = (0, 0, 0),
+              max_kernel: int = 15) -> np.ndarray:
+    """boxes 영역을 비식별화 (img_bgr 를 직접 수정하고 그대로 반환)"""
+    if method not in METHODS:
+        raise ValueError(f"unknown anonymize method: {method}")
+    h, w = img_bgr.shape[:2]
+    boxes = merge_boxes(clip_boxes(boxes_xyxy, w, h))
+    k = _odd(int(blur_strength))
+    for x1, y1, x2, y2 in boxes:
+        if method == "fill":
+            cv2.rectangle(img_bgr, (x1, y1), (x2 - 1, y2 - 1), tuple(int(c) for c in fill_color), -1)
+            continue
+        roi = img_bgr[y1:y2, x1:x2]
+        if method == "pixelate":
+            sh, sw = max(1, (y2 - y1) // pixel_size), max(1, (x2 - x1) // pixel_size)
+            small = cv2.resize(roi, (sw, sh), interpolation=cv2.INTER_LINEAR)
+            roi[:] = cv2.resize(small, (x2 - x1, y2 - y1), interpolation=cv2.INTER_NEAREST)
+        else:
+            roi[:] = _blur_roi(roi, k, max_kernel)
+    return img_bgr
+
+
+def parse_color(value: str) -> Tuple[int, int, int]:
+    """"B,G,R" 문자열 → (B, G, R)"""
+    b, g, r = (int(v) for v in value.split(","))
+    return b, g, r
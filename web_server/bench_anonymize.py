@@ -0,0 +1,81 @@
+# bench_anonymize.py
+# 비식별화 커널 마이크로 벤치마크 (예전 apply_blur 대비).
+#   python bench_anonymize.py [--edge 1280] [--boxes 1 4 16] [--repeat 200]
+# 박스당 시간(us)을 출력한다. legacy 는 예전 구현(전체 복사 + 박스별 원본 해상도 블러, 겹침 중복 처리)이다.
+import argparse
+import time
+
+import cv2
+import numpy as np
+
+from anonymize import anonymize
+
+
+def legacy_apply_blur(img_bgr, boxes_xyxy, method="gaussian", blur_strength=31, pixel_size=16):
+    out = img_bgr.copy()
+    h, w = out.shape[:2]
+    for x1, y1, x2, y2 in boxes_xyxy:
+        x1 = max(int(x1), 0); y1 = max(int(y1), 0)
+        x2 = min(int(x2), w); y2 = min(int(y2), h)
+        if x2 <= x1 or y2 <= y1: continue
+        roi = out[y1:y2, x1:x2]
+        if method == "pixelate":
+            sh, sw = max(1, (y2-y1)//pixel_size), max(1, (x2-x1)//pixel_size)
+            small = cv2.resize(roi, (sw, sh), interpolation=cv2.INTER_LINEAR)
+            roi_blur = cv2.resize(small, (x2-x1, y2-y1), interpolation=cv2.INTER_NEAREST)
+        else:
+            k = blur_strength if blur_strength % 2 == 1 else blur_strength + 1
+            roi_blur = cv2.GaussianBlur(roi, (k, k), 0)
+        out[y1:y2, x1:x2] = roi_blur
+    return out
+
+
+def make_case(edge: int, n_boxes: int, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    h = edge * 9 // 16
+    img = rng.integers(0, 256, (h, edge, 3), dtype=np.uint8)
+    # 얼굴(작은 정사각형) + 번호판(가로로 긴 박스), 일부는 서로 겹치게
+    sizes = rng.integers(edge // 40, edge // 8, n_boxes)
+    x1 = rng.integers(0, edge - sizes.max(), n_boxes)
+    y1 = rng.integers(0, h - sizes.max(), n_boxes)
+    wide = rng.random(n_boxes) < 0.5
+    w = np.where(wide, sizes * 2, sizes)
+    boxes = np.stack([x1, y1, np.minimum(x1 + w, edge), y1 + sizes], axis=1).astype(np.float32)
+    return img, boxes
+
+
+def bench(fn, img, boxes, repeat: int) -> float:
+    work = [img.copy() for _ in range(min(repeat, 8))]
+    fn(work[0], boxes)
+    t = time.perf_counter()
+    for i in range(repeat):
+        fn(work[i % len(work)], boxes)
+    return (time.perf_counter() - t) / repeat
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--edge", type=int, default=1280)
+    ap.add_argument("--boxes", type=int, nargs="+", default=[1, 4, 16])
+    ap.add_argument("--strength", type=int, nargs="+", default=[31, 99])
+    ap.add_argument("--repeat", type=int, default=200)
+    args = ap.parse_args()
+
+    cv2.setNumThreads(1)
+    print(f"edge={args.edge}  (us per box, single thread)")
+    print(f"{'boxes':>5} {'method':>9} {'k':>4} {'legacy':>9} {'new':>9} {'speedup':>8}")
+    for n in args.boxes:
+        img, boxes = make_case(args.edge, n)
+        cases = [("gaussian", k) for k in args.strength] + [("pixelate", 0), ("fill", 0)]
+        for method, k in cases:
+            kw = {"blur_strength": k} if method == "gaussian" else {}
+            new = bench(lambda im, b: anonymize(im, b, method=method, **kw), img, boxes, args.repeat)
+            if method == "fill":       # 예전 구현에는 없음
+                print(f"{n:>5} {method:>9} {'-':>4} {'-':>9} {new / n * 1e6:>9.1f} {'-':>8}")
+                continue
+            old = bench(lambda im, b: legacy_apply_blur(im, b, method=method, **kw), img, boxes, args.repeat)
+            print(f"{n:>5} {method:>9} {k or '-':>4} {old / n * 1e6:>9.1f} {new / n * 1e6:>9.1f} {old / new:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+# bounded_executor.py
+# CPU 작업(디코딩/블러/인코딩) 전용 스레드 풀. 대기열이 가득 차면 즉시 거절해 이벤트 루프와
+# 기본 threadpool(조회 API)이 추론 부하에 밀리지 않도록 한다.
+import asyncio
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable
+
+
+class QueueFullError(RuntimeError):
+    """대기열 포화 — 호출 측에서 503 + Retry-After 로 변환"""
+
+    def __init__(self, name: str, depth: int, retry_after: int = 1):
+        super().__init__(f"{name} queue is full (depth={depth})")
+        self.name = name
+        self.depth = depth
+        self.retry_after = retry_after
+
+
+class BoundedExecutor:
+    def __init__(self, workers: int, max_queue: int, name: str = "cpu", retry_after: int = 1):
+        self.workers = max(1, int(workers))
+        self.max_pending = self.workers + max(0, int(max_queue))
+        self.name = name
+        self.retry_after = retry_after
+        self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix=f"{name}-pool")
+        self._pending = 0
+        self._lock = threading.Lock()
+
+    def depth(self) -> int:
+        """실행 중 + 대기 중 작업 수"""
+        return self._pending
+
+    def submit(self, fn: Callable[..., Any], *args, **kwargs) -> Future:
+        with self._lock:
+            if self._pending >= self.max_pending:
+                raise QueueFullError(self.name, self._pending, self.retry_after)
+            self._pending += 1
+        try:
+            fut = self._pool.submit(fn, *args, **kwargs)
+        except BaseException:
+            self._release(None)
+            raise
+        fut.add_done_callback(self._release)
+        return fut
+
+    async def run(self, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        return await asyncio.wrap_future(self.submit(fn, *args, **kwargs))
+
+    def _release(self, _fut):
+        with self._lock:
+            self._pending -= 1
+
+    def shutdown(self, wait: bool = False):
+        self._pool.shutdown(wait=wait)
@@ -0,0 +1,103 @@
+# device_state.py
+# 기기별 최신 상태 테이블. 적재(flush) 트랜잭션 안에서 함께 갱신된다.
+# - wear_ring / ts_ring : 최근 RING_SIZE 건의 마모 점수/생성 시각 (최신순)
+# - last_ts, n_total    : 마지막 생성 시각, 누적 건수
+# - crit3               : 최근 3건 중 wear >= CRITICAL 인 건수 (기본 임계값 기준)
+# 최신 상태 요약 / 유지보수 후보 / 우선순위 랭킹은 전체 이력 대신 이 테이블(O(devices))을 읽는다.
+import os
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, List
+
+from sqlalchemy import text
+from sqlalchemy.engine import Connection
+
+from rollups import to_utc, wear_of
+
+TABLE = "lane_wear_device_state"
+RING_SIZE = 6
+CRITICAL = float(os.getenv("WEAR_CRITICAL", "70"))
+
+DDL = [
+    f"""
+    CREATE TABLE IF NOT EXISTS {TABLE} (
+      device_id TEXT PRIMARY KEY,
+      last_ts   TIMESTAMPTZ,
+      wear_ring DOUBLE PRECISION[] NOT NULL DEFAULT '{{}}',
+      ts_ring   TIMESTAMPTZ[]      NOT NULL DEFAULT '{{}}',
+      n_total   BIGINT   NOT NULL DEFAULT 0,
+      crit3     SMALLINT NOT NULL DEFAULT 0
+    )
+    """,
+    f"CREATE INDEX IF NOT EXISTS ix_{TABLE}_last_ts ON {TABLE} (last_ts)",
+]
+
+
+def _crit3(wears: List[Any], critical: float = CRITICAL) -> int:
+    return sum(1 for w in wears[:3] if w is not None and w >= critical)
+
+
+def crit3_sql(param: str = "critical") -> str:
+    """임의 임계값에 대한 최근 3건 critical 수 (ring 에서 계산)"""
+    return " + ".join(f"COALESCE((wear_ring[{i}] >= :{param})::int, 0)" for i in (1, 2, 3))
+
+
+# ---------------------------------------------------------
+# 적재 시 갱신 (WriteBehindBuffer flush hook)
+# ---------------------------------------------------------
+def apply_rows(conn: Connection, rows: Iterable[Dict[str, Any]]):
+    by_dev: Dict[str, List[tuple]] = {}
+    now = datetime.now(timezone.utc)
+    for r in rows:
+        dev = r.get("device_id")
+        if not dev:
+            continue
+        by_dev.setdefault(dev, []).append((to_utc(r.get("created_at") or now), wear_of(r)))
+    if not by_dev:
+        return
+    devs = sorted(by_dev)
+    # 신규 기기 행을 먼저 만들고, 정렬된 순서로 잠가 동시 flush 간 교착을 피한다
+    conn.execute(text(f"INSERT INTO {TABLE} (device_id) VALUES (:d) ON CONFLICT (device_id) DO NOTHING"),
+                 [{"d": d} for d in devs])
+    cur = conn.execute(text(f"""
+        SELECT device_id, wear_ring, ts_ring, n_total FROM {TABLE}
+        WHERE device_id = ANY(:devs) ORDER BY device_id FOR UPDATE
+    """), {"devs": devs}).mappings().all()
+    updates = []
+    for st in cur:
+        merged = list(zip(st["ts_ring"] or [], st["wear_ring"] or [])) + by_dev[st["device_id"]]
+        merged.sort(key=lambda x: x[0], reverse=True)
+        ring = merged[:RING_SIZE]
+        wears = [w for _, w in ring]
+        updates.append({
+            "d": st["device_id"], "last_ts": ring[0][0],
+            "w": wears, "t": [ts for ts, _ in ring],
+            "n": int(st["n_total"]) + len(by_dev[st["device_id"]]),
+            "c3": _crit3(wears),
+        })
+    conn.execute(text(f"""
+        UPDATE {TABLE} SET last_ts = :last_ts, wear_ring = CAST(:w AS DOUBLE PRECISION[]),
+               ts_ring = CAST(:t AS TIMESTAMPTZ[]), n_total = :n, crit3 = :c3
+        WHERE device_id = :d
+    """), updates)
+
+
+def rebuild(conn: Connection, critical: float = CRITICAL):
+    """원본 테이블에서 기기 상태 전체 재계산 (backfill)"""
+    conn.execute(text(f"LOCK TABLE {TABLE} IN EXCLUSIVE MODE"))
+    conn.execute(text(f"TRUNCATE {TABLE}"))
+    conn.execute(text(f"""
+        INSERT INTO {TABLE} (device_id, last_ts, wear_ring, ts_ring, n_total, crit3)
+        SELECT device_id,
+               MAX(created_at),
+               array_agg(wear ORDER BY rn) FILTER (WHERE rn <= {RING_SIZE}),
+               array_agg(created_at ORDER BY rn) FILTER (WHERE rn <= {RING_SIZE}),
+               COUNT(*),
+               SUM(CASE WHEN rn <= 3 AND wear >= :critical THEN 1 ELSE 0 END)
+        FROM (
+          SELECT device_id, created_at, (overall->>'wear_score')::float AS wear,
+                 ROW_NUMBER() OVER (PARTITION BY device_id ORDER BY created_at DESC, id DESC) AS rn
+          FROM lane_wear_results
+          WHERE device_id IS NOT NULL AND created_at IS NOT NULL
+        ) r
+        GROUP BY device_id
+    """), {"critical": critical})
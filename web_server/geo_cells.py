@@ -0,0 +1,328 @@
+# geo_cells.py
+# 고정 원점 계층 공간 셀 + 줌 레벨별 시간 집계.
+# - 각 행은 적재 시 Web Mercator 타일 좌표(ZMAX 줌)를 Morton(quadkey) 순서로 섞은 geo_cell(bigint) 을 받는다.
+#   상위 줌의 셀은 비트 시프트(geo_cell >> 2*(ZMAX-z))로 얻고, 한 셀의 하위 셀은 연속된 geo_cell 범위가 된다.
+# - 줌 레벨(ZOOMS) x 셀 x 시간 별 건수/합/최소/최대/히스토그램을 적재 트랜잭션에서 누적한다.
+#   /geo/cells 는 bbox 에 걸친 셀의 집계 행만 (z, x, y) 인덱스 범위로 읽는다.
+# - p90 은 병합 가능한 고정 구간 히스토그램(0~100, 1점 단위)으로 근사하고 셀의 최소/최대로 보정한다.
+import math
+import os
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.engine import Connection
+
+from rollups import ceil_hour, floor_hour, wear_of
+
+TABLE = "lane_wear_geo_hourly"
+ZMAX = 24                                   # geo_cell 해상도 (적도 기준 약 2.4m)
+ZOOMS = tuple(sorted(int(z) for z in os.getenv("GEO_ZOOMS", "14,15,16,17,18,19,20,21,22").split(",")))
+HIST_LO, HIST_HI = 0.0, 100.0
+HIST_BINS = 102                             # [<0] + 100 x 1점 + [>=100]
+EARTH_M = 40075016.686
+MAX_LAT = 85.05112878
+
+DDL = [
+    # int[] 원소별 합 (히스토그램 병합)
+    """
+    CREATE OR REPLACE FUNCTION lw_hist_add(a INTEGER[], b INTEGER[]) RETURNS INTEGER[]
+    LANGUAGE sql IMMUTABLE AS $$
+      SELECT CASE WHEN a IS NULL THEN b WHEN b IS NULL THEN a ELSE
+        ARRAY(SELECT COALESCE(x, 0) + COALESCE(y, 0) FROM unnest(a, b) WITH ORDINALITY AS u(x, y, i) ORDER BY i)
+      END
+    $$
+    """,
+    "CREATE OR REPLACE AGGREGATE lw_hist_sum(INTEGER[]) (SFUNC = lw_hist_add, STYPE = INTEGER[])",
+    f"""
+    CREATE TABLE IF NOT EXISTS {TABLE} (
+      z        SMALLINT    NOT NULL,
+      x        INTEGER     NOT NULL,
+      y        INTEGER     NOT NULL,
+      bucket   TIMESTAMPTZ NOT NULL,
+      n        BIGINT      NOT NULL,
+      wear_n   BIGINT      NOT NULL,
+      wear_sum DOUBLE PRECISION NOT NULL,
+      wear_min DOUBLE PRECISION,
+      wear_max DOUBLE PRECISION,
+      hist     INTEGER[]   NOT NULL,
+      last_ts  TIMESTAMP,
+      PRIMARY KEY (z, x, y, bucket)
+    )
+    """,
+]
+
+
+# ---------------------------------------------------------
+# 셀 좌표
+# ---------------------------------------------------------
+def lonlat_to_tile(lat: float, lon: float, z: int) -> Tuple[int, int]:
+    n = 1 << z
+    lat = max(-MAX_LAT, min(MAX_LAT, lat))
+    r = math.radians(lat)
+    x = int((lon + 180.0) / 360.0 * n)
+    y = int((1.0 - math.log(math.tan(r) + 1.0 / math.cos(r)) / math.pi) / 2.0 * n)
+    return min(max(x, 0), n - 1), min(max(y, 0), n - 1)
+
+
+def tile_center(x: int, y: int, z: int) -> Tuple[float, float]:
+    n = 1 << z
+    lon = (x + 0.5) / n * 360.0 - 180.0
+    lat = math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * (y + 0.5) / n))))
+    return lat, lon
+
+
+def tile_size_m(z: int, lat: float) -> float:
+    return EARTH_M * math.cos(math.radians(lat)) / (1 << z)
+
+
+def _spread(v: int) -> int:
+    v &= 0xFFFFFFFF
+    v = (v | (v << 16)) & 0x0000FFFF0000FFFF
+    v = (v | (v << 8)) & 0x00FF00FF00FF00FF
+    v = (v | (v << 4)) & 0x0F0F0F0F0F0F0F0F
+    v = (v | (v << 2)) & 0x3333333333333333
+    v = (v | (v << 1)) & 0x5555555555555555
+    return v
+
+
+def _compact(v: int) -> int:
+    v &= 0x5555555555555555
+    v = (v | (v >> 1)) & 0x3333333333333333
+    v = (v | (v >> 2)) & 0x0F0F0F0F0F0F0F0F
+    v = (v | (v >> 4)) & 0x00FF00FF00FF00FF
+    v = (v | (v >> 8)) & 0x0000FFFF0000FFFF
+    v = (v | (v >> 16)) & 0x00000000FFFFFFFF
+    return v
+
+
+def cell_id(lat: Optional[float], lon: Optional[float]) -> Optional[int]:
+    """ZMAX 줌 타일의 Morton 코드 (좌표가 없으면 None)"""
+    if lat is None or lon is None or not (math.isfinite(lat) and math.isfinite(lon)):
+        return None
+    x, y = lonlat_to_tile(lat, lon, ZMAX)
+    return _spread(x) | (_spread(y) << 1)
+
+
+def cell_at(cell: int, z: int) -> Tuple[int, int]:
+    c = cell >> (2 * (ZMAX - z))
+    return _compact(c), _compact(c >> 1)
+
+
+def pick_zoom(step_m: float, lat: float) -> int:
+    """요청한 셀 크기(m)에 가장 가까운 유지 중인 줌"""
+    return min(ZOOMS, key=lambda z: abs(math.log(tile_size_m(z, lat) / step_m)))
+
+
+# ---------------------------------------------------------
+# 병합 가능한 셀 통계
+# ---------------------------------------------------------
+def _hist_bin(w: float) -> int:
+    if w < HIST_LO:
+        return 0
+    if w >= HIST_HI:
+        return HIST_BINS - 1
+    return 1 + int(w - HIST_LO)
+
+
+def _bin_range(i: int, lo: float, hi: float) -> Tuple[float, float]:
+    if i == 0:
+        return lo, HIST_LO
+    if i == HIST_BINS - 1:
+        return HIST_HI, hi
+    return HIST_LO + i - 1, HIST_LO + i
+
+
+class CellStats:
+    __slots__ = ("n", "wear_n", "wear_sum", "wear_min", "wear_max", "hist", "last_ts")
+
+    def __init__(self):
+        self.n = 0
+        self.wear_n = 0
+        self.wear_sum = 0.0
+        self.wear_min: Optional[float] = None
+        self.wear_max: Optional[float] = None
+        self.hist = [0] * HIST_BINS
+        self.last_ts: Optional[datetime] = None
+
+    def add(self, wear: Optional[float], ts: Optional[datetime]):
+        self.n += 1
+        if wear is not None:
+            self.wear_n += 1
+            self.wear_sum += wear
+            self.wear_min = wear if self.wear_min is None else min(self.wear_min, wear)
+            self.wear_max = wear if self.wear_max is None else max(self.wear_max, wear)
+            self.hist[_hist_bin(wear)] += 1
+        if ts is not None and (self.last_ts is None or ts > self.last_ts):
+            self.last_ts = ts
+
+    def merge(self, r: Dict[str, Any]):
+        self.n += int(r["n"])
+        self.wear_n += int(r["wear_n"])
+        self.wear_sum += float(r["wear_sum"] or 0.0)
+        for attr, pick in (("wear_min", min), ("wear_max", max)):
+            v, cur = r[attr], getattr(self, attr)
+            if v is not None:
+                setattr(self, attr, v if cur is None else pick(cur, v))
+        for i, c in enumerate(r["hist"] or []):
+            self.hist[i] += int(c or 0)
+        if r["last_ts"] is not None and (self.last_ts is None or r["last_ts"] > self.last_ts):
+            self.last_ts = r["last_ts"]
+
+    @property
+    def wear_avg(self) -> Optional[float]:
+        return self.wear_sum / self.wear_n if self.wear_n else None
+
+    def quantile(self, q: float) -> Optional[float]:
+        """PERCENTILE_CONT 근사: 구간 안의 값은 균등하게 놓였다고 보고 보간, [min, max] 로 보정"""
+        if not self.wear_n:
+            return None
+        lo, hi = self.wear_min, self.wear_max
+        if self.wear_n == 1 or lo == hi:
+            return lo
+
+        def value_at(pos: int) -> float:
+            seen = 0
+            for i, c in enumerate(self.hist):
+                if c and pos < seen + c:
+                    a, b = _bin_range(i, lo, hi)
+                    return a + (pos - seen + 0.5) / c * (b - a)
+                seen += c
+            return hi
+
+        h = q * (self.wear_n - 1)
+        k = int(math.floor(h))
+        v = value_at(k)
+        if h > k:
+            v += (h - k) * (value_at(k + 1) - v)
+        return min(max(v, lo), hi)
+
+
+# ---------------------------------------------------------
+# 적재 시 누적 (WriteBehindBuffer flush hook)
+# ---------------------------------------------------------
+_UPSERT = f"""
+    INSERT INTO {TABLE} AS t (z, x, y, bucket, n, wear_n, wear_sum, wear_min, wear_max, hist, last_ts)
+    VALUES (:z, :x, :y, :bucket, :n, :wear_n, :wear_sum, :wear_min, :wear_max, CAST(:hist AS INTEGER[]), :last_ts)
+    ON CONFLICT (z, x, y, bucket) DO UPDATE SET
+      n        = t.n + EXCLUDED.n,
+      wear_n   = t.wear_n + EXCLUDED.wear_n,
+      wear_sum = t.wear_sum + EXCLUDED.wear_sum,
+      wear_min = LEAST(t.wear_min, EXCLUDED.wear_min),
+      wear_max = GREATEST(t.wear_max, EXCLUDED.wear_max),
+      hist     = lw_hist_add(t.hist, EXCLUDED.hist),
+      last_ts  = GREATEST(t.last_ts, EXCLUDED.last_ts)
+"""
+
+
+def apply_rows(conn: Connection, rows: Iterable[Dict[str, Any]]):
+    acc: Dict[Tuple[int, int, int, datetime], CellStats] = {}
+    now = datetime.now(timezone.utc)
+    for r in rows:
+        cell = r.get("geo_cell")     # 적재 시 cell_id() 로 채운 값 (원본 행과 같은 기준)
+        if cell is None:
+            continue
+        bucket = floor_hour(r.get("created_at") or now)
+        wear, ts = wear_of(r), r.get("timestamp")
+        if ts is not None and ts.tzinfo is not None:   # "timestamp" 컬럼은 naive (UTC 로 맞춤)
+            ts = ts.astimezone(timezone.utc).replace(tzinfo=None)
+        for z in ZOOMS:
+            x, y = cell_at(cell, z)
+            st = acc.get((z, x, y, bucket))
+            if st is None:
+                st = acc[(z, x, y, bucket)] = CellStats()
+            st.add(wear, ts)
+    if not acc:
+        return
+    conn.execute(text(_UPSERT), [
+        {"z": z, "x": x, "y": y, "bucket": b, "n": s.n, "wear_n": s.wear_n, "wear_sum": s.wear_sum,
+         "wear_min": s.wear_min, "wear_max": s.wear_max, "hist": s.hist, "last_ts": s.last_ts}
+        for (z, x, y, b), s in sorted(acc.items())
+    ])
+
+
+def backfill_cells(conn: Connection, batch: int = 5000):
+    """geo_cell 이 비어 있는 예전 행 채우기"""
+    last_id = 0
+    while True:
+        rows = conn.execute(text("""
+            SELECT id, gps_lat, gps_lon FROM lane_wear_results
+            WHERE id > :last AND geo_cell IS NULL AND gps_lat IS NOT NULL AND gps_lon IS NOT NULL
+            ORDER BY id LIMIT :n
+        """), {"last": last_id, "n": batch}).mappings().all()
+        if not rows:
+            return
+        conn.execute(text("UPDATE lane_wear_results SET geo_cell = :c WHERE id = :id"),
+                     [{"id": r["id"], "c": cell_id(r["gps_lat"], r["gps_lon"])} for r in rows])
+        last_id = rows[-1]["id"]
+
+
+def rebuild(conn: Connection, batch: int = 5000):
+    """원본 테이블에서 셀 집계 전체 재계산 (backfill)"""
+    conn.execute(text(f"LOCK TABLE {TABLE} IN EXCLUSIVE MODE"))
+    conn.execute(text(f"TRUNCATE {TABLE}"))
+    last_id = 0
+    while True:
+        rows = conn.execute(text("""
+            SELECT id, created_at, overall, "timestamp", geo_cell FROM lane_wear_results
+            WHERE id > :last AND geo_cell IS NOT NULL AND created_at IS NOT NULL
+            ORDER BY id LIMIT :n
+        """), {"last": last_id, "n": batch}).mappings().all()
+        if not rows:
+            return
+        apply_rows(conn, [dict(r) for r in rows])
+        last_id = rows[-1]["id"]
+
+
+# ---------------------------------------------------------
+# 조회
+# ---------------------------------------------------------
+def bbox_cells(conn: Connection, z: int, min_lat: float, min_lon: float, max_lat: float, max_lon: float,
+               lo: datetime) -> Dict[Tuple[int, int], CellStats]:
+    """[lo, 현재) 구간에서 bbox 에 걸친 z 줌 셀별 통계"""
+    x0, y0 = lonlat_to_tile(max_lat, min_lon, z)     # 타일 y 는 북쪽이 작다
+    x1, y1 = lonlat_to_tile(min_lat, max_lon, z)
+    return range_cells(conn, z, x0, x1, y0, y1, lo)
+
+
+def range_cells(conn: Connection, z: int, x0: int, x1: int, y0: int, y1: int,
+                lo: datetime) -> Dict[Tuple[int, int], CellStats]:
+    """z 줌 셀 [x0, x1] x [y0, y1] 의 통계. 정시 이후는 집계, 앞쪽 자투리 시간만 원본 행"""
+    full_lo = ceil_hour(lo)
+    cells: Dict[Tuple[int, int], CellStats] = {}
+
+    rows = conn.execute(text(f"""
+        SELECT x, y, SUM(n) AS n, SUM(wear_n) AS wear_n, SUM(wear_sum) AS wear_sum,
+               MIN(wear_min) AS wear_min, MAX(wear_max) AS wear_max,
+               lw_hist_sum(hist) AS hist, MAX(last_ts) AS last_ts
+        FROM {TABLE}
+        WHERE z = :z AND x BETWEEN :x0 AND :x1 AND y BETWEEN :y0 AND :y1 AND bucket >= :flo
+        GROUP BY x, y
+    """), {"z": z, "x0": x0, "x1": x1, "y0": y0, "y1": y1, "flo": full_lo}).mappings().all()
+    for r in rows:
+        st = cells[(r["x"], r["y"])] = CellStats()
+        st.merge(r)
+
+    if lo < full_lo:
+        # Morton 코드는 x, y 각각에 단조이므로 사각형 범위는 두 모서리 셀 사이에 든다
+        clo, _ = tile_cell_range(z, x0, y0)
+        _, chi = tile_cell_range(z, x1, y1)
+        raw = conn.execute(text("""
+            SELECT geo_cell, overall, "timestamp" FROM lane_wear_results
+            WHERE created_at >= :lo AND created_at < :flo AND geo_cell >= :clo AND geo_cell < :chi
+        """), {"lo": lo, "flo": full_lo, "clo": clo, "chi": chi}).mappings().all()
+        for r in raw:
+            x, y = cell_at(r["geo_cell"], z)
+            if x0 <= x <= x1 and y0 <= y <= y1:
+                st = cells.get((x, y))
+                if st is None:
+                    st = cells[(x, y)] = CellStats()
+                st.add(wear_of(r), r["timestamp"])
+    return cells
+
+
+def tile_cell_range(z: int, x: int, y: int) -> Tuple[int, int]:
+    """타일 (z, x, y) 안에 드는 geo_cell 범위 [lo, hi)"""
+    q = _spread(x) | (_spread(y) << 1)
+    shift = 2 * (ZMAX - z)
+    return q << shift, (q + 1) << shift
@@ -0,0 +1,164 @@
+# image_store.py
+# 이미지 저장 서브시스템: 요청 스레드에서 한 번 인코딩한 JPEG 바이트를 받아
+# 백그라운드 풀에서 temp 파일 + rename 으로 원자적으로 기록한다.
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Callable, List, Optional, Sequence, Tuple
+
+from bounded_executor import BoundedExecutor
+
+PENDING = "pending"
+DONE = "done"
+FAILED = "failed"
+
+
+def write_atomic(path: str, data: bytes, fsync: bool = False):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(tmp, "wb") as f:
+            f.write(data)
+            if fsync:
+                f.flush()
+                os.fsync(f.fileno())
+        os.replace(tmp, path)
+    except BaseException:
+        try: os.remove(tmp)
+        except OSError: pass
+        raise
+
+
+class ImageWriter:
+    """경로별 상태(pending/done/failed)를 메모리에 유지해 조회 측이 파일 존재를 추측하지 않게 한다"""
+
+    def __init__(self, workers: int = 2, max_queue: int = 256, fsync: bool = False, keep_status: int = 10000):
+        self.fsync = fsync
+        self.keep_status = keep_status
+        self._pool = BoundedExecutor(workers, max_queue, name="image-writer")
+        self._status: "OrderedDict[str, str]" = OrderedDict()
+        self._errors = {}
+        self._lock = threading.Lock()
+        self.timing_hooks: List[Callable[[float], None]] = []   # 파일 하나 기록 시간(초)
+
+    def depth(self) -> int:
+        return self._pool.depth()
+
+    def submit(self, path: str, data: bytes) -> Future:
+        return self.submit_many([(path, data)])
+
+    def submit_many(self, files: Sequence[Tuple[str, bytes]]) -> Future:
+        """여러 파일을 한 작업으로 기록 — 대기열이 가득 차면(QueueFullError) 아무것도 기록하지 않는다"""
+        with self._lock:
+            for path, _ in files:
+                self._set(path, PENDING)
+        try:
+            fut = self._pool.submit(self._write_many, list(files))
+        except BaseException:
+            with self._lock:
+                for path, _ in files:
+                    self._status.pop(path, None)
+            raise
+        for path, _ in files:
+            fut.add_done_callback(lambda f, p=path: self._done(p, f))
+        return fut
+
+    def _write_many(self, files: List[Tuple[str, bytes]]):
+        for path, data in files:
+            t = time.perf_counter()
+            write_atomic(path, data, self.fsync)
+            dt = time.perf_counter() - t
+            for hook in self.timing_hooks:
+                try: hook(dt)
+                except Exception: pass
+
+    def status(self, path: str) -> Optional[str]:
+        """이 프로세스가 기록한 적 없는 경로는 None"""
+        return self._status.get(path)
+
+    def error(self, path: str) -> Optional[str]:
+        return self._errors.get(path)
+
+    def _done(self, path: str, fut: Future):
+        with self._lock:
+            exc = fut.exception()
+            if exc is None:
+                self._errors.pop(path, None)
+                self._set(path, DONE)
+            else:
+                self._errors[path] = str(exc)
+                self._set(path, FAILED)
+
+    def _set(self, path: str, state: str):
+        self._status[path] = state
+        self._status.move_to_end(path)
+        while len(self._status) > self.keep_status:
+            old, _ = self._status.popitem(last=False)
+            self._errors.pop(old, None)
+
+    def shutdown(self, wait: bool = True):
+        self._pool.shutdown(wait=wait)
+
+
+class ShardedImageStore:
+    """
+    내용 주소(sha256) 기반 저장소: {root}/ab/cd/<sha256>.jpg
+    같은 바이트는 같은 키가 되므로 재전송된 업로드는 다시 기록하지 않는다.
+    키가 없는 예전 행은 legacy_dirs 의 {id}.jpg 로 해석한다.
+    """
+
+    def __init__(self, root: str, writer: ImageWriter, legacy_dirs: dict, depth: int = 2, width: int = 2):
+        self.root = root
+        self.writer = writer
+        self.legacy_dirs = legacy_dirs
+        self.depth = max(0, int(depth))
+        self.width = max(1, int(width))
+
+    @staticmethod
+    def key_for(data: bytes) -> str:
+        return hashlib.sha256(data).hexdigest()
+
+    def path_for(self, key: str) -> str:
+        shards = [key[i * self.width:(i + 1) * self.width] for i in range(self.depth)]
+        return os.path.join(self.root, *shards, f"{key}.jpg")
+
+    def legacy_path(self, kind: str, rid: int) -> str:
+        return os.path.join(self.legacy_dirs[kind], f"{rid}.jpg")
+
+    def resolve(self, kind: str, rid: int, key: Optional[str]) -> str:
+        return self.path_for(key) if key else self.legacy_path(kind, rid)
+
+    def put(self, data: bytes, key: Optional[str] = None) -> str:
+        """바이트를 저장(이미 있거나 기록 중이면 건너뜀)하고 키 반환"""
+        key = key or self.key_for(data)
+        self.put_many([data], [key])
+        return key
+
+    def put_many(self, datas: Sequence[bytes], keys: Optional[Sequence[str]] = None) -> List[str]:
+        """
+        여러 바이트를 한 번에 저장하고 키 목록 반환. 기록할 것이 있으면 한 작업으로 넣으므로
+        QueueFullError 면 하나도 기록되지 않는다 (원본만 남고 썸네일이 빠지는 일이 없음).
+        """
+        keys = list(keys) if keys is not None else [self.key_for(d) for d in datas]
+        todo, seen = [], set()
+        for key, data in zip(keys, datas):
+            path = self.path_for(key)
+            if path in seen or self.writer.status(path) in (PENDING, DONE) or os.path.exists(path):
+                continue
+            seen.add(path)
+            todo.append((path, data))
+        if todo:
+            self.writer.submit_many(todo)
+        return keys
+
+    def is_ready(self, path: str) -> bool:
+        """
+        이 프로세스가 기록한 경로는 메모리 상태로, 아니면(다른 워커가 기록했거나 상태가 밀려남) 파일 존재로 판단한다.
+        """
+        state = self.writer.status(path)
+        if state is None:
+            return os.path.exists(path)
+        return state == DONE
@@ -0,0 +1,85 @@
+# inference_batcher.py
+# 동시 요청에서 들어온 프레임을 짧은 시간 모아 한 번의 배치 추론으로 처리한다.
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Hashable, List, Sequence
+
+import numpy as np
+
+# runner(frames) -> 프레임별 결과 리스트 (입력 순서 유지)
+BatchRunner = Callable[[List[np.ndarray]], Sequence[Any]]
+
+
+class MicroBatcher:
+    """
+    요청 스레드는 submit() 으로 프레임을 넣고 Future 를 받는다.
+    워커 스레드는 첫 프레임 도착 후 max_wait_ms 동안(또는 max_batch 가 찰 때까지) 모은 뒤
+    같은 key(모델/파라미터) 끼리 묶어 runner 를 한 번씩 호출한다.
+    """
+
+    def __init__(self, max_batch: int = 8, max_wait_ms: float = 5.0, name: str = "infer-batcher"):
+        self.max_batch = max(1, int(max_batch))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000.0
+        self.name = name
+        self._q: "queue.Queue[tuple[Hashable, BatchRunner, np.ndarray, Future]]" = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    # ---------------------------------------------------------
+    def submit(self, key: Hashable, runner: BatchRunner, frame: np.ndarray) -> Future:
+        fut: Future = Future()
+        self._ensure_thread()
+        self._q.put((key, runner, frame, fut))
+        return fut
+
+    def qsize(self) -> int:
+        return self._q.qsize()
+
+    def _ensure_thread(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._loop, name=self.name, daemon=True)
+                self._thread.start()
+
+    # ---------------------------------------------------------
+    def _collect(self) -> list:
+        items = [self._q.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(items) < self.max_batch:
+            remain = deadline - time.monotonic()
+            try:
+                items.append(self._q.get(timeout=remain) if remain > 0 else self._q.get_nowait())
+            except queue.Empty:
+                break
+        return items
+
+    def _loop(self):
+        while True:
+            items = self._collect()
+            groups: Dict[Hashable, list] = {}
+            for it in items:
+                groups.setdefault(it[0], []).append(it)
+            for group in groups.values():
+                self._run_group(group)
+
+    @staticmethod
+    def _run_group(group: list):
+        runner = group[0][1]
+        live = [g for g in group if g[3].set_running_or_notify_cancel()]
+        if not live:
+            return
+        frames = [g[2] for g in live]
+        futs = [g[3] for g in live]
+        try:
+            outs = runner(frames)
+            if len(outs) != len(futs):
+                raise RuntimeError(f"batch runner returned {len(outs)} results for {len(futs)} frames")
+        except BaseException as e:
+            for f in futs: f.set_exception(e)
+            return
+        for f, o in zip(futs, outs):
+            f.set_result(o)
@@ -0,0 +1,300 @@
+# ingest_buffer.py
+# lane_wear_results write-behind 버퍼.
+# - id 는 시퀀스에서 블록 단위로 미리 받아 핸들러가 즉시 db_id 를 돌려줄 수 있게 한다.
+# - 행은 먼저 로컬 spool(jsonl) 에 기록(fsync)한 뒤 메모리 버퍼에 쌓이고,
+#   행 수/시간 조건으로 multi-row INSERT 한 번에 flush 된다.
+# - 프로세스가 죽어도 spool 에 남은 행은 다음 기동 시 재적재된다 (id 충돌은 무시).
+# - spool 파일은 프로세스(워커)마다 따로 쓰고(spool-<owner>.*), 소유 프로세스는 살아 있는 동안 spool-<owner>.lock 을
+#   flock 으로 잡고 있다. 기동 시에는 잠금이 풀린(소유 프로세스가 죽은) 파일만 가져와 재적재한다.
+import fcntl
+import glob
+import json
+import os
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional
+
+from sqlalchemy import DateTime, Table, text
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.engine import Connection, Engine
+
+from bounded_executor import QueueFullError
+
+Row = Dict[str, Any]
+FlushHook = Callable[[Connection, List[Row]], None]   # flush 트랜잭션 안에서 호출
+CommitHook = Callable[[List[Row]], None]              # commit 이후 호출
+TimingHook = Callable[[int, float], None]             # (행 수, INSERT~commit 초)
+
+
+class IdBlockAllocator:
+    """시퀀스에서 block_size 개씩 nextval 을 받아 두고 하나씩 나눠준다"""
+
+    def __init__(self, engine: Engine, table: str, column: str = "id", block_size: int = 100):
+        self.engine = engine
+        self.table = table
+        self.column = column
+        self.block_size = max(1, int(block_size))
+        self._ids: List[int] = []
+        self._lock = threading.Lock()
+
+    def next_id(self) -> int:
+        with self._lock:
+            if not self._ids:
+                with self.engine.begin() as conn:
+                    rows = conn.execute(
+                        text("SELECT nextval(pg_get_serial_sequence(:t, :c)) FROM generate_series(1, :n)"),
+                        {"t": self.table, "c": self.column, "n": self.block_size},
+                    ).scalars().all()
+                self._ids = sorted(int(r) for r in rows)[::-1]
+            return self._ids.pop()
+
+
+class WriteBehindBuffer:
+    def __init__(self, engine: Engine, table: Table, spool_dir: str,
+                 max_rows: int = 200, max_delay_ms: float = 200.0, id_block: int = 100,
+                 max_pending: int = 10000, fsync: bool = True):
+        self.engine = engine
+        self.table = table
+        self.spool_dir = spool_dir
+        self.max_rows = max(1, int(max_rows))
+        self.max_delay = max(0.0, float(max_delay_ms)) / 1000.0
+        self.max_pending = int(max_pending)
+        self.fsync = fsync
+        self.ids = IdBlockAllocator(engine, table.name, block_size=id_block)
+        self.flush_hooks: List[FlushHook] = []
+        self.commit_hooks: List[CommitHook] = []
+        self.timing_hooks: List[TimingHook] = []
+
+        self._dt_cols = {c.name for c in table.columns if isinstance(c.type, DateTime)}
+        self._pending: List[Row] = []
+        self._by_id: Dict[int, Row] = {}         # 아직 DB 에 없는 행 (id 조회용)
+        self._retry: List[List[Row]] = []       # flush 실패 배치 (spool 파일과 함께 보존)
+        self._retry_files: List[str] = []
+        self._cond = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._spool_f = None
+        self._spool_seq = 0
+        self.owner = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self._lock_f = None
+        self._thread: Optional[threading.Thread] = None
+        self._stopping = False
+        self.last_error: Optional[str] = None
+
+    # ---------------------------------------------------------
+    # spool 직렬화
+    # ---------------------------------------------------------
+    def _dump(self, row: Row) -> str:
+        return json.dumps({k: (v.isoformat() if isinstance(v, datetime) else v) for k, v in row.items()},
+                          ensure_ascii=False, default=str)
+
+    def _load(self, line: str) -> Row:
+        row = json.loads(line)
+        for k in self._dt_cols:
+            if isinstance(row.get(k), str):
+                row[k] = datetime.fromisoformat(row[k])
+        return row
+
+    def _spool_path(self, owner: Optional[str] = None) -> str:
+        return os.path.join(self.spool_dir, f"spool-{owner or self.owner}.jsonl")
+
+    def _lock_path(self, owner: Optional[str] = None) -> str:
+        return os.path.join(self.spool_dir, f"spool-{owner or self.owner}.lock")
+
+    def _next_flushing_path(self) -> str:
+        self._spool_seq += 1
+        return os.path.join(self.spool_dir, f"spool-{self.owner}.{int(time.time() * 1000)}.{self._spool_seq}.flushing")
+
+    def _open_spool(self):
+        self._spool_f = open(self._spool_path(), "a", encoding="utf-8")
+
+    def _rotate_spool(self) -> str:
+        """현재 spool 을 flushing 파일로 넘기고 새 spool 을 연다 (lock 안에서 호출)"""
+        self._spool_f.close()
+        dst = self._next_flushing_path()
+        os.replace(self._spool_path(), dst)
+        self._open_spool()
+        return dst
+
+    # ---------------------------------------------------------
+    # 수명 주기
+    # ---------------------------------------------------------
+    def start(self):
+        os.makedirs(self.spool_dir, exist_ok=True)
+        self._lock_f = open(self._lock_path(), "a")
+        fcntl.flock(self._lock_f, fcntl.LOCK_EX)
+        self._replay_spool()
+        self._open_spool()
+        self._stopping = False
+        self._thread = threading.Thread(target=self._loop, name="ingest-flush", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 10.0):
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        if self._spool_f is not None:
+            self._spool_f.close()
+            self._spool_f = None
+            if os.path.getsize(self._spool_path()) == 0:
+                os.remove(self._spool_path())
+        if self._lock_f is not None:
+            # 적재 못 한 파일이 남았으면 잠금 파일을 두어 다음 기동 프로세스가 가져가게 한다
+            if not os.path.exists(self._spool_path()) and not self._flushing_files(self.owner):
+                os.remove(self._lock_path())
+            self._lock_f.close()
+            self._lock_f = None
+
+    def _flushing_files(self, owner: str) -> List[str]:
+        return glob.glob(os.path.join(self.spool_dir, f"spool-{owner}.*.flushing"))
+
+    def _adopt_if_unlocked(self, lock_path: str, paths: Callable[[], List[str]]):
+        """lock_path 를 잠글 수 있으면(소유 프로세스가 없으면) paths() 를 내 flushing 파일로 옮긴다"""
+        try:
+            f = open(lock_path, "a")
+        except FileNotFoundError:
+            return
+        with f:
+            try:
+                fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return          # 소유 프로세스가 살아 있음 (또는 다른 프로세스가 가져가는 중)
+            for path in sorted(paths()):
+                try: os.replace(path, self._next_flushing_path())
+                except FileNotFoundError: pass
+            try: os.remove(lock_path)
+            except FileNotFoundError: pass
+
+    def _adopt_orphans(self):
+        """잠금이 풀린 소유자(죽은 프로세스)의 spool 과 예전 단일 spool(spool.jsonl, spool.*.flushing)을 가져온다"""
+        for lock_path in glob.glob(self._lock_path("*")):
+            owner = os.path.basename(lock_path)[len("spool-"):-len(".lock")]
+            if owner != self.owner:
+                self._adopt_if_unlocked(lock_path, lambda o=owner: [self._spool_path(o)] + self._flushing_files(o))
+
+        def legacy() -> List[str]:
+            return (glob.glob(os.path.join(self.spool_dir, "spool.jsonl"))
+                    + glob.glob(os.path.join(self.spool_dir, "spool.*.flushing")))
+        if legacy():
+            self._adopt_if_unlocked(os.path.join(self.spool_dir, "spool.legacy.lock"), legacy)
+
+    def _replay_spool(self):
+        """죽은 프로세스가 남긴 spool 을 재시도 대기열로 올린다 (flush 스레드가 적재)"""
+        self._adopt_orphans()
+        for path in sorted(self._flushing_files(self.owner)):
+            with open(path, encoding="utf-8") as f:
+                rows = [self._load(l) for l in f if l.strip()]
+            if rows:
+                self._retry.append(rows)
+                self._retry_files.append(path)
+                self._by_id.update((r["id"], r) for r in rows)
+            else:
+                os.remove(path)
+
+    # ---------------------------------------------------------
+    # 적재
+    # ---------------------------------------------------------
+    def get_pending(self, rid: int) -> Optional[Row]:
+        """flush 전 행 조회 (없으면 None)"""
+        return self._by_id.get(rid)
+
+    def depth(self) -> int:
+        return len(self._pending) + sum(len(b) for b in self._retry)
+
+    def add(self, row: Row) -> int:
+        """행을 spool/버퍼에 넣고 미리 할당된 id 반환"""
+        return self.add_many([row])[0]
+
+    def add_many(self, rows: List[Row]) -> List[int]:
+        """여러 행을 spool 한 번 기록(fsync 1회)으로 넣는다. 자리가 모자라면 아무것도 넣지 않고 QueueFullError"""
+        if self.depth() + len(rows) > self.max_pending:
+            raise QueueFullError("ingest", self.depth())
+        rows = [dict(r) for r in rows]
+        now = datetime.now(timezone.utc)
+        for row in rows:
+            if row.get("id") is None:
+                row["id"] = self.ids.next_id()
+            if row.get("created_at") is None:     # 파티션 키 — spool 재적재 시에도 같은 파티션/PK 가 되도록 여기서 고정
+                row["created_at"] = now
+        lines = "".join(self._dump(row) + "\n" for row in rows)
+        with self._cond:
+            self._spool_f.write(lines)
+            self._spool_f.flush()
+            if self.fsync:
+                os.fsync(self._spool_f.fileno())
+            self._pending.extend(rows)
+            for row in rows:
+                self._by_id[row["id"]] = row
+            if len(self._pending) >= self.max_rows:
+                self._cond.notify_all()
+        return [row["id"] for row in rows]
+
+    def flush(self):
+        """대기 중인 행을 즉시 flush (종료/테스트용)"""
+        self._flush_once()
+
+    # ---------------------------------------------------------
+    # flush
+    # ---------------------------------------------------------
+    def _loop(self):
+        backoff = self.max_delay
+        while True:
+            with self._cond:
+                if not self._stopping and len(self._pending) < self.max_rows:
+                    self._cond.wait(timeout=backoff)
+                stopping = self._stopping
+            ok = self._flush_once()
+            backoff = self.max_delay if ok else min(max(backoff * 2, 0.5), 30.0)
+            if stopping and (ok or not self.depth()):
+                return
+
+    def _flush_once(self) -> bool:
+        with self._flush_lock:
+            return self._flush_locked()
+
+    def _flush_locked(self) -> bool:
+        with self._cond:
+            if self._pending:
+                self._retry.append(self._pending)
+                self._retry_files.append(self._rotate_spool())
+                self._pending = []
+            batches, files = list(self._retry), list(self._retry_files)
+        for rows, path in zip(batches, files):
+            try:
+                self._write(rows)
+            except Exception as e:
+                self.last_error = str(e)
+                return False
+            with self._cond:
+                self._retry.remove(rows)
+                self._retry_files.remove(path)
+                for r in rows: self._by_id.pop(r["id"], None)
+            try: os.remove(path)
+            except FileNotFoundError: pass
+        self.last_error = None
+        return True
+
+    def _write(self, rows: List[Row]):
+        stmt = (pg_insert(self.table)
+                .on_conflict_do_nothing(index_elements=list(self.table.primary_key.columns))
+                .returning(self.table.c.id))
+        for i in range(0, len(rows), self.max_rows):
+            chunk = rows[i:i + self.max_rows]
+            t = time.perf_counter()
+            with self.engine.begin() as conn:
+                inserted = set(conn.execute(stmt, chunk).scalars().all())
+                # 재적재로 이미 들어간 행은 후속 집계에서 제외
+                chunk = [r for r in chunk if r["id"] in inserted]
+                if not chunk:
+                    continue
+                for hook in self.flush_hooks:
+                    hook(conn, chunk)
+            for hook in self.timing_hooks:
+                try: hook(len(chunk), time.perf_counter() - t)
+                except Exception: pass
+            for hook in self.commit_hooks:
+                try: hook(chunk)
+                except Exception: pass
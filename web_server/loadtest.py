@@ -0,0 +1,441 @@
+# loadtest.py
+# See:Drive API 부하 테스트 / 벤치마크.
+#   python loadtest.py --url http://127.0.0.1:8000 --concurrency 8 --duration 20
+#   python loadtest.py --serve --temp-pg --weights ./model/tiny.pt --save-baseline loadtest_baseline.json
+#   python loadtest.py --serve --temp-pg --weights ./model/tiny.pt --baseline loadtest_baseline.json
+# 휴대폰 크기 합성 JPEG(GPS EXIF 포함)으로 업로드/블러/대시보드 엔드포인트를 엔드포인트별로 차례로 두드리고
+# p50/p95/p99(ms), RPS 를 출력한다. --baseline 과 비교해 p95 나 RPS 가 허용치 이상 나빠지면 종료 코드 1.
+# --serve 는 이 폴더의 main:app 을 uvicorn 으로 띄운다 (이미지 저장소는 임시 폴더, 레지스트리 파일은 끔).
+# --temp-pg 는 PATH(또는 --pg-bin)의 initdb/pg_ctl 로 임시 Postgres 를 만든다 (root 로는 실행 불가).
+# --make-weights 는 학습되지 않은 yolo11n 가중치를 만든다 (검출 품질과 무관한 처리량 측정용).
+import argparse
+import io
+import json
+import os
+import platform
+import re
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+import cv2
+import numpy as np
+import requests
+from PIL import Image
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# 합성 좌표 범위 (서울 도심)
+BBOX = (37.48, 126.90, 37.60, 127.10)      # min_lat, min_lon, max_lat, max_lon
+
+
+# =========================================================
+# 합성 이미지
+# =========================================================
+def _dms(deg: float):
+    d = int(deg); m = int((deg - d) * 60); s = round(((deg - d) * 60 - m) * 60, 4)
+    return (d, m, s)
+
+
+def make_jpeg(seed: int, width: int, height: int, lat: float, lon: float, taken: datetime, quality: int = 90) -> bytes:
+    """노면 비슷한 장면(아스팔트 + 차선 + 차량 박스 + 센서 노이즈) + GPS/촬영 시각 EXIF"""
+    rng = np.random.default_rng(seed)
+    y = np.linspace(0, 1, height, dtype=np.float32)[:, None]
+    sky = int(height * rng.uniform(0.3, 0.45))
+    img = np.empty((height, width, 3), np.float32)
+    img[:] = (90 + 50 * y)[..., None]                               # 아래로 갈수록 밝은 노면
+    img[:sky] = (200, 170, 140)                                     # 하늘 (BGR)
+    cx = width // 2 + int(rng.integers(-width // 10, width // 10))
+    for off in (-0.35, 0.0, 0.35):                                  # 소실점으로 모이는 차선
+        x_bottom = int(cx + off * width * 1.6)
+        cv2.line(img, (cx, sky), (x_bottom, height), (235, 235, 235), max(4, width // 200))
+    for _ in range(int(rng.integers(1, 5))):                        # 앞 차량 (번호판 자리 포함)
+        w = int(rng.integers(width // 12, width // 5)); h = int(w * 0.8)
+        x = int(rng.integers(0, width - w)); yy = int(rng.integers(sky, height - h))
+        color = tuple(int(c) for c in rng.integers(20, 230, 3))
+        cv2.rectangle(img, (x, yy), (x + w, yy + h), color, -1)
+        pw, ph = w // 3, max(8, h // 8)
+        cv2.rectangle(img, (x + (w - pw) // 2, yy + h - 2 * ph), (x + (w + pw) // 2, yy + h - ph), (250, 250, 250), -1)
+    noise = rng.normal(0, 6, (256, 256, 3)).astype(np.float32)       # 센서 노이즈 (JPEG 크기를 실제와 비슷하게)
+    img += np.tile(noise, (height // 256 + 1, width // 256 + 1, 1))[:height, :width]
+    rgb = cv2.cvtColor(np.clip(img, 0, 255).astype(np.uint8), cv2.COLOR_BGR2RGB)
+
+    exif = Image.Exif()
+    exif[0x010F] = "SeeDrive"                                       # Make
+    exif[0x0110] = "loadtest"                                       # Model
+    exif[0x0112] = 1                                                # Orientation
+    exif.get_ifd(0x8769)[0x9003] = taken.strftime("%Y:%m:%d %H:%M:%S")   # DateTimeOriginal
+    gps = exif.get_ifd(0x8825)
+    gps[1] = "N" if lat >= 0 else "S"; gps[2] = _dms(abs(lat))
+    gps[3] = "E" if lon >= 0 else "W"; gps[4] = _dms(abs(lon))
+    buf = io.BytesIO()
+    Image.fromarray(rgb).save(buf, "JPEG", quality=quality, exif=exif)
+    return buf.getvalue()
+
+
+def make_corpus(n: int, width: int, height: int, devices: int, seed: int = 0) -> List[Dict[str, Any]]:
+    rng = np.random.default_rng(seed)
+    now = datetime.now(timezone.utc)
+    corpus = []
+    for i in range(n):
+        lat = float(rng.uniform(BBOX[0], BBOX[2])); lon = float(rng.uniform(BBOX[1], BBOX[3]))
+        taken = now - timedelta(minutes=int(rng.integers(0, 600)))
+        corpus.append({"name": f"synthetic_{i:03d}.jpg", "lat": lat, "lon": lon, "taken": taken,
+                       "device_id": f"loadtest-{i % devices:03d}",
+                       "jpeg": make_jpeg(seed + i, width, height, lat, lon, taken)})
+    return corpus
+
+
+def unique_jpeg(jpeg: bytes) -> bytes:
+    """SOI 뒤에 COM 세그먼트를 넣어 픽셀은 같고 파일 해시만 다른 JPEG (서버 재전송 중복 확인을 피하기 위해)"""
+    payload = uuid.uuid4().hex.encode()
+    return jpeg[:2] + b"\xff\xfe" + (len(payload) + 2).to_bytes(2, "big") + payload + jpeg[2:]
+
+
+# =========================================================
+# 엔드포인트
+# =========================================================
+def _post_infer(s: requests.Session, base: str, item: Dict[str, Any], args) -> requests.Response:
+    # 업로드 시각을 현재로 두어 대시보드 창(window_h)에 들어가게 한다
+    data = {"gps_lat": item["lat"], "gps_lon": item["lon"], "device_id": item["device_id"],
+            "timestamp": datetime.now(timezone.utc).isoformat()}
+    jpeg = item["jpeg"] if args.resend else unique_jpeg(item["jpeg"])
+    return s.post(f"{base}/lane_wear_infer", params={"max_size": args.max_size},
+                  files={"file": (item["name"], jpeg, "image/jpeg")}, data=data, timeout=args.timeout)
+
+
+def _post_blur(s: requests.Session, base: str, item: Dict[str, Any], args) -> requests.Response:
+    return s.post(f"{base}/blur", params={"max_size": args.max_size},
+                  files={"file": (item["name"], item["jpeg"], "image/jpeg")}, timeout=args.timeout)
+
+
+def _get_summary(s: requests.Session, base: str, item: Dict[str, Any], args) -> requests.Response:
+    return s.get(f"{base}/stats/summary", params={"window_h": 24}, timeout=args.timeout)
+
+
+def _get_cells(s: requests.Session, base: str, item: Dict[str, Any], args) -> requests.Response:
+    # 기기마다 다른 화면 범위 (같은 bbox 만 보내면 응답 캐시만 재게 된다)
+    lat, lon = item["lat"], item["lon"]
+    return s.get(f"{base}/geo/cells", params={"min_lat": lat - 0.02, "min_lon": lon - 0.03,
+                                              "max_lat": lat + 0.02, "max_lon": lon + 0.03,
+                                              "step_m": 100, "window_h": 24}, timeout=args.timeout)
+
+
+def _get_rank(s: requests.Session, base: str, item: Dict[str, Any], args) -> requests.Response:
+    return s.get(f"{base}/candidates/rank", params={"window_h": 168, "limit": 20}, timeout=args.timeout)
+
+
+# 쓰기 엔드포인트를 먼저 돌려 읽기 엔드포인트가 빈 DB 를 재지 않게 한다
+ENDPOINTS: Dict[str, Callable[..., requests.Response]] = {
+    "/lane_wear_infer": _post_infer,
+    "/blur": _post_blur,
+    "/stats/summary": _get_summary,
+    "/geo/cells": _get_cells,
+    "/candidates/rank": _get_rank,
+}
+WRITE_ENDPOINTS = {"/lane_wear_infer"}
+
+
+# =========================================================
+# 부하 발생
+# =========================================================
+def run_phase(base: str, names: List[str], corpus: List[Dict[str, Any]], args,
+              duration: float, max_requests: int = 0) -> Dict[str, Dict[str, Any]]:
+    """concurrency 개 스레드가 names 를 번갈아 보낸다. duration 초 또는 max_requests 개가 끝나면 멈춘다"""
+    lock = threading.Lock()
+    counter = iter(range(sys.maxsize))
+    lat: Dict[str, List[float]] = {n: [] for n in names}
+    errors: Dict[str, Dict[str, int]] = {n: {} for n in names}
+    deadline = time.perf_counter() + duration if duration > 0 else float("inf")
+
+    def worker():
+        with requests.Session() as s:
+            while time.perf_counter() < deadline:
+                with lock:
+                    i = next(counter)
+                if max_requests and i >= max_requests:
+                    return
+                name = names[i % len(names)]
+                t = time.perf_counter()
+                try:
+                    r = ENDPOINTS[name](s, base, corpus[i % len(corpus)], args)
+                    err = None if r.status_code < 400 else str(r.status_code)
+                except requests.RequestException as e:
+                    err = type(e).__name__
+                dt = time.perf_counter() - t
+                with lock:
+                    if err is None:
+                        lat[name].append(dt)
+                    else:
+                        errors[name][err] = errors[name].get(err, 0) + 1
+
+    t0 = time.perf_counter()
+    threads = [threading.Thread(target=worker, daemon=True) for _ in range(args.concurrency)]
+    for th in threads: th.start()
+    for th in threads: th.join()
+    elapsed = time.perf_counter() - t0
+    return {n: summarize(lat[n], errors[n], elapsed) for n in names}
+
+
+def summarize(lat_s: List[float], errors: Dict[str, int], elapsed: float) -> Dict[str, Any]:
+    ms = np.asarray(lat_s, dtype=np.float64) * 1000.0
+    out: Dict[str, Any] = {"n": int(ms.size), "errors": sum(errors.values()), "error_codes": errors,
+                           "rps": round(ms.size / elapsed, 2) if elapsed > 0 else 0.0}
+    if ms.size:
+        p50, p95, p99 = np.percentile(ms, [50, 95, 99])
+        out.update(p50_ms=round(float(p50), 1), p95_ms=round(float(p95), 1), p99_ms=round(float(p99), 1),
+                   mean_ms=round(float(ms.mean()), 1))
+    return out
+
+
+def stage_means(base: str) -> Dict[str, float]:
+    """/metrics 의 단계별 평균(ms) (서버 시작 이후 누적)"""
+    try:
+        text = requests.get(f"{base}/metrics", timeout=10).text
+    except requests.RequestException:
+        return {}
+    sums, counts = {}, {}
+    for m in re.finditer(r'^seedrive_stage_seconds_(sum|count)\{stage="([^"]+)"\} (\S+)$', text, re.M):
+        (sums if m.group(1) == "sum" else counts)[m.group(2)] = float(m.group(3))
+    return {k: round(sums[k] / counts[k] * 1000.0, 2) for k in counts if counts[k] and k in sums}
+
+
+# =========================================================
+# 서버 / DB 기동
+# =========================================================
+@contextmanager
+def temp_postgres(pg_bin: Optional[str]) -> Iterator[str]:
+    """initdb → pg_ctl start (Unix 소켓만, fsync 끔) → DB_URL. 끝나면 지운다"""
+    def tool(name):
+        return os.path.join(pg_bin, name) if pg_bin else (shutil.which(name) or name)
+    root = tempfile.mkdtemp(prefix="seedrive-pg-")
+    data = os.path.join(root, "data")
+    try:
+        subprocess.run([tool("initdb"), "-D", data, "-U", "postgres", "-A", "trust", "-N"],
+                       check=True, stdout=subprocess.DEVNULL)
+        subprocess.run([tool("pg_ctl"), "-D", data, "-l", os.path.join(root, "pg.log"), "-w",
+                        "-o", f"-k {root} -c listen_addresses='' -F", "start"], check=True, stdout=subprocess.DEVNULL)
+        try:
+            yield f"postgresql://postgres@/postgres?host={root}"
+        finally:
+            subprocess.run([tool("pg_ctl"), "-D", data, "-m", "fast", "-w", "stop"], stdout=subprocess.DEVNULL)
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+@contextmanager
+def serve_app(args, db_url: Optional[str]) -> Iterator[str]:
+    """이 폴더의 main:app 을 띄우고 /health/ready 가 200 이 될 때까지 기다린다"""
+    port = args.port or _free_port()
+    work = tempfile.mkdtemp(prefix="seedrive-loadtest-")
+    env = dict(os.environ, IMG_STORE_DIR=os.path.join(work, "img"), MODEL_REGISTRY_FILE="")
+    if db_url:
+        env["DB_URL"] = db_url
+    if args.weights:
+        env["YOLO_MODEL"] = env["YOLO_LP_MODEL"] = env["YOLO_VEHICLE_MODEL"] = os.path.abspath(args.weights)
+    if args.workers > 1:            # 워커 전체 지표를 합치기 위해
+        env["PROMETHEUS_MULTIPROC_DIR"] = os.path.join(work, "prom")
+        os.makedirs(env["PROMETHEUS_MULTIPROC_DIR"])
+    for kv in args.env:
+        k, _, v = kv.partition("=")
+        env[k] = v
+    log_path = os.path.join(work, "server.log")
+    base = f"http://127.0.0.1:{port}"
+    with open(log_path, "wb") as log:
+        proc = subprocess.Popen([sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1",
+                                 "--port", str(port), "--workers", str(args.workers)],
+                                cwd=HERE, env=env, stdout=log, stderr=subprocess.STDOUT)
+        try:
+            t0 = time.time()
+            while True:
+                if proc.poll() is not None:
+                    raise RuntimeError(f"server exited ({proc.returncode}):\n{_tail(log_path)}")
+                if time.time() - t0 > args.ready_timeout:
+                    raise RuntimeError(f"server not ready after {args.ready_timeout}s:\n{_tail(log_path)}")
+                try:
+                    if requests.get(f"{base}/health/ready", timeout=2).status_code == 200:
+                        break
+                except requests.RequestException:
+                    pass
+                time.sleep(0.5)
+            print(f"server ready in {time.time() - t0:.1f}s ({base}, log {log_path})")
+            yield base
+        finally:
+            proc.terminate()
+            try: proc.wait(30)
+            except subprocess.TimeoutExpired: proc.kill()
+            shutil.rmtree(work, ignore_errors=True)
+
+
+def _tail(path: str, n: int = 30) -> str:
+    with open(path, "rb") as f:
+        return b"".join(f.readlines()[-n:]).decode("utf-8", "replace")
+
+
+def make_weights(path: str):
+    from ultralytics import YOLO
+    YOLO("yolo11n.yaml").save(path)
+    print(f"wrote untrained yolo11n weights to {path}")
+
+
+# =========================================================
+# 결과 / baseline 비교
+# =========================================================
+def _git_rev() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=HERE, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def config_of(args) -> Dict[str, Any]:
+    """baseline 과 비교 가능한지 판단하는 조건 (다르면 경고)"""
+    return {"concurrency": args.concurrency, "duration": args.duration, "requests": args.requests,
+            "image": args.image_size, "max_size": args.max_size, "images": args.images,
+            "workers": args.workers if args.serve else None, "mix": args.mix, "resend": args.resend,
+            "env": sorted(args.env)}
+
+
+def print_results(results: Dict[str, Dict[str, Any]]):
+    print(f"{'endpoint':<20} {'n':>6} {'err':>5} {'rps':>8} {'p50':>8} {'p95':>8} {'p99':>8}  (ms)")
+    for name, r in results.items():
+        print(f"{name:<20} {r['n']:>6} {r['errors']:>5} {r['rps']:>8.2f} "
+              f"{r.get('p50_ms', float('nan')):>8.1f} {r.get('p95_ms', float('nan')):>8.1f} "
+              f"{r.get('p99_ms', float('nan')):>8.1f}")
+        if r["error_codes"]:
+            print(f"{'':<20} errors: {r['error_codes']}")
+
+
+def compare(results: Dict[str, Dict[str, Any]], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    """p95 가 (1+tolerance) 배 넘게 늘거나 RPS 가 (1-tolerance) 배 밑으로 줄면 회귀"""
+    base = baseline.get("results", {})
+    regressions = []
+    print(f"\nvs baseline {baseline.get('git_rev') or '?'} ({baseline.get('created_at', '?')}), tolerance {tolerance:.0%}")
+    print(f"{'endpoint':<20} {'p95 base':>9} {'p95 now':>9} {'Δp95':>7} {'rps base':>9} {'rps now':>9} {'Δrps':>7}")
+    for name, r in results.items():
+        b = base.get(name)
+        if not b or "p95_ms" not in b or "p95_ms" not in r:
+            print(f"{name:<20} (no baseline)")
+            continue
+        d95 = r["p95_ms"] / b["p95_ms"] - 1 if b["p95_ms"] else 0.0
+        drps = r["rps"] / b["rps"] - 1 if b["rps"] else 0.0
+        bad = d95 > tolerance or drps < -tolerance or r["errors"] > b.get("errors", 0)
+        print(f"{name:<20} {b['p95_ms']:>9.1f} {r['p95_ms']:>9.1f} {d95:>+7.0%} {b['rps']:>9.2f} {r['rps']:>9.2f} "
+              f"{drps:>+7.0%}{'  REGRESSION' if bad else ''}")
+        if bad:
+            regressions.append(name)
+    return regressions
+
+
+# =========================================================
+# main
+# =========================================================
+def run(args, base: str) -> Dict[str, Any]:
+    w, h = (int(v) for v in args.image_size.lower().split("x"))
+    t = time.perf_counter()
+    corpus = make_corpus(args.images, w, h, args.devices, seed=args.seed)
+    avg_kb = sum(len(c["jpeg"]) for c in corpus) / len(corpus) / 1024
+    print(f"{len(corpus)} synthetic {w}x{h} JPEGs (avg {avg_kb:.0f} KB) in {time.perf_counter() - t:.1f}s")
+
+    names = [n for n in ENDPOINTS if n in args.endpoints]
+    phases = [names] if args.mix else [[n] for n in names]
+    # 읽기만 잴 때도 DB 가 비어 있지 않도록 먼저 적재
+    if args.seed_rows and not WRITE_ENDPOINTS & set(names):
+        print(f"seeding {args.seed_rows} rows via /lane_wear_infer")
+        run_phase(base, ["/lane_wear_infer"], corpus, args, duration=0, max_requests=args.seed_rows)
+
+    results: Dict[str, Dict[str, Any]] = {}
+    for phase in phases:
+        label = "+".join(phase)
+        if args.warmup:
+            run_phase(base, phase, corpus, args, duration=0, max_requests=args.warmup * len(phase))
+        print(f"running {label} (concurrency {args.concurrency}, "
+              f"{f'{args.requests} requests' if args.requests else f'{args.duration:g}s'})")
+        results.update(run_phase(base, phase, corpus, args, duration=0 if args.requests else args.duration,
+                                 max_requests=args.requests * len(phase)))
+    return {"created_at": datetime.now(timezone.utc).isoformat(timespec="seconds"), "git_rev": _git_rev(),
+            "host": {"platform": platform.platform(), "cpus": os.cpu_count(), "python": platform.python_version()},
+            "config": config_of(args), "results": results, "stages_ms": stage_means(base)}
+
+
+def main():
+    ap = argparse.ArgumentParser(description="See:Drive API load test")
+    ap.add_argument("--url", default="http://127.0.0.1:8000", help="대상 서버 (--serve 면 무시)")
+    ap.add_argument("--endpoints", nargs="+", default=list(ENDPOINTS), choices=list(ENDPOINTS))
+    ap.add_argument("--concurrency", type=int, default=8)
+    ap.add_argument("--duration", type=float, default=20.0, help="엔드포인트별 측정 시간(초)")
+    ap.add_argument("--requests", type=int, default=0, help="시간 대신 엔드포인트별 요청 수")
+    ap.add_argument("--warmup", type=int, default=4, help="측정 전 엔드포인트별 요청 수 (집계 제외)")
+    ap.add_argument("--mix", action="store_true", help="엔드포인트를 따로 돌리지 않고 한 번에 섞어서")
+    ap.add_argument("--images", type=int, default=16, help="합성 이미지 수")
+    ap.add_argument("--image-size", default="4032x3024", help="합성 이미지 크기 (WxH)")
+    ap.add_argument("--devices", type=int, default=20)
+    ap.add_argument("--max-size", type=int, default=1280, help="업로드 요청의 max_size")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--seed-rows", type=int, default=50, help="읽기만 잴 때 먼저 적재할 행 수")
+    ap.add_argument("--resend", action="store_true", help="같은 파일을 그대로 재전송 (중복 확인 경로 측정)")
+    ap.add_argument("--timeout", type=float, default=60.0)
+    ap.add_argument("--serve", action="store_true", help="main:app 을 직접 띄워서 측정")
+    ap.add_argument("--workers", type=int, default=1, help="--serve 의 uvicorn 워커 수")
+    ap.add_argument("--port", type=int, default=0)
+    ap.add_argument("--weights", help="--serve 에서 얼굴/번호판/차량 모두에 쓸 가중치")
+    ap.add_argument("--env", action="append", default=[], metavar="KEY=VALUE", help="--serve 서버 환경 변수")
+    ap.add_argument("--db-url", help="--serve 서버의 DB_URL")
+    ap.add_argument("--temp-pg", action="store_true", help="임시 Postgres 클러스터를 만들어 사용")
+    ap.add_argument("--pg-bin", help="initdb/pg_ctl 폴더")
+    ap.add_argument("--ready-timeout", type=float, default=600.0)
+    ap.add_argument("--make-weights", metavar="PATH", help="학습 안 된 yolo11n 가중치를 만들고 종료")
+    ap.add_argument("--out", help="결과 JSON 저장 경로")
+    ap.add_argument("--baseline", help="비교할 baseline JSON")
+    ap.add_argument("--save-baseline", metavar="PATH", help="이번 결과를 baseline 으로 저장")
+    ap.add_argument("--tolerance", type=float, default=0.15, help="회귀로 볼 p95/RPS 변화 비율")
+    args = ap.parse_args()
+
+    if args.make_weights:
+        make_weights(args.make_weights)
+        return
+
+    if not args.serve:
+        report = run(args, args.url.rstrip("/"))
+    elif args.temp_pg:
+        with temp_postgres(args.pg_bin) as db_url, serve_app(args, db_url) as base:
+            report = run(args, base)
+    else:
+        with serve_app(args, args.db_url) as base:
+            report = run(args, base)
+
+    print()
+    print_results(report["results"])
+    if report["stages_ms"]:
+        print("server stage means (ms): " + ", ".join(f"{k}={v}" for k, v in report["stages_ms"].items()))
+    for path in filter(None, (args.out, args.save_baseline)):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+        print(f"saved {path}")
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        if baseline.get("config") != report["config"]:
+            print(f"warning: config differs from baseline\n  baseline {baseline.get('config')}\n  now      {report['config']}")
+        if compare(report["results"], baseline, args.tolerance):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
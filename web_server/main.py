@@ -1,22 +1,53 @@
 # seedrive_server.py
+import asyncio
+import hashlib
 import io
+import json
 import os
-import math
-import pathlib
-from datetime import datetime
-from typing import Literal, Dict, Any, Optional, Tuple
+import tempfile
+import threading
+import time
+import zipfile
+from collections import OrderedDict
+from concurrent.futures import Future
+from datetime import datetime, timedelta, timezone
+from typing import TYPE_CHECKING, Literal, Dict, Any, List, Optional, Tuple
 
 import cv2
 import numpy as np
-from PIL import Image, ImageOps
+from PIL import Image
 from fastapi import FastAPI, File, UploadFile, Query, HTTPException, Form, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import Response, FileResponse
-from sqlalchemy import create_engine, MetaData, Table, Column, Integer, String, DateTime, Float, select, desc, text
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import Response, FileResponse, JSONResponse
+from sqlalchemy import create_engine, MetaData, Table, Column, Integer, BigInteger, String, DateTime, Float, Boolean, select, desc, text, tuple_
 from sqlalchemy.dialects.postgresql import JSONB
-from skimage.morphology import skeletonize
-from skimage.measure import label, regionprops
-from ultralytics import YOLO
+
+from anonymize import anonymize, parse_color
+from bounded_executor import BoundedExecutor, QueueFullError
+from image_store import ImageWriter, ShardedImageStore
+from inference_batcher import MicroBatcher
+from ingest_buffer import WriteBehindBuffer
+from metrics import QueueSampler, StageTimer
+from migrations import migrate
+from model_registry import ModelRegistry, ModelVersion
+from model_server import ModelClient, ModelServerError
+from partitions import PartitionMaintainer
+from rank_cache import RankCache
+from response_cache import ResponseCache
+from tiles import TileCache
+from video_ingest import BoxTracker, FrameSampler, GpsTrack
+import device_state
+import geo_cells
+import metrics
+import model_backend
+import model_server
+import plate_cascade
+import rollups
+import tiles
+
+if TYPE_CHECKING:       # ultralytics(torch) import 는 느리므로 모델을 실제로 로드할 때만 (model_backend)
+    from ultralytics import YOLO
 
 # =========================================================
 # 앱 & 저장소 설정
@@ -24,16 +55,34 @@ from ultralytics import YOLO
 app = FastAPI(title="See: Drive API")
 
 STORE_ROOT = os.getenv("IMG_STORE_DIR", "./img")
-ORIG_DIR = os.path.join(STORE_ROOT, "orig")
+ORIG_DIR = os.path.join(STORE_ROOT, "orig")          # 예전 {id}.jpg 레이아웃 (호환용)
 OVERLAY_DIR = os.path.join(STORE_ROOT, "overlay")
+OBJECT_DIR = os.path.join(STORE_ROOT, "objects")     # sha256 해시 prefix 샤딩 저장소
+IMG_SHARD_DEPTH = int(os.getenv("IMG_SHARD_DEPTH", "2"))
 PUBLIC_BASE_URL = os.getenv("PUBLIC_BASE_URL", "").rstrip("/")
 
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
     allow_credentials=True, allow_methods=["*"], allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
 
+# =========================================================
+# CPU 작업 전용 풀 (디코딩/블러/인코딩) + 백프레셔
+# =========================================================
+CPU_WORKERS     = int(os.getenv("CPU_WORKERS", str(os.cpu_count() or 4)))
+CPU_QUEUE_MAX   = int(os.getenv("CPU_QUEUE_MAX", "64"))
+INFER_QUEUE_MAX = int(os.getenv("INFER_QUEUE_MAX", "128"))
+RETRY_AFTER_S   = int(os.getenv("RETRY_AFTER_S", "1"))
+
+cpu_pool = BoundedExecutor(CPU_WORKERS, CPU_QUEUE_MAX, name="cpu", retry_after=RETRY_AFTER_S)
+
+@app.exception_handler(QueueFullError)
+async def _queue_full_handler(request: Request, exc: QueueFullError):
+    return JSONResponse(status_code=503, content={"detail": str(exc)},
+                        headers={"Retry-After": str(exc.retry_after)})
+
 # =========================================================
 # DB 연결 및 스키마
 # =========================================================
@@ -48,7 +97,9 @@ lane_wear_results = Table(
     "lane_wear_results",
     metadata,
     Column("id", Integer, primary_key=True, autoincrement=True),
-    Column("created_at", DateTime(timezone=True), server_default=text("CURRENT_TIMESTAMP")),
+    # 월 단위 range 파티션 키 (PK 에 포함되어야 함)
+    Column("created_at", DateTime(timezone=True), primary_key=True, nullable=False,
+           server_default=text("CURRENT_TIMESTAMP")),
     Column("image_name", String(255)),
     Column("model", String(255)),
     Column("width", Integer), Column("height", Integer),
@@ -58,19 +109,115 @@ lane_wear_results = Table(
     Column("gps_lat", Float), Column("gps_lon", Float),
     Column("timestamp", DateTime),
     Column("device_id", String),
+    Column("orig_key", String(64)),      # 이미지 저장 키 (sha256), NULL 이면 예전 {id}.jpg
+    Column("upload_key", String(64)),    # 업로드 원본 sha256 (재전송 중복 확인, 영상은 영상 해시+프레임)
+    Column("overlay_key", String(64)),
+    Column("thumb_key", String(64)),
+    # 이미지 변형별 존재 여부 (조회 시 파일 확인 없이 URL 생성, NULL 은 backfill 전)
+    Column("has_orig", Boolean), Column("has_overlay", Boolean), Column("has_thumb", Boolean),
+    Column("geo_cell", BigInteger),      # 고정 원점 공간 셀 (geo_cells.cell_id, ZMAX 줌 Morton 코드)
+    postgresql_partition_by="RANGE (created_at)",
 )
 
+# 이미지 변형: kind -> (저장 키 컬럼, 존재 여부 컬럼)
+IMAGE_KINDS = {
+    "orig": ("orig_key", "has_orig"),
+    "overlay": ("overlay_key", "has_overlay"),
+    "thumb": ("thumb_key", "has_thumb"),
+}
+THUMB_EDGE = int(os.getenv("THUMB_EDGE", "320"))
+
+# ---------------------------------------------------------
+# write-behind 적재 버퍼 (id 블록 선할당 + 로컬 spool + 배치 INSERT)
+# ---------------------------------------------------------
+INGEST_SPOOL_DIR   = os.getenv("INGEST_SPOOL_DIR", os.path.join(STORE_ROOT, "spool"))
+INGEST_BATCH_ROWS  = int(os.getenv("INGEST_BATCH_ROWS", "200"))
+INGEST_FLUSH_MS    = float(os.getenv("INGEST_FLUSH_MS", "200"))
+INGEST_ID_BLOCK    = int(os.getenv("INGEST_ID_BLOCK", "100"))
+INGEST_MAX_PENDING = int(os.getenv("INGEST_MAX_PENDING", "10000"))
+INGEST_FSYNC       = os.getenv("INGEST_FSYNC", "1") == "1"
+
+ingest_buffer = WriteBehindBuffer(
+    engine, lane_wear_results, INGEST_SPOOL_DIR,
+    max_rows=INGEST_BATCH_ROWS, max_delay_ms=INGEST_FLUSH_MS, id_block=INGEST_ID_BLOCK,
+    max_pending=INGEST_MAX_PENDING, fsync=INGEST_FSYNC,
+)
+# flush 트랜잭션 안에서 집계 테이블 갱신
+ingest_buffer.flush_hooks.append(rollups.apply_rows)
+ingest_buffer.flush_hooks.append(device_state.apply_rows)
+ingest_buffer.flush_hooks.append(geo_cells.apply_rows)
+
+# ---------------------------------------------------------
+# 대시보드 응답 캐시 (짧은 TTL + 적재 commit 시 무효화 + ETag/304)
+# ---------------------------------------------------------
+RESP_CACHE_TTL_S = float(os.getenv("RESP_CACHE_TTL_S", "2"))
+RESP_CACHE_MAX   = int(os.getenv("RESP_CACHE_MAX", "512"))
+REDIS_URL        = os.getenv("REDIS_URL", "")
+
+response_cache = ResponseCache(ttl_s=RESP_CACHE_TTL_S, max_entries=RESP_CACHE_MAX, redis_url=REDIS_URL or None)
+ingest_buffer.commit_hooks.append(response_cache.invalidate)
+
+# ---------------------------------------------------------
+# 이미지 기록 풀 (한 번 인코딩한 JPEG 을 백그라운드에서 원자적으로 저장)
+# ---------------------------------------------------------
+IMG_WRITER_WORKERS = int(os.getenv("IMG_WRITER_WORKERS", "2"))
+IMG_WRITER_QUEUE   = int(os.getenv("IMG_WRITER_QUEUE", "256"))
+IMG_WRITER_FSYNC   = os.getenv("IMG_WRITER_FSYNC", "0") == "1"
+
+image_writer = ImageWriter(workers=IMG_WRITER_WORKERS, max_queue=IMG_WRITER_QUEUE, fsync=IMG_WRITER_FSYNC)
+image_store = ShardedImageStore(OBJECT_DIR, image_writer,
+                                {"orig": ORIG_DIR, "overlay": OVERLAY_DIR, "thumb": os.path.join(STORE_ROOT, "thumb")},
+                                depth=IMG_SHARD_DEPTH)
+
+# ---------------------------------------------------------
+# 월 파티션 유지보수 (미래 파티션 생성 + 만료 파티션 Parquet 보관)
+# ---------------------------------------------------------
+PART_MONTHS_AHEAD     = int(os.getenv("PART_MONTHS_AHEAD", "3"))
+PART_RETENTION_MONTHS = int(os.getenv("PART_RETENTION_MONTHS", "0"))     # 0 이면 보관/삭제하지 않음
+PART_ARCHIVE_DIR      = os.getenv("PART_ARCHIVE_DIR", os.path.join(STORE_ROOT, "archive"))
+PART_MAINT_INTERVAL_S = float(os.getenv("PART_MAINT_INTERVAL_S", "3600"))
+
+partition_maintainer = PartitionMaintainer(engine, PART_ARCHIVE_DIR, ahead=PART_MONTHS_AHEAD,
+                                           retention_months=PART_RETENTION_MONTHS,
+                                           interval_s=PART_MAINT_INTERVAL_S)
+
+def ensure_schema():
+    # create_all 은 새 테이블만 만들고, 컬럼/인덱스 변경은 버전 관리 마이그레이션으로 적용
+    metadata.create_all(engine)
+    migrate(engine)
+
 @app.on_event("startup")
 def on_startup():
-    metadata.create_all(engine)
+    ensure_schema()
     os.makedirs(ORIG_DIR, exist_ok=True)
     os.makedirs(OVERLAY_DIR, exist_ok=True)
+    os.makedirs(OBJECT_DIR, exist_ok=True)
+    ingest_buffer.start()
+    rank_cache.start()
+    partition_maintainer.start()
+    start_model_preload()
+    if model_client is None:
+        model_registry.start()
+    queue_sampler.start()
+
+@app.on_event("shutdown")
+def on_shutdown():
+    queue_sampler.stop()
+    metrics.mark_process_dead()
+    model_registry.stop()
+    if model_client is not None:
+        model_client.close()
+    partition_maintainer.stop()
+    rank_cache.stop()
+    ingest_buffer.stop()
+    image_writer.shutdown(wait=True)
 
 # =========================================================
 # 모델 로딩
 # =========================================================
 MODEL_PATH = os.getenv("YOLO_MODEL", "./model/yolov11n-face.pt")                    # 얼굴
 LP_MODEL_PATH = os.getenv("YOLO_LP_MODEL", "./model/license-plate-finetune-v1x.pt") # 차량 번호판
+VEHICLE_MODEL_PATH = os.getenv("YOLO_VEHICLE_MODEL", "./model/yolo11n.pt")          # 캐스케이드용 차량 (COCO)
 
 # LANE_MODEL_PATH = os.getenv("YOLO_LANE_MODEL", "best_model.pt") # 차선/정지선/횡단보도 세그
 
@@ -80,30 +227,43 @@ PLATE_CONF      = float(os.getenv("PLATE_CONF", "0.25"))
 BLUR_IOU        = float(os.getenv("BLUR_IOU",  "0.50"))
 BLUR_STRENGTH   = int(os.getenv("BLUR_STRENGTH", "31"))
 PIXEL_SIZE      = int(os.getenv("PIXEL_SIZE", "16"))
-BLUR_METHOD     = os.getenv("BLUR_METHOD", "gaussian")  # "gaussian" | "pixelate"
+BLUR_METHOD     = os.getenv("BLUR_METHOD", "gaussian")  # "gaussian" | "pixelate" | "fill"
+BLUR_FILL_COLOR = parse_color(os.getenv("BLUR_FILL_COLOR", "0,0,0"))   # fill 색 (B,G,R)
+BLUR_MAX_KERNEL = int(os.getenv("BLUR_MAX_KERNEL", "15"))  # 이보다 큰 블러 커널은 축소 후 블러
 
-_model_face: Optional[YOLO] = None
-# _model_lane: Optional[YOLO] = None
-_model_lp: Optional[YOLO] = None
+# 번호판 캐스케이드: 차량 검출 → 차량 주변 crop 에서만 번호판 검출 (애매하면 전체 프레임)
+PLATE_CASCADE        = os.getenv("PLATE_CASCADE", "0") == "1"
+VEHICLE_CLASSES      = [int(c) for c in os.getenv("VEHICLE_CLASSES", "2,3,5,7").split(",")]  # COCO car/motorcycle/bus/truck
+VEHICLE_IMGSZ        = int(os.getenv("VEHICLE_IMGSZ", "640"))
+VEHICLE_CONF         = float(os.getenv("VEHICLE_CONF", "0.35"))       # 이 이상이면 차량으로 확정
+VEHICLE_CONF_LOW     = float(os.getenv("VEHICLE_CONF_LOW", "0.10"))   # 이 사이의 검출이 있으면 전체 프레임
+PLATE_CROP_PAD       = float(os.getenv("PLATE_CROP_PAD", "0.15"))
+PLATE_CROP_IMGSZ     = int(os.getenv("PLATE_CROP_IMGSZ", "640"))
+PLATE_CROP_MAX_COVER = float(os.getenv("PLATE_CROP_MAX_COVER", "0.5"))  # crop 합이 프레임의 이 비율을 넘으면 전체 프레임
 
-def _check_model_file(path: str, label: str):
-    if not os.path.isfile(path):
-        raise FileNotFoundError(f"{label} model not found: {path}")
+# 추론 백엔드: torch(.pt 그대로) | onnx | openvino (처음 로드 시 가중치 옆에 변환 결과 캐시)
+MODEL_BACKEND      = os.getenv("MODEL_BACKEND", "torch")
+MODEL_EXPORT_IMGSZ = int(os.getenv("MODEL_EXPORT_IMGSZ", "1280"))    # 변환/INT8 보정 입력 크기 (배치/크기는 동적)
+MODEL_INT8         = os.getenv("MODEL_INT8", "0") == "1"
+MODEL_CALIB_DIR    = os.getenv("MODEL_CALIB_DIR", "")                # INT8 보정용 이미지 폴더
+MODEL_CALIB_MAX    = int(os.getenv("MODEL_CALIB_MAX", "300"))
 
-def get_face_model() -> YOLO:
-    global _model_face
-    if _model_face is None:
-        _check_model_file(MODEL_PATH, "Face")
-        _model_face = YOLO(MODEL_PATH)
-    return _model_face
+# 모델 레지스트리: kind 별 active + A/B candidate, 설정 파일이 바뀌면 백그라운드 로드 → warmup → 교체
+MODEL_REGISTRY_FILE   = os.getenv("MODEL_REGISTRY_FILE", "./model/registry.json")
+MODEL_REGISTRY_POLL_S = float(os.getenv("MODEL_REGISTRY_POLL_S", "10"))
 
+def _load_yolo(path: str) -> "YOLO":
+    return model_backend.load_model(path, MODEL_BACKEND, imgsz=MODEL_EXPORT_IMGSZ, int8=MODEL_INT8,
+                                    calib_dir=MODEL_CALIB_DIR or None, calib_max=MODEL_CALIB_MAX)
 
-def get_lp_model() -> YOLO:
-    global _model_lp
-    if _model_lp is None:
-        _check_model_file(LP_MODEL_PATH, "License plate")
-        _model_lp = YOLO(LP_MODEL_PATH)
-    return _model_lp
+# warmer 는 아래 preload 절에서 연결 (요청과 같은 배처 경로로 돌린다)
+model_registry = ModelRegistry(
+    _load_yolo,
+    {"face": MODEL_PATH, "lp": LP_MODEL_PATH, "vehicle": VEHICLE_MODEL_PATH},
+    # "lane": LANE_MODEL_PATH,
+    config_path=MODEL_REGISTRY_FILE or None,
+    poll_s=MODEL_REGISTRY_POLL_S,
+)
 
 # =========================================================
 # 유틸 (IO/변환)
@@ -111,24 +271,88 @@ def get_lp_model() -> YOLO:
 MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", 20 * 1024 * 1024))
 ALLOWED_MIME = {"image/jpeg", "image/png"}
 
-def read_image_from_upload(file: UploadFile) -> Image.Image:
+async def read_upload_bytes(file: UploadFile) -> bytes:
     if file.content_type not in ALLOWED_MIME:
         raise HTTPException(status_code=415, detail=f"Unsupported Content-Type: {file.content_type}")
-    raw = file.file.read()
+    raw = await file.read()
     if not raw:
         raise HTTPException(status_code=400, detail="Empty file")
     if len(raw) > MAX_UPLOAD_BYTES:
         raise HTTPException(status_code=413, detail="File too large")
-    img = Image.open(io.BytesIO(raw))
+    return raw
+
+VIDEO_MAX_BYTES = int(os.getenv("VIDEO_MAX_BYTES", 512 * 1024 * 1024))
+ALLOWED_VIDEO_MIME = {"video/mp4", "video/quicktime", "video/x-msvideo", "video/x-matroska", "video/webm"}
+
+async def save_video_upload(file: UploadFile) -> Tuple[str, str]:
+    """영상은 메모리에 올리지 않고 임시 파일로 옮겨 (경로, sha256) 반환 (호출 측이 삭제)"""
+    if file.content_type not in ALLOWED_VIDEO_MIME:
+        raise HTTPException(status_code=415, detail=f"Unsupported Content-Type: {file.content_type}")
+    fd, path = tempfile.mkstemp(suffix=os.path.splitext(file.filename or "")[1][:8])
+    size, digest = 0, hashlib.sha256()
     try:
-        img = ImageOps.exif_transpose(img).convert("RGB")
-    except Exception:
-        img = img.convert("RGB")
+        with os.fdopen(fd, "wb") as f:
+            while chunk := await file.read(1 << 20):
+                size += len(chunk)
+                if size > VIDEO_MAX_BYTES:
+                    raise HTTPException(status_code=413, detail="File too large")
+                f.write(chunk)
+                digest.update(chunk)
+        if not size:
+            raise HTTPException(status_code=400, detail="Empty file")
+    except BaseException:
+        os.unlink(path)
+        raise
+    return path, digest.hexdigest()
+
+# ---------------------------------------------------------
+# 축소 디코딩: JPEG 는 DCT 단계에서 1/2, 1/4, 1/8 로 줄여 읽고 바로 BGR ndarray 로 받는다
+# ---------------------------------------------------------
+_EXIF_ORIENTATION_TAG = 0x0112
+_JPEG_REDUCED_FLAGS = ((8, cv2.IMREAD_REDUCED_COLOR_8), (4, cv2.IMREAD_REDUCED_COLOR_4), (2, cv2.IMREAD_REDUCED_COLOR_2))
+
+def _jpeg_decode_flag(w: int, h: int, max_edge: int) -> int:
+    """축소 후에도 긴 변이 max_edge 이상이 되는 가장 큰 배율 선택"""
+    m = max(w, h)
+    for scale, flag in _JPEG_REDUCED_FLAGS:
+        if -(-m // scale) >= max_edge:
+            return flag
+    return cv2.IMREAD_COLOR
+
+def _apply_exif_orientation(img: np.ndarray, orientation: int) -> np.ndarray:
+    if orientation == 2: return cv2.flip(img, 1)
+    if orientation == 3: return cv2.rotate(img, cv2.ROTATE_180)
+    if orientation == 4: return cv2.flip(img, 0)
+    if orientation == 5: return cv2.transpose(img)
+    if orientation == 6: return cv2.rotate(img, cv2.ROTATE_90_CLOCKWISE)
+    if orientation == 7: return cv2.flip(cv2.transpose(img), -1)
+    if orientation == 8: return cv2.rotate(img, cv2.ROTATE_90_COUNTERCLOCKWISE)
     return img
 
-def pil_to_cv2(img: Image.Image) -> np.ndarray:
-    arr = np.array(img, dtype=np.uint8)
-    return cv2.cvtColor(arr, cv2.COLOR_RGB2BGR)
+def resize_long_edge_bgr(img_bgr: np.ndarray, max_edge: int) -> np.ndarray:
+    h, w = img_bgr.shape[:2]; m = max(w, h)
+    if m <= max_edge: return img_bgr
+    s = max_edge / m
+    return cv2.resize(img_bgr, (int(w * s), int(h * s)), interpolation=cv2.INTER_AREA)
+
+def decode_image_bgr(raw: bytes, max_size: int, timer: Optional[StageTimer] = None) -> np.ndarray:
+    # 헤더만 읽어 크기/포맷/EXIF 방향 확인 (픽셀 디코딩 없음)
+    with metrics.timed("decode", timer):
+        try:
+            with Image.open(io.BytesIO(raw)) as probe:
+                (w, h), fmt = probe.size, probe.format
+                try: orientation = int(probe.getexif().get(_EXIF_ORIENTATION_TAG, 1))
+                except Exception: orientation = 1
+        except Exception:
+            raise HTTPException(status_code=400, detail="Invalid image")
+        # 방향 변환 전후로 긴 변은 같으므로 원본 크기로 배율을 고른다
+        flag = _jpeg_decode_flag(w, h, max_size) if fmt == "JPEG" else cv2.IMREAD_COLOR
+        img = cv2.imdecode(np.frombuffer(raw, np.uint8), flag | cv2.IMREAD_IGNORE_ORIENTATION)
+        if img is None:
+            raise HTTPException(status_code=400, detail="Invalid image")
+        img = _apply_exif_orientation(img, orientation)
+    with metrics.timed("resize", timer):
+        return resize_long_edge_bgr(img, max_size)
 
 def cv2_to_jpeg_bytes(img_bgr: np.ndarray, quality: int = 90) -> bytes:
     ok, buf = cv2.imencode(".jpg", img_bgr, [int(cv2.IMWRITE_JPEG_QUALITY), int(quality)])
@@ -136,17 +360,16 @@ def cv2_to_jpeg_bytes(img_bgr: np.ndarray, quality: int = 90) -> bytes:
         raise RuntimeError("JPEG encoding failed")
     return buf.tobytes()
 
-def resize_long_edge(pil_img: Image.Image, max_edge: int) -> Image.Image:
-    w, h = pil_img.size; m = max(w, h)
-    if m <= max_edge: return pil_img
-    s = max_edge / m
-    return pil_img.resize((int(w * s), int(h * s)), Image.LANCZOS)
+def _image_available(row: dict, kind: str) -> bool:
+    # 행의 has_* 플래그 + 이 프로세스가 기록한 파일은 메모리 상의 기록 상태, 아니면 파일 존재 (다른 워커가 기록 중일 수 있음)
+    key_col, flag_col = IMAGE_KINDS[kind]
+    if not row.get(flag_col): return False
+    key = row.get(key_col)
+    return image_store.is_ready(image_store.path_for(key)) if key else True
 
-def _save_jpg(path: str, img_bgr: np.ndarray, quality: int = 92):
-    pathlib.Path(path).parent.mkdir(parents=True, exist_ok=True)
-    ok = cv2.imwrite(path, img_bgr, [int(cv2.IMWRITE_JPEG_QUALITY), int(quality)])
-    if not ok:
-        raise RuntimeError(f"Failed to write image: {path}")
+def _cache_base(req: Request) -> str:
+    # 응답에 들어가는 이미지 URL 이 요청 호스트에 따라 달라지므로 캐시 키에 포함
+    return PUBLIC_BASE_URL or str(req.base_url)
 
 def _build_url(req: Optional[Request], path: str) -> str:
     if PUBLIC_BASE_URL: return f"{PUBLIC_BASE_URL}{path}"
@@ -159,28 +382,207 @@ def _build_url(req: Optional[Request], path: str) -> str:
 # =========================================================
 # 블러 유틸
 # =========================================================
-def _detect_boxes(model: YOLO, frame_bgr: np.ndarray, conf: float, iou: float, imgsz: int) -> np.ndarray:
-    r = model.predict(frame_bgr, conf=conf, iou=iou, imgsz=imgsz, verbose=False)[0]
+def _result_boxes(r) -> np.ndarray:
     return r.boxes.xyxy.detach().cpu().numpy() if r and r.boxes is not None and len(r.boxes) > 0 else np.empty((0,4), float)
 
-def apply_blur(img_bgr: np.ndarray, boxes_xyxy: np.ndarray,
-               method: str = "gaussian", blur_strength: int = 31, pixel_size: int = 16):
-    out = img_bgr.copy()
-    h, w = out.shape[:2]
-    for x1, y1, x2, y2 in boxes_xyxy:
-        x1 = max(int(x1), 0); y1 = max(int(y1), 0)
-        x2 = min(int(x2), w); y2 = min(int(y2), h)
-        if x2 <= x1 or y2 <= y1: continue
-        roi = out[y1:y2, x1:x2]
-        if method == "pixelate":
-            sh, sw = max(1, (y2-y1)//pixel_size), max(1, (x2-x1)//pixel_size)
-            small = cv2.resize(roi, (sw, sh), interpolation=cv2.INTER_LINEAR)
-            roi_blur = cv2.resize(small, (x2-x1, y2-y1), interpolation=cv2.INTER_NEAREST)
+def _result_dets(r) -> np.ndarray:
+    """(N, 6) x1, y1, x2, y2, conf, cls"""
+    if not r or r.boxes is None or len(r.boxes) == 0: return np.empty((0,6), float)
+    b = r.boxes
+    return np.column_stack([b.xyxy.detach().cpu().numpy(), b.conf.detach().cpu().numpy(), b.cls.detach().cpu().numpy()])
+
+def _detect_boxes(model: "YOLO", frame_bgr: np.ndarray, conf: float, iou: float, imgsz: int) -> np.ndarray:
+    r = model.predict(frame_bgr, conf=conf, iou=iou, imgsz=imgsz, verbose=False)[0]
+    return _result_boxes(r)
+
+# ---------------------------------------------------------
+# 마이크로 배칭: 동시 요청 프레임을 모아 모델별로 한 번에 predict
+# ---------------------------------------------------------
+INFER_MAX_BATCH   = int(os.getenv("INFER_MAX_BATCH", "8"))
+INFER_MAX_WAIT_MS = float(os.getenv("INFER_MAX_WAIT_MS", "5"))
+
+_batcher = MicroBatcher(max_batch=INFER_MAX_BATCH, max_wait_ms=INFER_MAX_WAIT_MS)
+
+# 모델 서버: 설정하면 이 워커는 모델을 로드하지 않고 로컬 모델 서버(python manage.py model-server)에
+# 공유 메모리 링으로 프레임을 넘긴다 (워커 수를 늘려도 모델 메모리는 한 벌, 배치는 워커 사이에서도 묶임)
+MODEL_SERVER_ADDR    = os.getenv("MODEL_SERVER_ADDR", "")             # Unix 소켓 경로 (빈 값이면 워커 안에서 추론)
+MODEL_SERVER_AUTHKEY = os.getenv("MODEL_SERVER_AUTHKEY", "").encode()        # 필수 (기본값 없음, 서버/워커 동일)
+MODEL_SHM_SLOTS      = int(os.getenv("MODEL_SHM_SLOTS", "16"))          # 워커당 동시에 넘길 수 있는 프레임 수
+MODEL_SHM_SLOT_EDGE  = int(os.getenv("MODEL_SHM_SLOT_EDGE", "1280"))    # 슬롯 크기 = edge x edge x 3 (넘으면 소켓으로)
+
+model_client: Optional[ModelClient] = (
+    ModelClient(MODEL_SERVER_ADDR, MODEL_SERVER_AUTHKEY, slots=MODEL_SHM_SLOTS,
+                slot_bytes=MODEL_SHM_SLOT_EDGE * MODEL_SHM_SLOT_EDGE * 3)
+    if MODEL_SERVER_ADDR else None
+)
+
+def _batch_runner(mv: ModelVersion, conf: float, iou: float, imgsz: int):
+    def run(frames):
+        model = mv.model
+        metrics.INFER_BATCH_SIZE.labels(mv.kind).observe(len(frames))
+        t = time.perf_counter()
+        try:
+            if mv.kind == "vehicle":
+                results = model.predict(frames, conf=conf, iou=iou, imgsz=imgsz, classes=VEHICLE_CLASSES, verbose=False)
+                return [_result_dets(r) for r in results]
+            results = model.predict(frames, conf=conf, iou=iou, imgsz=imgsz, verbose=False)
+            return [_result_boxes(r) for r in results]
+        finally:
+            metrics.INFER_BATCH_SECONDS.labels(mv.kind).observe(time.perf_counter() - t)
+    return run
+
+def submit_detect(models: Dict[str, Optional[ModelVersion]], kind: Literal["face", "lp", "vehicle"],
+                  frame_bgr: np.ndarray, conf: float, iou: float, imgsz: int) -> Future:
+    """배치 큐에 프레임을 넣고 boxes(xyxy) 를 돌려줄 Future 반환 (같은 모델 버전 + 파라미터끼리 묶인다)"""
+    mv = models.get(kind)
+    if mv is None:
+        fut: Future = Future()
+        fut.set_exception(RuntimeError(model_registry.last_error(kind) or f"{kind} model not loaded"))
+        return fut
+    if model_client is not None:
+        return model_client.submit(kind, mv.version, frame_bgr, conf, iou, imgsz)
+    key = (kind, mv.version, float(conf), float(iou), int(imgsz))
+    return _batcher.submit(key, _batch_runner(mv, *key[2:]), frame_bgr)
+
+def _infer_queue_depth() -> int:
+    return model_client.pending() if model_client is not None else _batcher.qsize()
+
+def _detect_kinds() -> List[str]:
+    return ["face", "lp"] + (["vehicle"] if PLATE_CASCADE else [])
+
+def _load_models(kinds: List[str]):
+    for kind in kinds:
+        try:
+            model_registry.get(kind)
+        except Exception:
+            pass        # 해당 kind 검출만 실패 처리 (오류는 레지스트리 상태에 남는다)
+
+# 지연 로드는 전용 스레드 하나에서 (기본 스레드풀은 DB 조회 엔드포인트와 공유하므로 로드 락에 묶지 않는다)
+_lazy_load_lock = threading.Lock()
+_lazy_load_future: Optional[Future] = None
+
+def _start_lazy_load(kinds: List[str]) -> Future:
+    global _lazy_load_future
+    with _lazy_load_lock:
+        if _lazy_load_future is None or _lazy_load_future.done():
+            fut: Future = Future()
+            def run():
+                try:
+                    _load_models(kinds)
+                    fut.set_result(None)
+                except BaseException as e:
+                    fut.set_exception(e)
+            threading.Thread(target=run, name="model-lazy-load", daemon=True).start()
+            _lazy_load_future = fut
+        return _lazy_load_future
+
+async def pick_models(route_key: Optional[str] = None) -> Dict[str, Optional[ModelVersion]]:
+    """요청에 쓸 모델 버전 (A/B 는 route_key 해시로 고정). preload 중이면 503, 지연 로드면 로드 완료를 기다린다"""
+    kinds = _detect_kinds()
+    if model_client is not None:
+        try:
+            versions = await asyncio.wrap_future(model_client.pick(route_key))
+        except ModelServerError:
+            versions = {}
+        return {k: ModelVersion(k, MODEL_SERVER_ADDR, versions[k], None) if versions.get(k) else None for k in kinds}
+    if not model_registry.loaded(kinds):
+        if _model_status["state"] in ("pending", "loading"):
+            raise HTTPException(status_code=503, detail="models loading",
+                                headers={"Retry-After": str(RETRY_AFTER_S)})
+        await asyncio.wrap_future(_start_lazy_load(kinds))
+    return {kind: model_registry.pick(kind, route_key) for kind in kinds}
+
+def model_tag(models: Dict[str, Optional[ModelVersion]]) -> Optional[str]:
+    """행 model 컬럼 / 응답에 남길 버전 "face=...,lp=..." """
+    return ",".join(f"{k}={mv.version}" for k, mv in models.items() if mv is not None) or None
+
+async def _await_boxes(fut, swallow: bool = True) -> np.ndarray:
+    try:
+        return await asyncio.wrap_future(fut)
+    except Exception:
+        if not swallow: raise
+        return np.empty((0,4), float)
+
+# 캐스케이드 경로별 프레임 수 (/health, /metrics 에 노출)
+_plate_path_counts = {"full": 0, "crops": 0, "skipped": 0, "vehicle_error": 0}
+_vehicle_error_logged: set = set()     # 차량 검출 실패는 모델 버전당 한 번만 로그
+
+def _count_plate_path(path: str):
+    _plate_path_counts[path] += 1
+    metrics.PLATE_PATH_FRAMES.labels(path).inc()
+
+async def _cascade_plate_boxes(models: Dict[str, Optional[ModelVersion]], frame_bgr: np.ndarray,
+                               plate_conf: float, iou: float, imgsz: int) -> np.ndarray:
+    """차량 검출 → 차량 주변 crop 들에만 번호판 모델 (crop 은 배처에서 다른 요청 crop 과 함께 묶인다)"""
+    h, w = frame_bgr.shape[:2]
+    try:
+        dets = await _await_boxes(submit_detect(models, "vehicle", frame_bgr, VEHICLE_CONF_LOW, iou, VEHICLE_IMGSZ), swallow=False)
+        crops = plate_cascade.plan_crops(dets, w, h, conf_hi=VEHICLE_CONF, conf_lo=VEHICLE_CONF_LOW,
+                                         pad=PLATE_CROP_PAD, max_cover=PLATE_CROP_MAX_COVER)
+    except Exception as e:
+        _count_plate_path("vehicle_error")
+        version = models["vehicle"].version if models.get("vehicle") is not None else None
+        if version not in _vehicle_error_logged:
+            _vehicle_error_logged.add(version)
+            print(f"vehicle detection failed ({version}), using full frame:", e)
+        crops = None
+    if crops is None:
+        _count_plate_path("full")
+        return await _await_boxes(submit_detect(models, "lp", frame_bgr, plate_conf, iou, imgsz))
+    if not crops:
+        _count_plate_path("skipped")
+        return np.empty((0,4), float)
+    _count_plate_path("crops")
+    futs = [submit_detect(models, "lp", np.ascontiguousarray(frame_bgr[y1:y2, x1:x2]), plate_conf, iou, PLATE_CROP_IMGSZ)
+            for x1, y1, x2, y2 in crops]
+    found = [plate_cascade.offset_boxes(b, x1, y1)
+             for (x1, y1, _, _), b in zip(crops, await asyncio.gather(*(_await_boxes(f) for f in futs)))]
+    boxes = np.concatenate(found, axis=0)
+    return boxes if len(boxes) else np.empty((0,4), float)
+
+async def detect_blur_boxes(frame_bgr: np.ndarray, face_conf: float, plate_conf: float, iou: float, imgsz: int,
+                            strict_face: bool = False,
+                            models: Optional[Dict[str, Optional[ModelVersion]]] = None,
+                            timer: Optional[StageTimer] = None) -> np.ndarray:
+    """얼굴 + 번호판 박스를 합쳐 반환 (추론 대기 중에는 스레드를 점유하지 않음). models 가 없으면 요청마다 고른다."""
+    if _infer_queue_depth() >= INFER_QUEUE_MAX:
+        raise QueueFullError("infer", _infer_queue_depth(), RETRY_AFTER_S)
+    if models is None:
+        models = await pick_models()
+    # 얼굴/번호판은 동시에 진행되므로 각각 제출 → 결과까지 (배치 대기 포함)
+    t_face = time.perf_counter()
+    fut_face = submit_detect(models, "face", frame_bgr, face_conf, iou, imgsz)
+    fut_face.add_done_callback(lambda _f: metrics.observe("face_detect", time.perf_counter() - t_face, timer))
+    with metrics.timed("plate_detect", timer):
+        if PLATE_CASCADE:
+            boxes_plate = await _cascade_plate_boxes(models, frame_bgr, plate_conf, iou, imgsz)
         else:
-            k = blur_strength if blur_strength % 2 == 1 else blur_strength + 1
-            roi_blur = cv2.GaussianBlur(roi, (k, k), 0)
-        out[y1:y2, x1:x2] = roi_blur
-    return out
+            boxes_plate = await _await_boxes(submit_detect(models, "lp", frame_bgr, plate_conf, iou, imgsz))
+    boxes_face = await _await_boxes(fut_face, swallow=not strict_face)
+    boxes = boxes_face if len(boxes_face) else np.empty((0,4), float)
+    if len(boxes_plate): boxes = np.concatenate([boxes, boxes_plate], axis=0) if len(boxes) else boxes_plate
+    return boxes
+
+def _blur_and_encode(img_bgr: np.ndarray, boxes: np.ndarray, method: str, blur_strength: int,
+                     pixel_size: int, jpeg_quality: int, timer: Optional[StageTimer] = None) -> bytes:
+    with metrics.timed("blur", timer):
+        if len(boxes):
+            anonymize(img_bgr, boxes, method=method, blur_strength=blur_strength, pixel_size=pixel_size,
+                      fill_color=BLUR_FILL_COLOR, max_kernel=BLUR_MAX_KERNEL)
+    with metrics.timed("encode", timer):
+        return cv2_to_jpeg_bytes(img_bgr, quality=jpeg_quality)
+
+def _render_variants(img_bgr: np.ndarray, boxes: np.ndarray, timer: Optional[StageTimer] = None) -> Dict[str, bytes]:
+    """블러 반영 원본 + 썸네일 JPEG (각각 한 번씩 인코딩). img_bgr 는 직접 수정된다."""
+    with metrics.timed("blur", timer):
+        if len(boxes):
+            anonymize(img_bgr, boxes, method=BLUR_METHOD, blur_strength=BLUR_STRENGTH, pixel_size=PIXEL_SIZE,
+                      fill_color=BLUR_FILL_COLOR, max_kernel=BLUR_MAX_KERNEL)
+    with metrics.timed("encode", timer):
+        return {
+            "orig": cv2_to_jpeg_bytes(img_bgr, quality=92),
+            "thumb": cv2_to_jpeg_bytes(resize_long_edge_bgr(img_bgr, THUMB_EDGE), quality=80),
+        }
 
 # =========================================================
 # 헬스체크
@@ -189,12 +591,151 @@ def apply_blur(img_bgr: np.ndarray, boxes_xyxy: np.ndarray,
 def health():
     return {
         "status": "ok",
-        "face_model": os.path.basename(MODEL_PATH),
+        "face_model": os.path.basename(model_registry.path_for("face")),
         # "lane_model": os.path.basename(LANE_MODEL_PATH),
-        "lp_model": os.path.basename(LP_MODEL_PATH),
+        "lp_model": os.path.basename(model_registry.path_for("lp")),
+        "backend": MODEL_BACKEND + ("-int8" if MODEL_INT8 and MODEL_BACKEND != "torch" else ""),
+        "plate_cascade": {"vehicle_model": os.path.basename(model_registry.path_for("vehicle")), **_plate_path_counts} if PLATE_CASCADE else None,
         # "lane_classes": getattr(get_lane_model(), "names", {}),
     }
 
+# ---------------------------------------------------------
+# 모델 preload / warmup (백그라운드) + live / ready
+# ---------------------------------------------------------
+MODEL_PRELOAD      = os.getenv("MODEL_PRELOAD", "1") == "1"     # 0 이면 첫 요청에서 로드 (DB 조회 전용 워커)
+MODEL_WARMUP_IMGSZ = [int(v) for v in os.getenv("MODEL_WARMUP_IMGSZ", "1280").split(",") if v.strip()]
+MODEL_WARMUP_RUNS  = int(os.getenv("MODEL_WARMUP_RUNS", "2"))
+
+# state: lazy(preload 안 함) | pending | loading | warming | ready | error (모델 서버 모드에서는 서버 상태를 본다)
+_model_status: Dict[str, Any] = {"state": "pending" if MODEL_PRELOAD else "lazy", "error": None,
+                                 "load_s": {}, "warmup_s": None}
+
+def _models_state() -> Dict[str, Any]:
+    if model_client is None:
+        return {**_model_status, "load_s": dict(_model_status["load_s"])}
+    try:
+        return model_client.status().result(timeout=2)["models"]
+    except Exception as e:
+        return {"state": "error", "error": f"model server: {e}", "load_s": {}, "warmup_s": None}
+
+def _warmup_jobs() -> List[Tuple[str, float, int]]:
+    """(kind, conf, imgsz) — 요청 경로와 같은 배처 key 로 돌려 모델별/크기별 첫 실행 비용을 미리 치른다"""
+    jobs = [("face", FACE_CONF, sz) for sz in MODEL_WARMUP_IMGSZ]
+    jobs += [("lp", PLATE_CONF, sz) for sz in MODEL_WARMUP_IMGSZ]
+    if PLATE_CASCADE:
+        jobs += [("vehicle", VEHICLE_CONF_LOW, VEHICLE_IMGSZ), ("lp", PLATE_CONF, PLATE_CROP_IMGSZ)]
+    return jobs
+
+def _warm_model(mv: ModelVersion):
+    """mv 를 요청 경로(배처)로 워밍업 — preload 와 레지스트리 교체 전에 쓴다"""
+    for kind, conf, sz in _warmup_jobs():
+        if kind != mv.kind: continue
+        frame = np.zeros((sz * 3 // 4, sz, 3), np.uint8)
+        for _ in range(MODEL_WARMUP_RUNS):
+            submit_detect({kind: mv}, kind, frame, conf, BLUR_IOU, sz).result()
+
+model_registry.warmer = _warm_model
+
+def _preload_models():
+    st = _model_status
+    st["state"] = "loading"
+    try:
+        kinds = _detect_kinds()
+        for kind in kinds:
+            t0 = time.perf_counter(); model_registry.get(kind)
+            st["load_s"][kind] = round(time.perf_counter() - t0, 3)
+        st["state"] = "warming"
+        t0 = time.perf_counter()
+        for kind in kinds:
+            _warm_model(model_registry.get(kind))
+        st["warmup_s"] = round(time.perf_counter() - t0, 3)
+        st["state"] = "ready"
+        print(f"models ready (load {st['load_s']}, warmup {st['warmup_s']}s)")
+    except Exception as e:
+        st["state"], st["error"] = "error", str(e)
+        print("model preload failed:", e)
+
+def start_model_preload():
+    if model_client is None and MODEL_PRELOAD and _model_status["state"] == "pending":
+        threading.Thread(target=_preload_models, name="model-preload", daemon=True).start()
+
+@app.get("/models")
+def models_status():
+    """kind 별 active / candidate 버전, A/B 비율, 설정 적용 오류"""
+    if model_client is not None:
+        try:
+            return model_client.status().result(timeout=2)["registry"]
+        except Exception as e:
+            raise HTTPException(status_code=503, detail=f"model server: {e}")
+    return model_registry.status()
+
+@app.get("/health/live")
+def health_live():
+    return {"status": "ok"}
+
+@app.get("/health/ready")
+def health_ready():
+    """모델 preload/warmup 완료 + DB 연결 시 200, 아니면 503 (로드밸런서 트래픽 투입 기준)"""
+    try:
+        with engine.connect() as conn:
+            conn.execute(text("SELECT 1"))
+        db_ok, db_error = True, None
+    except Exception as e:
+        db_ok, db_error = False, str(e)
+    models = _models_state()
+    ok = db_ok and models["state"] in ("ready", "lazy")
+    body = {"status": "ready" if ok else "not_ready", "db": db_ok, "db_error": db_error, "models": models}
+    return JSONResponse(body, status_code=200 if ok else 503)
+
+# ---------------------------------------------------------
+# Prometheus 지표 (단계별 지연 / 큐 길이 / 모델 로드 시간)
+# ---------------------------------------------------------
+METRICS_SAMPLE_S = float(os.getenv("METRICS_SAMPLE_S", "1.0"))     # 큐 길이 샘플 간격(초)
+
+# write-behind 작업은 요청 밖에서 돌므로 실제로 쓰는 스레드에서 잰다
+image_writer.timing_hooks.append(lambda seconds: metrics.observe("image_save", seconds))
+ingest_buffer.timing_hooks.append(lambda rows, seconds: metrics.observe("db_insert", seconds))
+model_registry.load_hooks.append(lambda mv: metrics.MODEL_LOAD_SECONDS.labels(mv.kind, mv.version).set(mv.load_s))
+
+queue_sampler = QueueSampler(lambda: {
+    "infer": _infer_queue_depth(),
+    "cpu": cpu_pool.depth(),
+    "image_writer": image_writer.depth(),
+    "ingest": ingest_buffer.depth(),
+}, METRICS_SAMPLE_S)
+
+@app.get("/metrics")
+def prometheus_metrics():
+    queue_sampler.update()
+    body, content_type = metrics.render()
+    return Response(content=body, media_type=content_type)
+
+# ---------------------------------------------------------
+# 모델 서버 프로세스 (python manage.py model-server)
+# ---------------------------------------------------------
+def serve_models():
+    """이 프로세스가 모델을 들고 워커 요청을 받는다 (레지스트리 교체 / A/B / 배칭은 여기서 한 번만)"""
+    global model_client
+    model_client = None
+    start_model_preload()
+    model_registry.start()
+    QueueSampler(lambda: {"model_server": _batcher.qsize()}, METRICS_SAMPLE_S).start()
+
+    def detect(kind, version, frame, conf, iou, imgsz):
+        return submit_detect({kind: model_registry.resolve(kind, version)}, kind, frame, conf, iou, imgsz)
+
+    def pick(route_key):
+        kinds = _detect_kinds()
+        if not model_registry.loaded(kinds):
+            _load_models(kinds)
+        picked = {k: model_registry.pick(k, route_key) for k in kinds}
+        return {k: mv.version if mv else None for k, mv in picked.items()}
+
+    def status():
+        return {"models": _models_state(), "registry": model_registry.status(), "queue": _batcher.qsize()}
+
+    model_server.serve(MODEL_SERVER_ADDR, MODEL_SERVER_AUTHKEY, detect, pick, status)
+
 # =========================================================
 # 오버레이 렌더
 # =========================================================
@@ -206,38 +747,156 @@ ALPHA_FILL = 0.35; CNT_THICK = 2
 # 테스트용 블러 API (얼굴/번호판)
 # =========================================================
 @app.post("/blur")
-def blur(
+async def blur(
     file: UploadFile = File(...),
     conf: float = Query(0.25, ge=0.01, le=1.0),
     iou: float = Query(0.50, ge=0.05, le=0.95),
-    method: Literal["gaussian", "pixelate"] = Query("gaussian"),
+    method: Literal["gaussian", "pixelate", "fill"] = Query("gaussian"),
     blur_strength: int = Query(31, ge=3, le=199),
     pixel_size: int = Query(16, ge=2, le=128),
     max_size: int = Query(1280, ge=320, le=4096),
     jpeg_quality: int = Query(90, ge=60, le=100),
 ):
-    pil_img = read_image_from_upload(file)
-    pil_img_rs = resize_long_edge(pil_img, max_size)
-    img_bgr = pil_to_cv2(pil_img_rs)
+    timer = StageTimer()
+    with timer.stage("upload_read"):
+        raw = await read_upload_bytes(file)
+    img_bgr = await cpu_pool.run(decode_image_bgr, raw, max_size, timer)
 
-    boxes_face = _detect_boxes(get_face_model(), img_bgr, conf, iou, max_size)
-    try:
-        boxes_plate = _detect_boxes(get_lp_model(), img_bgr, conf, iou, max_size)
-    except Exception:
-        boxes_plate = np.empty((0,4), float)
+    boxes = await detect_blur_boxes(img_bgr, conf, conf, iou, max_size, strict_face=True, timer=timer)
 
-    boxes = boxes_face if len(boxes_face) else np.empty((0,4), float)
-    if len(boxes_plate): boxes = np.concatenate([boxes, boxes_plate], axis=0) if len(boxes) else boxes_plate
-
-    if len(boxes):
-        img_bgr = apply_blur(img_bgr, boxes, method=method, blur_strength=blur_strength, pixel_size=pixel_size)
-    return Response(content=cv2_to_jpeg_bytes(img_bgr, quality=jpeg_quality), media_type="image/jpeg")
+    jpg = await cpu_pool.run(_blur_and_encode, img_bgr, boxes, method, blur_strength, pixel_size, jpeg_quality, timer)
+    metrics.observe_request("blur", timer)
+    return Response(content=jpg, media_type="image/jpeg",
+                    headers={"Server-Timing": ", ".join(f"{k};dur={v}" for k, v in timer.timings_ms().items())})
 
 # =========================================================
 # Lane wear 추론 + 저장 (패턴 지표 포함)
 # =========================================================
+# 재전송된 동일 업로드(같은 기기 + 같은 업로드 원본 해시)는 디코드/추론 없이 기존 행을 돌려준다.
+# 블러 결과 해시는 모델 버전/배치 구성에 따라 달라지므로 키로 쓰지 않는다.
+_RECENT_UPLOADS_MAX = 4096
+_recent_uploads: "OrderedDict[Tuple[str, str], Dict[str, Any]]" = OrderedDict()
+_DUP_FIELDS = ("id", "model", "width", "height")
+
+def upload_key(raw: bytes) -> str:
+    return hashlib.sha256(raw).hexdigest()
+
+def _remember_upload(device_id: str, key: str, row: Dict[str, Any]):
+    _recent_uploads[(device_id, key)] = {k: row.get(k) for k in _DUP_FIELDS}
+    while len(_recent_uploads) > _RECENT_UPLOADS_MAX:
+        _recent_uploads.popitem(last=False)
+
+def _find_duplicate(device_id: str, key: str) -> Optional[Dict[str, Any]]:
+    """이미 받은 업로드면 {"id", "model", "width", "height"} (flush 전 행은 메모리에서)"""
+    dup = _recent_uploads.get((device_id, key))
+    if dup is not None: return dup
+    with engine.connect() as conn:
+        row = conn.execute(
+            select(*(lane_wear_results.c[k] for k in _DUP_FIELDS))
+            .where(lane_wear_results.c.upload_key == key, lane_wear_results.c.device_id == device_id)
+            .limit(1)
+        ).mappings().first()
+    if row is None: return None
+    _remember_upload(device_id, key, row)
+    return _recent_uploads[(device_id, key)]
+
+def _dup_staged(dup: Dict[str, Any]) -> Dict[str, Any]:
+    return {"db_id": dup["id"], "db_error": None, "deduplicated": True}
+
+def _build_row(image_name: Optional[str], W: int, H: int, gps_lat: float, gps_lon: float,
+               timestamp: datetime, device_id: Optional[str], model: Optional[str], runtime_ms: float,
+               upload_key: Optional[str] = None) -> Dict[str, Any]:
+    return dict(
+        created_at = datetime.now(timezone.utc),
+        upload_key = upload_key,
+        image_name = image_name,
+        # model      = os.path.basename(LANE_MODEL_PATH),
+        model      = model,
+        width      = W, height = H,
+        runtime_ms = round(runtime_ms, 2),     # 업로드 수신 ~ 블러/인코딩 (적재 직전까지)
+        # overall    = {k: (float(v) if isinstance(v, (int, float, np.floating)) else v) for k, v in metrics_all.items()},
+        overall    = {1 : 0.1},
+        # per_class  = per_class,
+        per_class  = 1,
+        gps_lat    = gps_lat, gps_lon = gps_lon,
+        timestamp  = timestamp, device_id = device_id,
+        geo_cell   = geo_cells.cell_id(gps_lat, gps_lon),
+    )
+
+async def _analyze_frame(frame: np.ndarray, max_size: int, models: Dict[str, Optional[ModelVersion]],
+                         timer: StageTimer) -> Dict[str, bytes]:
+    """얼굴/번호판 블러 + JPEG 인코딩 (변형별 한 번만)"""
+    all_boxes = await detect_blur_boxes(frame, FACE_CONF, PLATE_CONF, BLUR_IOU, max_size, models=models, timer=timer)
+    return await cpu_pool.run(_render_variants, frame, all_boxes, timer)
+
+def _stage_rows(items: List[Tuple[Dict[str, Any], Dict[str, bytes]]], check_db: bool = False,
+                item_queue_errors: bool = False) -> List[Dict[str, Any]]:
+    """
+    (row, variants) 목록을 중복 확인 → 이미지 저장 → 적재 버퍼에 한 번에 넣는다 (spool fsync 1회).
+    이미지 업로드는 디코드 전에 DB 까지 확인했으므로 여기서는 같은 요청 / 동시에 들어온 재전송만 메모리에서 거른다
+    (check_db 면 DB 도 확인). 항목별 {"db_id", "db_error", "deduplicated"} 반환.
+    버퍼가 가득 차면 QueueFullError (아무 행도 넣지 않음). 이미지 기록 대기열이 가득 차면 QueueFullError 를 그대로 올리고
+    (호출 측 503 + Retry-After), item_queue_errors 면 그 항목의 db_error 로 남긴다 (일괄 업로드).
+    """
+    results = [{"db_id": None, "db_error": None, "deduplicated": False} for _ in items]
+    new_rows, new_idx, seen = [], [], {}
+    for i, (row, variants) in enumerate(items):
+        dev, key = row.get("device_id"), row.get("upload_key")
+        try:
+            if key is not None:
+                dup = seen.get((dev, key)) or (_find_duplicate(dev, key) if check_db else _recent_uploads.get((dev, key)))
+                if dup is not None:
+                    results[i].update(_dup_staged(dup))
+                    continue
+            # (3) 이미지 저장 (블러 반영 원본 + 썸네일) — 내용 주소 저장소에 백그라운드 기록
+            orig_key, thumb_key = image_store.put_many([variants["orig"], variants["thumb"]])
+            # row["overlay_key"] = image_store.put(cv2_to_jpeg_bytes(make_overlay_image(frame, class_masks), 92))
+            row.update(id=ingest_buffer.ids.next_id(), orig_key=orig_key, thumb_key=thumb_key,
+                       has_orig=True, has_overlay=False, has_thumb=True)
+        except QueueFullError as e:
+            if not item_queue_errors:
+                raise
+            results[i]["db_error"] = str(e)
+            continue
+        except Exception as e:
+            results[i]["db_error"] = str(e)
+            continue
+        if key is not None:
+            seen[(dev, key)] = row
+        new_rows.append(row); new_idx.append(i)
+    if new_rows:
+        for i, row, rid in zip(new_idx, new_rows, ingest_buffer.add_many(new_rows)):
+            if row["upload_key"] is not None:
+                _remember_upload(row["device_id"], row["upload_key"], row)
+            results[i]["db_id"] = rid
+    return results
+
+def _infer_response(request: Request, W: int, H: int, staged: Dict[str, Any], model: Optional[str],
+                    timer: StageTimer) -> Dict[str, Any]:
+    db_id = staged["db_id"]
+    orig_url = overlay_url = None
+    if db_id is not None:
+        orig_url    = _build_url(request, f"/lane_wear/image/{db_id}/orig")
+        # overlay_url = _build_url(request, f"/lane_wear/image/{db_id}/overlay")
+    return {
+        # "model": os.path.basename(LANE_MODEL_PATH),
+        "model": model,
+        "image_size": {"width": W, "height": H},
+        "runtime_ms": round(timer.total_ms(), 2),
+        "timings_ms": timer.timings_ms(),
+        # "overall": {k: (float(v) if isinstance(v, (int, float, np.floating)) else v) for k, v in metrics_all.items()},
+        "overall" :  {1 : 0.1},
+        # "per_class": per_class,
+        "per_class": 1,
+        "db_id": db_id,
+        "db_error": staged["db_error"],
+        "deduplicated": staged["deduplicated"],
+        "orig_url": orig_url,
+        "overlay_url": overlay_url,
+    }
+
 @app.post("/lane_wear_infer")
-def lane_wear_infer(
+async def lane_wear_infer(
     request: Request,
     file: UploadFile = File(...),
     conf: float = Query(0.25, ge=0.01, le=1.0),
@@ -248,90 +907,303 @@ def lane_wear_infer(
     timestamp: datetime = Form(...),
     device_id: str = Form(...),
 ):
-    print("lane_wear_infer init")
-    print("="*40)
-    import time
-    pil_img = read_image_from_upload(file)
-    pil_img_rs = resize_long_edge(pil_img, max_size)
-    frame = pil_to_cv2(pil_img_rs)
+    timer = StageTimer()
+    with timer.stage("upload_read"):
+        raw = await read_upload_bytes(file)
+
+    # (0) 재전송이면 디코드/추론 없이 기존 행
+    key = upload_key(raw)
+    with timer.stage("dedup"):
+        dup = await run_in_threadpool(_find_duplicate, device_id, key)
+    if dup is not None:
+        metrics.observe_request("lane_wear_infer", timer)
+        return _infer_response(request, dup["width"], dup["height"], _dup_staged(dup), dup["model"], timer)
+
+    frame = await cpu_pool.run(decode_image_bgr, raw, max_size, timer)
     H, W = frame.shape[:2]
 
-    # (1) 얼굴/번호판 블러
-    try: boxes_face = _detect_boxes(get_face_model(), frame, FACE_CONF, BLUR_IOU, max_size)
-    except Exception: boxes_face = np.empty((0,4), float)
-    try: boxes_plate = _detect_boxes(get_lp_model(), frame, PLATE_CONF, BLUR_IOU, max_size)
-    except Exception: boxes_plate = np.empty((0,4), float)
-    if len(boxes_face) or len(boxes_plate):
-        all_boxes = boxes_face if len(boxes_face) else np.empty((0,4), float)
-        if len(boxes_plate): all_boxes = np.concatenate([all_boxes, boxes_plate], axis=0) if len(all_boxes) else boxes_plate
-        frame = apply_blur(frame, all_boxes, method=BLUR_METHOD, blur_strength=BLUR_STRENGTH, pixel_size=PIXEL_SIZE)
-
-    # (2) DB 저장
-    db_id = None; db_error = None
+    # (1) 얼굴/번호판 블러 + JPEG 인코딩 (A/B 버전은 기기 기준으로 고정)
+    models = await pick_models(device_id)
+    variants = await _analyze_frame(frame, max_size, models, timer)
+
+    # (2) DB 저장 (write-behind: id 는 즉시 확정, INSERT 는 배치로 flush)
+    row = _build_row(getattr(file, "filename", None), W, H, gps_lat, gps_lon, timestamp, device_id,
+                     model_tag(models), timer.total_ms(), upload_key=key)
+    with timer.stage("stage_rows"):
+        staged = (await run_in_threadpool(_stage_rows, [(row, variants)]))[0]
+    metrics.observe_request("lane_wear_infer", timer)
+    return _infer_response(request, W, H, staged, row["model"], timer)
+
+# ---------------------------------------------------------
+# 일괄 업로드 (음영 지역에서 쌓인 캡처 재전송)
+# ---------------------------------------------------------
+BATCH_MAX_ITEMS   = int(os.getenv("BATCH_MAX_ITEMS", "64"))
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "8"))      # 동시에 디코드/검출 중인 항목 수
+BATCH_MAX_ZIP_BYTES = int(os.getenv("BATCH_MAX_ZIP_BYTES", str(512 * 1024 * 1024)))
+
+def _parse_manifest(manifest: Optional[str], names: List[str], device_id: Optional[str]) -> List[Dict[str, Any]]:
+    """
+    manifest: JSON 배열 [{"file": 이름(선택), "gps_lat", "gps_lon", "timestamp", "device_id"(선택)}, ...]
+    file 이 있으면 파일 이름(basename, zip 안의 디렉터리 무시)으로, 없으면 순서대로 이미지와 짝짓는다.
+    항목별 오류는 "error" 로 남긴다.
+    """
     try:
-        with engine.begin() as conn:
-            ins = conn.execute(
-                lane_wear_results.insert().values(
-                    image_name = getattr(file, "filename", None),
-                    # model      = os.path.basename(LANE_MODEL_PATH),
-                    model      = "None",
-                    width      = W, height = H,
-                    # runtime_ms = round(elapsed_ms, 2),
-                    runtime_ms = 2,
-                    # overall    = {k: (float(v) if isinstance(v, (int, float, np.floating)) else v) for k, v in metrics_all.items()},
-                    overall    = {1 : 0.1},
-                    # per_class  = per_class,
-                    per_class  = 1,
-                    gps_lat    = gps_lat, gps_lon = gps_lon,
-                    timestamp  = timestamp, device_id = device_id,
-                )
-            )
-            db_id = ins.inserted_primary_key[0]
-    except Exception as e:
-        db_error = str(e)
+        entries = json.loads(manifest) if manifest else []
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"invalid manifest: {e}")
+    if not isinstance(entries, list):
+        raise HTTPException(status_code=400, detail="manifest must be a JSON array")
+    by_name = {os.path.basename(str(e["file"])): e for e in entries if isinstance(e, dict) and e.get("file")}
+    metas = []
+    for i, name in enumerate(names):
+        e = by_name.get(os.path.basename(name)) if by_name else (entries[i] if i < len(entries) else None)
+        meta: Dict[str, Any] = {"name": name}
+        try:
+            if not isinstance(e, dict):
+                raise ValueError("no manifest entry")
+            meta["gps_lat"] = float(e["gps_lat"])
+            meta["gps_lon"] = float(e["gps_lon"])
+            meta["timestamp"] = datetime.fromisoformat(str(e["timestamp"]).replace("Z", "+00:00"))
+            meta["device_id"] = e.get("device_id") or device_id
+            if not meta["device_id"]:
+                raise ValueError("device_id is required")
+        except (KeyError, TypeError, ValueError) as ex:
+            meta["error"] = f"invalid metadata: {ex}"
+        metas.append(meta)
+    return metas
 
-    # (3) 이미지 저장 (블러 반영 원본 + 오버레이)
-    orig_url = overlay_url = None
+@app.post("/lane_wear_infer/batch")
+async def lane_wear_infer_batch(
+    request: Request,
+    files: Optional[List[UploadFile]] = File(None),
+    archive: Optional[UploadFile] = File(None),
+    manifest: Optional[str] = Form(None),
+    device_id: Optional[str] = Form(None),
+    max_size: int = Query(1280, ge=320, le=4096),
+):
+    """
+    여러 이미지를 한 번에 처리. files(multipart 여러 개) 또는 archive(zip, 안에 manifest.json 가능) 중 하나.
+    디코드/검출은 항목별로 동시에 진행되어 마이크로 배치로 묶이고, 행은 적재 버퍼에 한 번에 들어간다.
+    응답 items[i] 는 단건 /lane_wear_infer 응답 + index/name/ok/error.
+    """
+    if bool(files) == bool(archive):
+        raise HTTPException(status_code=400, detail="send either files or archive")
+    req_timer = StageTimer()
+
+    zf = None
+    if archive is not None:
+        try:
+            zf = zipfile.ZipFile(archive.file)
+        except zipfile.BadZipFile:
+            raise HTTPException(status_code=400, detail="invalid zip archive")
+        members = [m for m in zf.infolist() if not m.is_dir() and os.path.basename(m.filename) != "manifest.json"]
+        if sum(m.file_size for m in members) > BATCH_MAX_ZIP_BYTES:
+            raise HTTPException(status_code=413, detail="archive too large")
+        manifest_name = next((m.filename for m in zf.infolist()
+                              if not m.is_dir() and os.path.basename(m.filename) == "manifest.json"), None)
+        if manifest is None and manifest_name is not None:
+            manifest = zf.read(manifest_name).decode("utf-8")
+        names = [m.filename for m in members]
+    else:
+        names = [f.filename or str(i) for i, f in enumerate(files)]
+    if len(names) > BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=413, detail=f"too many items (max {BATCH_MAX_ITEMS})")
+    metas = _parse_manifest(manifest, names, device_id)
+
+    sem = asyncio.Semaphore(BATCH_CONCURRENCY)
+    zip_lock = asyncio.Lock()
+
+    async def _read(i: int) -> bytes:
+        if zf is None:
+            return await read_upload_bytes(files[i])
+        m = members[i]
+        if m.file_size > MAX_UPLOAD_BYTES:
+            raise HTTPException(status_code=413, detail="File too large")
+        async with zip_lock:     # ZipFile 은 하나의 파일 핸들을 공유
+            return await run_in_threadpool(zf.read, m)
+
+    async def _prepare(i: int):
+        meta = metas[i]
+        if "error" in meta:
+            raise ValueError(meta["error"])
+        async with sem:
+            timer = StageTimer()        # 항목별 (세마포어 대기 제외)
+            with timer.stage("upload_read"):
+                raw = await _read(i)
+            key = upload_key(raw)
+            with timer.stage("dedup"):
+                dup = await run_in_threadpool(_find_duplicate, meta["device_id"], key)
+            if dup is not None:     # 재전송 — 디코드/추론 생략
+                timer.stop()
+                return dup["width"], dup["height"], None, dup, timer
+            frame = await cpu_pool.run(decode_image_bgr, raw, max_size, timer)
+            models = await pick_models(meta["device_id"])
+            variants = await _analyze_frame(frame, max_size, models, timer)
+        H, W = frame.shape[:2]
+        row = _build_row(os.path.basename(meta["name"]), W, H, meta["gps_lat"], meta["gps_lon"],
+                         meta["timestamp"], meta["device_id"], model_tag(models), timer.total_ms(), upload_key=key)
+        timer.stop()
+        return W, H, row, variants, timer
+
+    prepared = await asyncio.gather(*(_prepare(i) for i in range(len(names))), return_exceptions=True)
+    # 항목별 예외(QueueFullError 포함)는 그 항목의 error 로만 남긴다
+    ok_idx = [i for i, p in enumerate(prepared) if not isinstance(p, BaseException) and p[2] is not None]
+    t_stage = time.perf_counter()
+    staged = (await run_in_threadpool(_stage_rows, [(prepared[i][2], prepared[i][3]) for i in ok_idx], False, True)
+              if ok_idx else [])
+    staged_by_idx = dict(zip(ok_idx, staged))
+    staged_by_idx.update((i, _dup_staged(p[3])) for i, p in enumerate(prepared)
+                         if not isinstance(p, BaseException) and p[2] is None)
+    dt_stage = time.perf_counter() - t_stage       # 한 번에 적재하므로 항목마다 같은 값
+    for i in ok_idx:
+        metrics.observe("stage_rows", dt_stage, prepared[i][4])
+
+    items = []
+    for i, p in enumerate(prepared):
+        item = {"index": i, "name": names[i]}
+        if isinstance(p, BaseException):
+            err = p.detail if isinstance(p, HTTPException) else str(p)
+            item.update(ok=False, error=err)
+        else:
+            W, H = p[0], p[1]
+            model = p[3]["model"] if p[2] is None else p[2]["model"]
+            item.update(_infer_response(request, W, H, staged_by_idx[i], model, p[4]))
+            item.update(ok=item["db_id"] is not None, error=item["db_error"])
+        items.append(item)
+    n_ok = sum(1 for it in items if it["ok"])
+    metrics.observe_request("lane_wear_infer_batch", req_timer)
+    return {"count": len(items), "ok": n_ok, "failed": len(items) - n_ok, "items": items}
+
+# ---------------------------------------------------------
+# 영상 업로드 (블랙박스 클립 → 샘플 프레임별 행)
+# ---------------------------------------------------------
+VIDEO_TIME_STRIDE_S = float(os.getenv("VIDEO_TIME_STRIDE_S", "1.0"))   # 샘플 간격(초), 0 이면 거리 기준만
+VIDEO_DIST_STRIDE_M = float(os.getenv("VIDEO_DIST_STRIDE_M", "10"))    # 샘플 간격(이동 거리 m), 0 이면 시간 기준만
+VIDEO_KEYFRAME_S    = float(os.getenv("VIDEO_KEYFRAME_S", "2.0"))      # 이 간격마다 다시 검출 (그 사이는 추적)
+VIDEO_TRACK_EVERY   = int(os.getenv("VIDEO_TRACK_EVERY", "2"))         # 추적 중일 때 N 프레임마다 광류 갱신
+VIDEO_TRACK_PAD     = float(os.getenv("VIDEO_TRACK_PAD", "0.15"))      # 추적 박스 확장 비율
+VIDEO_MAX_SAMPLES   = int(os.getenv("VIDEO_MAX_SAMPLES", "600"))
+
+@app.post("/lane_wear_infer/video")
+async def lane_wear_infer_video(
+    request: Request,
+    file: UploadFile = File(...),
+    start_time: datetime = Form(...),
+    device_id: str = Form(...),
+    gps_track: Optional[str] = Form(None),
+    gps_lat: Optional[float] = Form(None),
+    gps_lon: Optional[float] = Form(None),
+    time_stride_s: float = Query(VIDEO_TIME_STRIDE_S, ge=0, le=60),
+    dist_stride_m: float = Query(VIDEO_DIST_STRIDE_M, ge=0, le=1000),
+    max_size: int = Query(1280, ge=320, le=4096),
+):
+    """
+    영상에서 시간/이동 거리 간격으로 뽑은 프레임을 블러해 행으로 저장.
+    gps_track: JSON 배열 [{"t": 영상 시작 후 초 | "timestamp": ISO, "lat", "lon"}, ...] (없으면 gps_lat/gps_lon 고정)
+    얼굴/번호판 검출은 키프레임에서만 하고 사이 프레임은 광류 추적 박스로 블러한다.
+    """
+    if time_stride_s <= 0 and dist_stride_m <= 0:
+        raise HTTPException(status_code=400, detail="time_stride_s or dist_stride_m must be > 0")
     try:
-        if db_id is not None:
-            orig_path = os.path.join(ORIG_DIR, f"{db_id}.jpg")
-            overlay_path = os.path.join(OVERLAY_DIR, f"{db_id}.jpg")
-            _save_jpg(orig_path, frame, quality=92)
-            # overlay_img = make_overlay_image(frame, class_masks)
-            # _save_jpg(overlay_path, overlay_img, quality=92)
-            orig_url    = _build_url(request, f"/lane_wear/image/{db_id}/orig")
-            # overlay_url = _build_url(request, f"/lane_wear/image/{db_id}/overlay")
-    except Exception as e:
-        db_error = (db_error + " | " if db_error else "") + f"save_image: {e}"
+        if gps_track:
+            track = GpsTrack.parse(json.loads(gps_track), start_time)
+        elif gps_lat is not None and gps_lon is not None:
+            track = GpsTrack.fixed(gps_lat, gps_lon)
+        else:
+            raise ValueError("gps_track or gps_lat/gps_lon is required")
+    except (KeyError, TypeError, ValueError) as e:
+        raise HTTPException(status_code=400, detail=f"invalid gps: {e}")
+
+    req_timer = StageTimer()
+    models = await pick_models(device_id)      # 한 영상은 한 버전으로 (로딩 중 503 이면 업로드를 디스크에 쓰지 않음)
+    tag = model_tag(models)
+    with req_timer.stage("upload_read"):
+        path, video_key = await save_video_upload(file)
+    it = None
+    samples, pending = [], []
+    try:        # 여기서부터 무엇이 실패해도 임시 파일은 지운다
+        sampler = FrameSampler(path, track, time_stride_s, dist_stride_m, max_edge=max_size,
+                               keyframe_s=VIDEO_KEYFRAME_S, track_every=VIDEO_TRACK_EVERY,
+                               max_samples=VIDEO_MAX_SAMPLES, tracker=BoxTracker(pad=VIDEO_TRACK_PAD))
+        it = iter(sampler)
+        while True:
+            timer = StageTimer()        # 샘플별 (건너뛴 프레임 디코드/추적 포함)
+            try:
+                with timer.stage("decode"):
+                    s = await run_in_threadpool(next, it, None)
+            except ValueError as e:
+                raise HTTPException(status_code=400, detail=f"Invalid video: {e}")
+            if s is None:
+                break
+            if s.keyframe:
+                boxes = await detect_blur_boxes(s.frame, FACE_CONF, PLATE_CONF, BLUR_IOU, max_size,
+                                                models=models, timer=timer)
+                sampler.tracker.reset(s.gray, boxes, sampler.track_scale)
+            else:
+                boxes = sampler.tracker.boxes()
+            variants = await cpu_pool.run(_render_variants, s.frame, boxes, timer)
+            H, W = s.frame.shape[:2]
+            row = _build_row(f"{file.filename}@{s.t:.2f}s", W, H, s.lat, s.lon,
+                             start_time + timedelta(seconds=s.t), device_id, tag, timer.total_ms(),
+                             upload_key=upload_key(f"{video_key}:{s.index}".encode()))
+            timer.stop()
+            samples.append((s.index, s.t, s.keyframe, len(boxes), W, H, timer))
+            pending.append((row, variants))
+    finally:
+        if it is not None:
+            it.close()
+        os.unlink(path)
+    if not samples and sampler.frames_decoded == 0:
+        raise HTTPException(status_code=400, detail="Invalid video: no decodable frames")
 
+    t_stage = time.perf_counter()
+    staged = await run_in_threadpool(_stage_rows, pending, True) if pending else []
+    dt_stage = time.perf_counter() - t_stage
+    items = []
+    for (idx, t, key, n_boxes, W, H, timer), st in zip(samples, staged):
+        metrics.observe("stage_rows", dt_stage, timer)
+        item = {"frame": idx, "t": round(t, 3), "keyframe": key, "boxes": n_boxes}
+        item.update(_infer_response(request, W, H, st, tag, timer))
+        items.append(item)
+    metrics.observe_request("lane_wear_infer_video", req_timer)
     return {
-        # "model": os.path.basename(LANE_MODEL_PATH),
-        "image_size": {"width": W, "height": H},
-        # "runtime_ms": round(elapsed_ms, 2),
-        "runtime_ms": 0,
-        # "overall": {k: (float(v) if isinstance(v, (int, float, np.floating)) else v) for k, v in metrics_all.items()},
-        "overall" :  {1 : 0.1},
-        # "per_class": per_class,
-        "per_class": 1,
-        "db_id": db_id,
-        "db_error": db_error,
-        "orig_url": orig_url,
-        "overlay_url": overlay_url,
+        "fps": sampler.fps,
+        "frames_decoded": sampler.frames_decoded,
+        "sampled": len(items),
+        "keyframes": sum(1 for s in samples if s[2]),
+        "truncated": sampler.truncated,
+        "items": items,
     }
 
 # =========================================================
 # 이미지 서빙
 # =========================================================
+def _image_key(id: int, kind: str) -> Optional[str]:
+    """행에 기록된 저장 키 (flush 전 행은 버퍼에서 찾는다)"""
+    col = lane_wear_results.c[IMAGE_KINDS[kind][0]]
+    pending = ingest_buffer.get_pending(id)
+    if pending is not None:
+        return pending.get(col.name)
+    with engine.connect() as conn:
+        return conn.execute(select(col).where(lane_wear_results.c.id == id)).scalar()
+
 @app.api_route("/lane_wear/image/{id:int}/{kind}", methods=["GET", "HEAD"])
-def get_lane_wear_image_kind(id: int, kind: Literal["orig", "overlay"]):
-    path = os.path.join(ORIG_DIR if kind == "orig" else OVERLAY_DIR, f"{id}.jpg")
-    if not os.path.exists(path):
-        raise HTTPException(404, f"image not found: {kind} {id}")
+def get_lane_wear_image_kind(id: int, kind: Literal["orig", "overlay", "thumb"]):
+    key = _image_key(id, kind)
+    if key:
+        path = image_store.path_for(key)
+        if not image_store.is_ready(path):
+            raise HTTPException(404, f"image not ready: {kind} {id}")
+    else:
+        # 호환: 키가 없는 예전 행은 {id}.jpg 로 해석
+        path = image_store.legacy_path(kind, id)
+        if not os.path.exists(path):
+            raise HTTPException(404, f"image not found: {kind} {id}")
     headers = {"Cache-Control": "public, max-age=86400"}
     return FileResponse(path, media_type="image/jpeg", headers=headers)
 
 @app.api_route("/lane_wear/image/{id:int}", methods=["GET", "HEAD"])
-def get_lane_wear_image_query(id: int, type: Literal["orig", "overlay"] = Query("orig")):
+def get_lane_wear_image_query(id: int, type: Literal["orig", "overlay", "thumb"] = Query("orig")):
     return get_lane_wear_image_kind(id, type)
 
 # =========================================================
@@ -352,33 +1224,64 @@ def _shape_row(row: dict, req: Optional[Request] = None) -> dict:
         "timestamp": row.get("timestamp").isoformat() if row.get("timestamp") else None,
         "device_id": row.get("device_id"),
     }
-    if os.path.exists(os.path.join(ORIG_DIR, f"{rid}.jpg")):
-        d["orig_url"] = _build_url(req, f"/lane_wear/image/{rid}/orig")
-    if os.path.exists(os.path.join(OVERLAY_DIR, f"{rid}.jpg")):
-        d["overlay_url"] = _build_url(req, f"/lane_wear/image/{rid}/overlay")
+    for kind in IMAGE_KINDS:
+        if _image_available(row, kind):
+            d[f"{kind}_url"] = _build_url(req, f"/lane_wear/image/{rid}/{kind}")
     return d
 
 @app.get("/lane_wear/latest")
 def get_lane_wear_latest(request: Request, image_name: Optional[str] = None):
-    stmt = select(lane_wear_results)
-    if image_name:
-        stmt = stmt.where(lane_wear_results.c.image_name == image_name)
-    stmt = stmt.order_by(desc(lane_wear_results.c.created_at)).limit(1)
-    with engine.connect() as conn:
-        row = conn.execute(stmt).mappings().first()
-        if not row: raise HTTPException(404, "no data")
-        return _shape_row(row, request)
+    def compute(_headers):
+        stmt = select(lane_wear_results)
+        if image_name:
+            stmt = stmt.where(lane_wear_results.c.image_name == image_name)
+        stmt = stmt.order_by(desc(lane_wear_results.c.created_at), desc(lane_wear_results.c.id)).limit(1)
+        with engine.connect() as conn:
+            row = conn.execute(stmt).mappings().first()
+            if not row: raise HTTPException(404, "no data")
+            return _shape_row(row, request)
+    return response_cache.respond(request, "/lane_wear/latest",
+                                  {"base": _cache_base(request), "image_name": image_name}, compute)
+
+def _parse_cursor(before: str) -> Tuple[datetime, int]:
+    """before=<created_at ISO>,<id> (쿼리스트링에서 '+' 가 공백으로 바뀐 경우 복원)"""
+    try:
+        ts, rid = before.replace(" ", "+").rsplit(",", 1)
+        return datetime.fromisoformat(ts), int(rid)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="invalid cursor: expected <created_at>,<id>")
+
+def _make_cursor(row: dict) -> Optional[str]:
+    return f"{row['created_at'].isoformat()},{row['id']}" if row.get("created_at") else None
 
 @app.get("/lane_wear/recent")
-def get_lane_wear_recent(request: Request, limit: int = 20, offset: int = 0):
+def get_lane_wear_recent(request: Request, limit: int = 20, offset: int = 0,
+                         before: Optional[str] = None, device_id: Optional[str] = None):
+    """
+    최신순 목록. before=<created_at,id> 를 주면 keyset 페이지(깊은 페이지도 인덱스 범위 읽기),
+    다음 페이지 커서는 X-Next-Cursor 헤더로 전달. offset 은 예전 클라이언트 호환용.
+    """
     limit = max(1, min(limit, 200))
-    with engine.connect() as conn:
-        rows = conn.execute(
-            select(lane_wear_results)
-            .order_by(desc(lane_wear_results.c.created_at))
-            .limit(limit).offset(offset)
-        ).mappings().all()
+    cursor = _parse_cursor(before) if before else None
+    def compute(headers):
+        t = lane_wear_results
+        stmt = select(t)
+        if device_id:
+            stmt = stmt.where(t.c.device_id == device_id)
+        if cursor:
+            stmt = stmt.where(tuple_(t.c.created_at, t.c.id) < tuple_(*cursor))
+        elif offset:
+            stmt = stmt.offset(offset)
+        stmt = stmt.order_by(desc(t.c.created_at), desc(t.c.id)).limit(limit)
+        with engine.connect() as conn:
+            rows = conn.execute(stmt).mappings().all()
+        if len(rows) == limit and _make_cursor(rows[-1]):
+            headers["X-Next-Cursor"] = _make_cursor(rows[-1])
         return [_shape_row(r, request) for r in rows]
+    params = {"base": _cache_base(request), "limit": limit, "offset": None if cursor else offset,
+              "before": _make_cursor({"created_at": cursor[0], "id": cursor[1]}) if cursor else None,
+              "device_id": device_id or None}
+    return response_cache.respond(request, "/lane_wear/recent", params, compute)
 
 @app.get("/lane_wear/{id:int}")
 def get_lane_wear(request: Request, id: int):
@@ -392,83 +1295,85 @@ def get_lane_wear(request: Request, id: int):
 # =========================================================
 # 요약 통계
 # =========================================================
+def _window_stats_raw(conn, window_h: int, warning: float, critical: float) -> Tuple[dict, dict]:
+    """원본 행 기반 창 통계 + 트렌드 (정수가 아닌 임계값일 때만 사용)"""
+    # 창 통계 (NULL 방지: COALESCE)
+    q_window = text(f"""
+        SELECT
+          COUNT(*) AS detections,
+          COUNT(DISTINCT CASE WHEN device_id IS NOT NULL THEN device_id END) AS active_devices,
+          COALESCE(SUM(CASE WHEN (overall->>'wear_score')::float >= :critical THEN 1 ELSE 0 END), 0) AS alerts_critical,
+          COALESCE(SUM(CASE WHEN (overall->>'wear_score')::float >= :warning
+                             AND (overall->>'wear_score')::float < :critical
+                       THEN 1 ELSE 0 END), 0) AS alerts_warning
+        FROM lane_wear_results
+        WHERE created_at >= NOW() - INTERVAL '{int(window_h)} hour'
+    """)
+    row = conn.execute(q_window, {"warning": warning, "critical": critical}).mappings().one()
+
+    # 트렌드 (COUNT(*)는 0을 반환하므로 그대로 OK)
+    q_trend = text(f"""
+        WITH cur AS (
+          SELECT COUNT(*) AS c FROM lane_wear_results
+          WHERE created_at >= NOW() - INTERVAL '{int(window_h)} hour'
+            AND (overall->>'wear_score')::float >= :critical
+        ),
+        prev AS (
+          SELECT COUNT(*) AS p FROM lane_wear_results
+          WHERE created_at >= NOW() - INTERVAL '{int(window_h*2)} hour'
+            AND created_at <  NOW() - INTERVAL '{int(window_h)} hour'
+            AND (overall->>'wear_score')::float >= :critical
+        )
+        SELECT c, p FROM cur, prev;
+    """)
+    t = conn.execute(q_trend, {"critical": critical}).mappings().one()
+    return dict(row), dict(t)
+
+def _window_stats_rollup(conn, window_h: int, warning: float, critical: float) -> Tuple[dict, dict]:
+    """시간 롤업 기반 창 통계 + 트렌드 — O(hours x devices), 정수 임계값이면 원본과 동일"""
+    now = conn.execute(text("SELECT NOW()")).scalar()
+    cur_lo = now - timedelta(hours=int(window_h))
+    prev_lo = now - timedelta(hours=int(window_h) * 2)
+    row = rollups.window_counts(conn, cur_lo, None, warning, critical, idx=0)
+    prev = rollups.window_counts(conn, prev_lo, cur_lo, warning, critical, idx=1)
+    return row, {"c": row["alerts_critical"], "p": prev["alerts_critical"]}
+
 @app.get("/stats/summary")
 def stats_summary(
+    request: Request,
     window_h: int = 24,
     warning: float = 40.0,
     critical: float = 70.0,
-) -> Dict[str, Any]:
+):
+    return response_cache.respond(request, "/stats/summary",
+                                  {"window_h": window_h, "warning": float(warning), "critical": float(critical)},
+                                  lambda _h: _stats_summary(window_h, warning, critical))
+
+def _stats_summary(window_h: int, warning: float, critical: float) -> Dict[str, Any]:
     with engine.begin() as conn:
-        # 창 통계 (NULL 방지: COALESCE)
-        q_window = text(f"""
-            SELECT
-              COUNT(*) AS detections,
-              COUNT(DISTINCT CASE WHEN device_id IS NOT NULL THEN device_id END) AS active_devices,
-              COALESCE(SUM(CASE WHEN (overall->>'wear_score')::float >= :critical THEN 1 ELSE 0 END), 0) AS alerts_critical,
-              COALESCE(SUM(CASE WHEN (overall->>'wear_score')::float >= :warning
-                                 AND (overall->>'wear_score')::float < :critical
-                           THEN 1 ELSE 0 END), 0) AS alerts_warning
-            FROM lane_wear_results
-            WHERE created_at >= NOW() - INTERVAL '{int(window_h)} hour'
-        """)
-        row = conn.execute(q_window, {"warning": warning, "critical": critical}).mappings().one()
+        # 창 통계 + 트렌드: 정수 임계값이면 시간 롤업, 아니면 원본 행
+        window_stats = _window_stats_rollup if rollups.is_exact_threshold(warning, critical) else _window_stats_raw
+        row, t = window_stats(conn, window_h, warning, critical)
+        c = float(t["c"] or 0)
+        p = float(t["p"] or 0)
+        delta = (c - p) / p if p > 0 else (1.0 if c > 0 else None)
 
-        # 디바이스 최신 상태 요약 (NULL 방지)
+        # 디바이스 최신 상태 요약 (NULL 방지) — 기기 상태 테이블의 최신 1건
         q_latest = text("""
-            WITH latest AS (
-              SELECT DISTINCT ON (device_id)
-                device_id, created_at, (overall->>'wear_score')::float AS wear
-              FROM lane_wear_results
-              WHERE device_id IS NOT NULL
-              ORDER BY device_id, created_at DESC
-            )
             SELECT
-              COALESCE(SUM(CASE WHEN wear < :warning THEN 1 ELSE 0 END), 0)                       AS ok,
-              COALESCE(SUM(CASE WHEN wear >= :warning AND wear < :critical THEN 1 ELSE 0 END), 0) AS warning_cnt,
-              COALESCE(SUM(CASE WHEN wear >= :critical THEN 1 ELSE 0 END), 0)                     AS critical_cnt
-            FROM latest;
+              COALESCE(SUM(CASE WHEN wear_ring[1] < :warning THEN 1 ELSE 0 END), 0)                              AS ok,
+              COALESCE(SUM(CASE WHEN wear_ring[1] >= :warning AND wear_ring[1] < :critical THEN 1 ELSE 0 END), 0) AS warning_cnt,
+              COALESCE(SUM(CASE WHEN wear_ring[1] >= :critical THEN 1 ELSE 0 END), 0)                            AS critical_cnt
+            FROM lane_wear_device_state;
         """)
         dev = conn.execute(q_latest, {"warning": warning, "critical": critical}).mappings().one()
 
-        # 트렌드 (COUNT(*)는 0을 반환하므로 그대로 OK)
-        q_trend = text(f"""
-            WITH cur AS (
-              SELECT COUNT(*) AS c FROM lane_wear_results
-              WHERE created_at >= NOW() - INTERVAL '{int(window_h)} hour'
-                AND (overall->>'wear_score')::float >= :critical
-            ),
-            prev AS (
-              SELECT COUNT(*) AS p FROM lane_wear_results
-              WHERE created_at >= NOW() - INTERVAL '{int(window_h*2)} hour'
-                AND created_at <  NOW() - INTERVAL '{int(window_h)} hour'
-                AND (overall->>'wear_score')::float >= :critical
-            )
-            SELECT c, p FROM cur, prev;
-        """)
-        t = conn.execute(q_trend, {"critical": critical}).mappings().one()
-        c = float(t["c"] or 0)
-        p = float(t["p"] or 0)
-        delta = (c - p) / p if p > 0 else (1.0 if c > 0 else None)
-
-        # 유지보수 후보 count (COUNT(*)는 0)
-        q_maint = text("""
-            WITH ranked AS (
-              SELECT device_id, created_at, (overall->>'wear_score')::float AS wear,
-                     ROW_NUMBER() OVER (PARTITION BY device_id ORDER BY created_at DESC) AS rn
-              FROM lane_wear_results
-              WHERE device_id IS NOT NULL
-            ),
-            last3 AS (
-              SELECT device_id,
-                     SUM( (wear >= :critical)::int ) AS crit3,
-                     COUNT(*) AS n
-              FROM ranked
-              WHERE rn <= 3
-              GROUP BY device_id
-            )
+        # 유지보수 후보 count: 최근 3건 모두 critical (기본 임계값이면 미리 계산된 crit3 사용)
+        crit3 = "crit3" if critical == device_state.CRITICAL else f"({device_state.crit3_sql()})"
+        q_maint = text(f"""
             SELECT COUNT(*) AS candidates
-            FROM last3
-            WHERE n = 3 AND crit3 = 3;
+            FROM lane_wear_device_state
+            WHERE array_length(wear_ring, 1) >= 3 AND {crit3} = 3;
         """)
         maint = conn.execute(q_maint, {"critical": critical}).mappings().one()
 
@@ -494,140 +1399,171 @@ def stats_summary(
 # 공간 집계 & 후보 랭크
 # =========================================================
 @app.get("/geo/cells")
-def geo_cells(
+def get_geo_cells(
+    request: Request,
     min_lat: float = Query(...), min_lon: float = Query(...),
     max_lat: float = Query(...), max_lon: float = Query(...),
     step_m: int = Query(50, ge=10, le=500),
     window_h: int = Query(24, ge=1, le=168),
     agg: str = Query("p90", pattern="^(avg|max|p90)$"),
     min_count: int = Query(1, ge=1, le=100),
-) -> Dict[str, Any]:
+):
     if min_lat > max_lat or min_lon > max_lon:
         raise HTTPException(status_code=400, detail="invalid bbox")
-    lat0 = (min_lat + max_lat) / 2.0
-    lat_deg_per_m = 1.0 / 111_320.0
-    lon_deg_per_m = 1.0 / (111_320.0 * math.cos(math.radians(lat0)) + 1e-9)
-    lat_step = step_m * lat_deg_per_m; lon_step = step_m * lon_deg_per_m
+    params = {"min_lat": min_lat, "min_lon": min_lon, "max_lat": max_lat, "max_lon": max_lon,
+              "step_m": step_m, "window_h": window_h, "agg": agg, "min_count": min_count}
+    return response_cache.respond(request, "/geo/cells", params, lambda _h: _geo_cells(**params))
 
+def _geo_cells(min_lat: float, min_lon: float, max_lat: float, max_lon: float,
+               step_m: int, window_h: int, agg: str, min_count: int) -> Dict[str, Any]:
+    # 고정 원점 타일 셀: step_m 에 가장 가까운 줌의 셀 집계를 읽는다 (지도 이동 간 셀 재사용)
+    lat0 = (min_lat + max_lat) / 2.0
+    z = geo_cells.pick_zoom(step_m, lat0)
     with engine.begin() as conn:
-        q = text(f"""
-            WITH raw AS (
-              SELECT
-                FLOOR( (gps_lat - :min_lat) / :lat_step )::int AS cy,
-                FLOOR( (gps_lon - :min_lon) / :lon_step )::int AS cx,
-                (overall->>'wear_score')::float AS wear,
-                "timestamp" AS ts
-              FROM lane_wear_results
-              WHERE gps_lat IS NOT NULL AND gps_lon IS NOT NULL
-                AND created_at >= NOW() - INTERVAL '{int(window_h)} hour'
-                AND gps_lat BETWEEN :min_lat AND :max_lat
-                AND gps_lon BETWEEN :min_lon AND :max_lon
-            ),
-            ag AS (
-              SELECT
-                cy, cx, COUNT(*) AS n,
-                AVG(wear) AS wear_avg,
-                MAX(wear) AS wear_max,
-                PERCENTILE_CONT(0.9) WITHIN GROUP (ORDER BY wear) AS wear_p90,
-                MAX(ts) AS last_ts
-              FROM raw
-              GROUP BY cy, cx
-            )
-            SELECT * FROM ag WHERE n >= :min_count
-        """)
-        rows = conn.execute(q, {"min_lat": min_lat, "max_lat": max_lat,
-                                "min_lon": min_lon, "max_lon": max_lon,
-                                "lat_step": lat_step, "lon_step": lon_step,
-                                "min_count": min_count}).mappings().all()
+        lo = conn.execute(text("SELECT NOW()")).scalar() - timedelta(hours=int(window_h))
+        stats = geo_cells.bbox_cells(conn, z, min_lat, min_lon, max_lat, max_lon, lo)
+
+    def _f(v):
+        return None if v is None else float(v)
 
     cells = []
-    for r in rows:
-        cy, cx = r["cy"], r["cx"]
-        lat = min_lat + (cy + 0.5) * lat_step
-        lon = min_lon + (cx + 0.5) * lon_step
-        rep = r["wear_p90"] if agg == "p90" else (r["wear_max"] if agg == "max" else r["wear_avg"])
+    for (cx, cy), st in sorted(stats.items(), key=lambda kv: (kv[0][1], kv[0][0])):
+        if st.n < min_count:
+            continue
+        lat, lon = geo_cells.tile_center(cx, cy, z)
+        p90 = st.quantile(0.9)
+        rep = p90 if agg == "p90" else (st.wear_max if agg == "max" else st.wear_avg)
         cells.append({
-            "cy": int(cy), "cx": int(cx),
+            "cy": int(cy), "cx": int(cx), "z": z,
             "lat": float(lat), "lon": float(lon),
-            "count": int(r["n"]),
-            "wear_avg": float(r["wear_avg"]),
-            "wear_max": float(r["wear_max"]),
-            "wear_p90": float(r["wear_p90"]),
-            "rep": float(rep),
-            "last_ts": r["last_ts"].isoformat() if r["last_ts"] else None,
+            "count": int(st.n),
+            "wear_avg": _f(st.wear_avg),
+            "wear_max": _f(st.wear_max),
+            "wear_p90": _f(p90),
+            "rep": _f(rep),
+            "last_ts": st.last_ts.isoformat() if st.last_ts else None,
         })
-    return {"bbox": [min_lat, min_lon, max_lat, max_lon], "step_m": step_m, "window_h": window_h, "agg": agg, "cells": cells}
-
-def _priority_formula_sql(window_h: int) -> str:
-    return f"""
-    WITH ranked AS (
-      SELECT id, device_id, created_at, (overall->>'wear_score')::float AS wear,
-             ROW_NUMBER() OVER (PARTITION BY device_id ORDER BY created_at DESC) AS rn
-      FROM lane_wear_results
-      WHERE created_at >= NOW() - INTERVAL '{int(window_h)} hour' AND device_id IS NOT NULL
+    return {"bbox": [min_lat, min_lon, max_lat, max_lon], "step_m": step_m, "window_h": window_h, "agg": agg,
+            "z": z, "cell_m": geo_cells.tile_size_m(z, lat0), "cells": cells}
+
+# ---------------------------------------------------------
+# 벡터 타일 (MVT) — 셀 폴리곤 + 개별 검출 포인트, 디스크 캐시
+# ---------------------------------------------------------
+TILE_CACHE_DIR         = os.getenv("TILE_CACHE_DIR", os.path.join(STORE_ROOT, "tiles"))
+TILE_MAX_ZOOM          = int(os.getenv("TILE_MAX_ZOOM", "22"))
+TILE_CELL_DETAIL       = int(os.getenv("TILE_CELL_DETAIL", "5"))      # 셀 레이어 = 타일 줌 + N
+TILE_DETECTION_MINZOOM = int(os.getenv("TILE_DETECTION_MINZOOM", "16"))
+TILE_MAX_POINTS        = int(os.getenv("TILE_MAX_POINTS", "5000"))
+TILE_MAX_AGE_S         = float(os.getenv("TILE_MAX_AGE_S", "300"))    # 새 행이 없어도 창이 밀리므로 주기적으로 재생성
+
+tile_cache = TileCache(TILE_CACHE_DIR, max_zoom=TILE_MAX_ZOOM, max_age_s=TILE_MAX_AGE_S)
+ingest_buffer.commit_hooks.append(tile_cache.invalidate_rows)
+
+@app.get("/tiles/{z}/{x}/{y}.mvt")
+def get_tile(z: int, x: int, y: int, window_h: int = Query(24, ge=1, le=168)):
+    if not (0 <= z <= TILE_MAX_ZOOM and 0 <= x < (1 << z) and 0 <= y < (1 << z)):
+        raise HTTPException(status_code=404, detail="tile out of range")
+
+    def build():
+        with engine.begin() as conn:
+            lo = conn.execute(text("SELECT NOW()")).scalar() - timedelta(hours=int(window_h))
+            return tiles.build_tile(conn, z, x, y, lo, cell_detail=TILE_CELL_DETAIL,
+                                    detection_min_zoom=TILE_DETECTION_MINZOOM, max_points=TILE_MAX_POINTS)
+
+    data = tile_cache.get(window_h, z, x, y, build)
+    return Response(content=data, media_type=tiles.MEDIA_TYPE, headers={"Cache-Control": "no-cache"})
+
+def _priority_formula_sql(conn, window_h: int) -> Tuple[str, Dict[str, Any]]:
+    """
+    기기 상태 테이블(최근 6건 ring)에서 창 안의 값만 골라 우선순위 계산.
+    창 안의 건수 n 은 시간 롤업에서 읽는다. 반환: (sql, params) — :critical 은 호출 측에서 채움.
+    """
+    now = conn.execute(text("SELECT NOW()")).scalar()
+    lo = now - timedelta(hours=int(window_h))
+    cnt_sql, params = rollups.device_counts_sql(lo)
+    params.update(now=now, lo=lo)
+    sql = f"""
+    WITH st AS (
+      SELECT device_id, last_ts,
+             ARRAY(SELECT wear_ring[i] FROM generate_subscripts(ts_ring, 1) i
+                   WHERE ts_ring[i] >= :lo ORDER BY i) AS w
+      FROM lane_wear_device_state
+      WHERE last_ts >= :lo
     ),
+    cnt AS ({cnt_sql}),
     agg AS (
-      SELECT device_id,
-             MAX(CASE WHEN rn=1 THEN wear END)               AS w_last,
-             AVG(CASE WHEN rn<=3 THEN wear END)              AS w_last3,
-             AVG(CASE WHEN rn BETWEEN 4 AND 6 THEN wear END) AS w_prev3,
-             SUM(CASE WHEN rn<=3 AND wear >= :critical THEN 1 ELSE 0 END) AS crit3,
-             COUNT(*) AS n,
-             MAX(created_at) AS last_ts
-      FROM ranked GROUP BY device_id
+      SELECT st.device_id,
+             w[1]                                                      AS w_last,
+             (SELECT AVG(x) FROM unnest(w[1:3]) AS x)                  AS w_last3,
+             (SELECT AVG(x) FROM unnest(w[4:6]) AS x)                  AS w_prev3,
+             (SELECT COUNT(*) FROM unnest(w[1:3]) AS x WHERE x >= :critical) AS crit3,
+             COALESCE(cnt.n, 0) AS n,
+             st.last_ts
+      FROM st LEFT JOIN cnt ON cnt.device_id = st.device_id
     ),
     score AS (
       SELECT device_id, w_last, w_last3, w_prev3,
              COALESCE(w_last3 - COALESCE(w_prev3, w_last3), 0) AS trend,
              crit3, n, last_ts,
-             EXTRACT(EPOCH FROM (NOW() - last_ts))/3600.0 AS hours_since,
+             EXTRACT(EPOCH FROM (:now - last_ts))/3600.0 AS hours_since,
              (
                0.50 * LEAST(GREATEST(w_last,0),100)/100.0 +
                0.20 * (COALESCE(w_last3 - COALESCE(w_prev3, w_last3),0)/100.0) +
                0.20 * (crit3/3.0) +
                0.10 * LEAST(n/10.0, 1.0)
-             ) * EXP(- LEAST(EXTRACT(EPOCH FROM (NOW() - last_ts))/3600.0, 168)/72.0)
+             ) * EXP(- LEAST(EXTRACT(EPOCH FROM (:now - last_ts))/3600.0, 168)/72.0)
              AS priority
       FROM agg
     )
     SELECT * FROM score
     """
+    return sql, params
+
+RANK_REFRESH_S = float(os.getenv("RANK_REFRESH_S", "5"))     # 적재 후 재계산 최소 간격
+RANK_MAX_AGE_S = float(os.getenv("RANK_MAX_AGE_S", "60"))    # 적재가 없어도 이 주기로 재계산 (시간 감쇠 반영)
+RANK_CACHE_KEYS = [(int(w), float(c)) for w, c in
+                   (p.split(":") for p in os.getenv("RANK_CACHE_KEYS", "168:70").split(",") if p.strip())]
+
+def _shape_rank(r) -> Dict[str, Any]:
+    return {"device_id": r["device_id"], "priority": float(r["priority"] or 0.0),
+            "w_last": float(r["w_last"] or 0.0), "trend": float(r["trend"] or 0.0),
+            "crit3": int(r["crit3"] or 0), "n": int(r["n"] or 0),
+            "last_ts": r["last_ts"].isoformat() if r["last_ts"] else None,
+            "hours_since": float(r["hours_since"] or 0.0), "rank": int(r["rank"])}
+
+def _build_rank_snapshot(window_h: int, critical: float) -> List[Dict[str, Any]]:
+    with engine.begin() as conn:
+        sql, params = _priority_formula_sql(conn, window_h)
+        rows = conn.execute(text(f"""
+            SELECT s.*, RANK() OVER (ORDER BY COALESCE(s.priority, 0) DESC) AS rank
+            FROM ({sql}) s
+            ORDER BY rank, s.device_id
+        """), {**params, "critical": critical}).mappings().all()
+    return [_shape_rank(r) for r in rows]
+
+rank_cache = RankCache(_build_rank_snapshot, refresh_s=RANK_REFRESH_S, max_age_s=RANK_MAX_AGE_S,
+                       pinned=RANK_CACHE_KEYS)
+ingest_buffer.commit_hooks.append(rank_cache.invalidate)
+
+_RANK_ROW_FIELDS = ("device_id", "priority", "w_last", "trend", "crit3", "n", "last_ts")
 
 @app.get("/candidates/rank")
 def candidates_rank(window_h: int = 168, critical: float = 70.0, limit: int = 20, offset: int = 0):
-    sql = _priority_formula_sql(window_h) + " ORDER BY priority DESC LIMIT :limit OFFSET :offset"
-    with engine.begin() as conn:
-        rows = conn.execute(text(sql), {"critical": critical, "limit": limit, "offset": offset}).mappings().all()
-    return [
-        {"device_id": r["device_id"], "priority": float(r["priority"] or 0.0),
-         "w_last": float(r["w_last"] or 0.0), "trend": float(r["trend"] or 0.0),
-         "crit3": int(r["crit3"] or 0), "n": int(r["n"] or 0),
-         "last_ts": r["last_ts"].isoformat() if r["last_ts"] else None,
-         "hours_since": float(r["hours_since"] or 0.0)}
-        for r in rows
-    ]
+    snap = rank_cache.get(window_h, critical)
+    return [{k: v for k, v in r.items() if k != "rank"} for r in snap.page(limit, offset)]
 
 @app.get("/candidates/rank_for_id/{id:int}")
 def candidate_rank_for_id(id: int, window_h: int = 168, critical: float = 70.0):
     with engine.begin() as conn:
         row = conn.execute(select(lane_wear_results.c.device_id).where(lane_wear_results.c.id == id)).first()
     if not row or not row[0]: return {"rank": None, "total": 0, "row": None}
-    device_id = row[0]
-    sql_all = _priority_formula_sql(window_h)
-    with engine.begin() as conn:
-        all_rows = conn.execute(text(sql_all), {"critical": critical}).mappings().all()
-    all_rows = sorted(all_rows, key=lambda r: (r["priority"] or 0.0), reverse=True)
-    total = len(all_rows)
-    rank = next((i+1 for i, r in enumerate(all_rows) if r["device_id"] == device_id), None)
-    cur = next((r for r in all_rows if r["device_id"] == device_id), None)
-    if cur is None: return {"rank": None, "total": total, "row": None}
+    snap = rank_cache.get(window_h, critical)
+    cur = snap.get(row[0])
+    if cur is None: return {"rank": None, "total": snap.total, "row": None}
     def _shape(r):
-        return {"device_id": r["device_id"], "priority": float(r["priority"] or 0.0),
-                "w_last": float(r["w_last"] or 0.0), "trend": float(r["trend"] or 0.0),
-                "crit3": int(r["crit3"] or 0), "n": int(r["n"] or 0),
-                "last_ts": r["last_ts"].isoformat() if r["last_ts"] else None}
-    top10 = [_shape(r) for r in all_rows[:10]]
-    return {"rank": rank, "total": total, "row": _shape(cur), "top10": top10}
+        return {k: r[k] for k in _RANK_ROW_FIELDS}
+    top10 = [_shape(r) for r in snap.page(10)]
+    return {"rank": cur["rank"], "total": snap.total, "row": _shape(cur), "top10": top10}
 
 HTML_FILE_PATH = "./templates/index.html"
 
@@ -0,0 +1,170 @@
+# manage.py
+# 운영용 일회성 명령 모음
+#   python manage.py backfill-image-flags [--thumbs] [--batch 1000]
+#   python manage.py backfill-rollups
+#   python manage.py backfill-device-state
+#   python manage.py backfill-geo-cells
+#   python manage.py maintain-partitions [--retention 12]
+#   python manage.py export-models
+#   python manage.py deploy-model lp ./model/lp-v3.pt [--percent 10]
+#   python manage.py promote-model lp | rollback-model lp
+#   MODEL_SERVER_ADDR=/run/seedrive/model.sock MODEL_SERVER_AUTHKEY=... python manage.py model-server
+import argparse
+import json
+import os
+
+import cv2
+from sqlalchemy import select, update
+
+import device_state
+import geo_cells
+import main
+import model_backend
+import model_registry
+import rollups
+from image_store import write_atomic
+from main import engine, lane_wear_results, image_store, IMAGE_KINDS
+
+
+def backfill_image_flags(batch: int = 1000, thumbs: bool = False):
+    """has_orig/has_overlay/has_thumb 가 비어 있는 예전 행을 파일 확인으로 채운다 (한 번만 실행)"""
+    t = lane_wear_results
+    last_id, done = 0, 0
+    while True:
+        with engine.connect() as conn:
+            rows = conn.execute(
+                select(t.c.id, t.c.orig_key, t.c.overlay_key, t.c.thumb_key)
+                .where(t.c.id > last_id, t.c.has_orig.is_(None))
+                .order_by(t.c.id).limit(batch)
+            ).mappings().all()
+        if not rows:
+            break
+        updates = []
+        for r in rows:
+            vals = {"id": r["id"]}
+            for kind, (key_col, flag_col) in IMAGE_KINDS.items():
+                vals[flag_col] = os.path.exists(image_store.resolve(kind, r["id"], r[key_col]))
+            if thumbs and vals["has_orig"] and not vals["has_thumb"]:
+                img = cv2.imread(image_store.resolve("orig", r["id"], r["orig_key"]))
+                if img is not None:
+                    data = main.cv2_to_jpeg_bytes(main.resize_long_edge_bgr(img, main.THUMB_EDGE), quality=80)
+                    key = image_store.key_for(data)
+                    write_atomic(image_store.path_for(key), data)
+                    vals.update(thumb_key=key, has_thumb=True)
+            updates.append(vals)
+        with engine.begin() as conn:
+            for vals in updates:
+                rid = vals.pop("id")
+                conn.execute(update(t).where(t.c.id == rid).values(**vals))
+        last_id = rows[-1]["id"]; done += len(rows)
+        print(f"backfill-image-flags: {done} rows (last id {last_id})")
+    return done
+
+
+def backfill_rollups():
+    """시간 롤업을 원본 테이블에서 다시 계산"""
+    with engine.begin() as conn:
+        rollups.rebuild(conn)
+    print("backfill-rollups: done")
+
+
+def backfill_device_state():
+    """기기별 최신 상태 테이블을 원본 테이블에서 다시 계산"""
+    with engine.begin() as conn:
+        device_state.rebuild(conn)
+    print("backfill-device-state: done")
+
+
+def backfill_geo_cells():
+    """geo_cell 이 비어 있는 행을 채우고 셀 집계를 다시 계산"""
+    with engine.begin() as conn:
+        geo_cells.backfill_cells(conn)
+        geo_cells.rebuild(conn)
+    print("backfill-geo-cells: done")
+
+
+def maintain_partitions(retention: int = None):
+    """미래 월 파티션 생성 + 만료 파티션 Parquet 보관을 지금 한 번 실행"""
+    m = main.partition_maintainer
+    if retention is not None:
+        m.retention_months = retention
+    ok, archived = m.run_once()
+    print("maintain-partitions:", "done" if ok else "skipped (another worker holds the lock)", archived)
+
+
+def export_models():
+    """MODEL_BACKEND 변환 결과를 미리 만든다 (배포 시 첫 요청 지연 방지)"""
+    reg = main.model_registry
+    kinds = [k for k in reg.kinds() if k != "vehicle" or main.PLATE_CASCADE]
+    paths = [reg.path_for(k) for k in kinds] + [reg.candidate_for(k)["path"] for k in kinds if reg.candidate_for(k)]
+    for path in dict.fromkeys(paths):
+        out = model_backend.ensure_artifact(path, main.MODEL_BACKEND, imgsz=main.MODEL_EXPORT_IMGSZ, int8=main.MODEL_INT8,
+                                            calib_dir=main.MODEL_CALIB_DIR or None, calib_max=main.MODEL_CALIB_MAX)
+        print(f"export-models: {path} -> {out}")
+
+
+def edit_model_registry(kind: str, path: str = None, percent: float = None,
+                        promote: bool = False, clear_candidate: bool = False):
+    """레지스트리 설정 파일 수정 — 각 워커가 MODEL_REGISTRY_POLL_S 안에 로드/warmup 후 교체한다"""
+    cfg_path = main.MODEL_REGISTRY_FILE
+    if not cfg_path:
+        raise SystemExit("MODEL_REGISTRY_FILE is empty (registry disabled)")
+    if path and not os.path.isfile(path):
+        raise SystemExit(f"model not found: {path}")
+    cfg = model_registry.edit_config(model_registry.read_config_file(cfg_path), kind, path=path, percent=percent,
+                                     promote=promote, clear_candidate=clear_candidate)
+    write_atomic(cfg_path, json.dumps(cfg, ensure_ascii=False, indent=2).encode("utf-8"))
+    print(f"{cfg_path}: {kind} -> {json.dumps(cfg[kind], ensure_ascii=False)}")
+
+
+def main_cli(argv=None):
+    ap = argparse.ArgumentParser(description="See: Drive 서버 관리 명령")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    p = sub.add_parser("backfill-image-flags", help="예전 행의 이미지 존재 플래그 채우기")
+    p.add_argument("--batch", type=int, default=1000)
+    p.add_argument("--thumbs", action="store_true", help="썸네일이 없으면 원본으로 생성")
+    sub.add_parser("backfill-rollups", help="시간 롤업 테이블 재계산")
+    sub.add_parser("backfill-device-state", help="기기별 최신 상태 테이블 재계산")
+    sub.add_parser("backfill-geo-cells", help="공간 셀 id 채우기 + 셀 집계 재계산")
+    p = sub.add_parser("maintain-partitions", help="월 파티션 생성 + 만료 파티션 보관")
+    p.add_argument("--retention", type=int, default=None, help="보관 기준 개월 수 (기본 PART_RETENTION_MONTHS)")
+    sub.add_parser("export-models", help="MODEL_BACKEND 형식으로 모델 변환 (캐시)")
+    kinds = list(main.model_registry.kinds())
+    p = sub.add_parser("deploy-model", help="새 가중치 배포 (--percent < 100 이면 A/B candidate)")
+    p.add_argument("kind", choices=kinds)
+    p.add_argument("path")
+    p.add_argument("--percent", type=float, default=None, help="candidate 로 보낼 요청 비율 (기본: 전체 교체)")
+    p = sub.add_parser("promote-model", help="candidate 를 active 로")
+    p.add_argument("kind", choices=kinds)
+    p = sub.add_parser("rollback-model", help="candidate 제거")
+    p.add_argument("kind", choices=kinds)
+    sub.add_parser("model-server", help="모델을 들고 워커 요청을 받는 로컬 모델 서버 실행 (MODEL_SERVER_ADDR)")
+    args = ap.parse_args(argv)
+
+    if args.cmd == "export-models":
+        return export_models()
+    if args.cmd == "deploy-model":
+        return edit_model_registry(args.kind, path=args.path, percent=args.percent)
+    if args.cmd == "promote-model":
+        return edit_model_registry(args.kind, promote=True)
+    if args.cmd == "rollback-model":
+        return edit_model_registry(args.kind, clear_candidate=True)
+    if args.cmd == "model-server":
+        if not main.MODEL_SERVER_ADDR:
+            raise SystemExit("MODEL_SERVER_ADDR is not set")
+        return main.serve_models()
+    main.ensure_schema()
+    if args.cmd == "backfill-image-flags":
+        backfill_image_flags(batch=args.batch, thumbs=args.thumbs)
+    elif args.cmd == "backfill-rollups":
+        backfill_rollups()
+    elif args.cmd == "backfill-device-state":
+        backfill_device_state()
+    elif args.cmd == "backfill-geo-cells":
+        backfill_geo_cells()
+    elif args.cmd == "maintain-partitions":
+        maintain_partitions(retention=args.retention)
+
+
+if __name__ == "__main__":
+    main_cli()
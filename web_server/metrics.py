@@ -0,0 +1,126 @@
+# metrics.py
+# 처리 단계별 지연 / 큐 길이 / 모델 로드 시간 → Prometheus 텍스트 (/metrics).
+# - 여러 uvicorn 워커(+ 모델 서버)는 PROMETHEUS_MULTIPROC_DIR 를 같은 폴더로 주면 값이 합쳐진다
+#   (prometheus_client import 전에 설정되어 있어야 하고, 서버 시작 전에 폴더를 비워야 한다)
+# - StageTimer: 요청/항목 하나의 단계별 시간을 모아 응답 timings_ms / runtime_ms 에 쓰고, 같은 값을 히스토그램에도 기록
+# - 적재(db_insert)와 이미지 저장(image_save)은 요청이 기다리지 않는 write-behind 작업이라 실제로 쓰는 스레드에서 잰다
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, Optional, Tuple
+
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram, generate_latest
+from prometheus_client import multiprocess
+
+_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+STAGE_SECONDS = Histogram("seedrive_stage_seconds", "Time spent per pipeline stage", ["stage"], buckets=_BUCKETS)
+REQUEST_SECONDS = Histogram("seedrive_request_seconds", "End-to-end handler time", ["endpoint"], buckets=_BUCKETS)
+INFER_BATCH_SECONDS = Histogram("seedrive_infer_batch_seconds", "Model predict time per micro-batch", ["kind"],
+                                buckets=_BUCKETS)
+INFER_BATCH_SIZE = Histogram("seedrive_infer_batch_size", "Frames per micro-batch", ["kind"],
+                             buckets=(1, 2, 4, 8, 16, 32, 64))
+QUEUE_DEPTH = Gauge("seedrive_queue_depth", "Items waiting per queue", ["queue"], multiprocess_mode="livesum")
+MODEL_LOAD_SECONDS = Gauge("seedrive_model_load_seconds", "Time to load a model version", ["kind", "version"],
+                           multiprocess_mode="max")
+PLATE_PATH_FRAMES = Counter("seedrive_plate_path_frames", "Frames per plate cascade path", ["path"])
+
+
+@contextmanager
+def timed(stage: str, timer: Optional["StageTimer"] = None) -> Iterator[None]:
+    """단계 시간을 히스토그램에 기록 (timer 가 있으면 요청별 합계에도 더함)"""
+    t = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(stage, time.perf_counter() - t, timer)
+
+
+def observe(stage: str, seconds: float, timer: Optional["StageTimer"] = None):
+    STAGE_SECONDS.labels(stage).observe(seconds)
+    if timer is not None:
+        timer.stages[stage] = timer.stages.get(stage, 0.0) + seconds * 1000.0
+        if timer.t_end is not None:       # 멈춘 뒤 더한 단계(일괄 적재 등)는 합계에도 더한다
+            timer.t_end += seconds
+
+
+class StageTimer:
+    """요청/항목 하나의 단계별 시간(ms). 단계는 순서대로 기록되고, 같은 단계가 여러 번이면 더한다."""
+
+    def __init__(self):
+        self.t0 = time.perf_counter()
+        self.t_end: Optional[float] = None
+        self.stages: Dict[str, float] = {}
+
+    def stage(self, name: str):
+        return timed(name, self)
+
+    def stop(self):
+        """항목 처리가 끝난 시점에서 합계를 멈춘다 (다른 항목을 기다린 시간은 빼기 위해)"""
+        self.t_end = time.perf_counter()
+
+    def total_ms(self) -> float:
+        end = self.t_end if self.t_end is not None else time.perf_counter()
+        return (end - self.t0) * 1000.0
+
+    def timings_ms(self) -> Dict[str, float]:
+        return {k: round(v, 2) for k, v in self.stages.items()}
+
+
+def observe_request(endpoint: str, timer: StageTimer):
+    REQUEST_SECONDS.labels(endpoint).observe(timer.total_ms() / 1000.0)
+
+
+# ---------------------------------------------------------
+# 큐 길이 샘플링 (워커별 게이지를 주기적으로 갱신 → 멀티프로세스에서 livesum)
+# ---------------------------------------------------------
+class QueueSampler:
+    def __init__(self, sample: Callable[[], Dict[str, int]], interval_s: float = 1.0):
+        self.sample = sample
+        self.interval_s = max(0.1, float(interval_s))
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def update(self):
+        for name, depth in self.sample().items():
+            QUEUE_DEPTH.labels(name).set(depth)
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name="metrics-sampler", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 2.0):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _loop(self):
+        while not self._stop.wait(self.interval_s):
+            try:
+                self.update()
+            except Exception as e:
+                print("metrics sampler failed:", e)
+
+
+# ---------------------------------------------------------
+# 노출
+# ---------------------------------------------------------
+def _multiproc_dir() -> Optional[str]:
+    return os.environ.get("PROMETHEUS_MULTIPROC_DIR") or os.environ.get("prometheus_multiproc_dir")
+
+
+def render() -> Tuple[bytes, str]:
+    """(본문, content-type). 멀티프로세스면 모든 프로세스 값을 합친다"""
+    if _multiproc_dir():
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
+
+
+def mark_process_dead():
+    """종료하는 프로세스의 live 게이지를 합계에서 뺀다"""
+    if _multiproc_dir():
+        multiprocess.mark_process_dead(os.getpid())
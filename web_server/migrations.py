@@ -0,0 +1,97 @@
+# migrations.py
+# 버전 관리되는 스키마 마이그레이션. on_startup 에서 migrate(engine) 으로 실행된다.
+# - schema_migrations 테이블에 적용된 버전을 기록하고, 새 버전만 순서대로 적용한다.
+# - 여러 워커가 동시에 기동해도 advisory lock 으로 한 번만 적용된다.
+# - 각 단계는 IF NOT EXISTS 로 작성해 create_all 로 새로 만든 테이블에도 안전하게 돌 수 있게 한다.
+from typing import Callable, List, Tuple, Union
+
+from sqlalchemy import text
+from sqlalchemy.engine import Connection, Engine
+
+import device_state
+import geo_cells
+import partitions
+import rollups
+
+Step = Union[str, Callable[[Connection], None]]
+Migration = Tuple[int, str, List[Step]]
+
+_LOCK_KEY = 0x5EED_D21E
+
+MIGRATIONS: List[Migration] = [
+    (1, "image storage keys", [
+        "ALTER TABLE lane_wear_results ADD COLUMN IF NOT EXISTS orig_key VARCHAR(64)",
+        "ALTER TABLE lane_wear_results ADD COLUMN IF NOT EXISTS overlay_key VARCHAR(64)",
+        "CREATE INDEX IF NOT EXISTS ix_lane_wear_results_orig_key ON lane_wear_results (orig_key)",
+    ]),
+    (2, "image variant flags", [
+        "ALTER TABLE lane_wear_results ADD COLUMN IF NOT EXISTS thumb_key VARCHAR(64)",
+        "ALTER TABLE lane_wear_results ADD COLUMN IF NOT EXISTS has_orig BOOLEAN",
+        "ALTER TABLE lane_wear_results ADD COLUMN IF NOT EXISTS has_overlay BOOLEAN",
+        "ALTER TABLE lane_wear_results ADD COLUMN IF NOT EXISTS has_thumb BOOLEAN",
+    ]),
+    (3, "lane_wear_results query indexes", [
+        # 최신순 목록 + keyset 페이지 (created_at, id)
+        "CREATE INDEX IF NOT EXISTS ix_lane_wear_results_created_at ON lane_wear_results (created_at, id)",
+        # 기기별 최신 N건
+        "CREATE INDEX IF NOT EXISTS ix_lane_wear_results_device_created ON lane_wear_results (device_id, created_at DESC)",
+        # /lane_wear/latest?image_name=
+        "CREATE INDEX IF NOT EXISTS ix_lane_wear_results_image_name ON lane_wear_results (image_name, created_at DESC)",
+        # 마모 점수 임계값 필터
+        "CREATE INDEX IF NOT EXISTS ix_lane_wear_results_wear_score ON lane_wear_results (((overall->>'wear_score')::float))",
+    ]),
+    (4, "hourly rollups", rollups.DDL + [rollups.rebuild]),
+    (5, "device latest state", device_state.DDL + [device_state.rebuild]),
+    (6, "geo cells", [
+        "ALTER TABLE lane_wear_results ADD COLUMN IF NOT EXISTS geo_cell BIGINT",
+        "CREATE INDEX IF NOT EXISTS ix_lane_wear_results_geo_cell ON lane_wear_results (geo_cell)",
+    ] + geo_cells.DDL + [geo_cells.backfill_cells, geo_cells.rebuild]),
+    (7, "monthly partitions", [
+        # 기존 단일 테이블이면 파티션 테이블로 옮겨 담고(기존 인덱스는 함께 삭제됨) 인덱스를 부모에 다시 만든다
+        partitions.convert_to_partitioned,
+        "CREATE INDEX IF NOT EXISTS ix_lane_wear_results_orig_key ON lane_wear_results (orig_key)",
+        "CREATE INDEX IF NOT EXISTS ix_lane_wear_results_created_at ON lane_wear_results (created_at, id)",
+        "CREATE INDEX IF NOT EXISTS ix_lane_wear_results_device_created ON lane_wear_results (device_id, created_at DESC)",
+        "CREATE INDEX IF NOT EXISTS ix_lane_wear_results_image_name ON lane_wear_results (image_name, created_at DESC)",
+        "CREATE INDEX IF NOT EXISTS ix_lane_wear_results_wear_score ON lane_wear_results (((overall->>'wear_score')::float))",
+        "CREATE INDEX IF NOT EXISTS ix_lane_wear_results_geo_cell ON lane_wear_results (geo_cell)",
+        partitions.ensure_partitions,
+    ]),
+    (8, "upload dedup key", [
+        # 재전송 중복 확인 (기기 + 업로드 원본 sha256) — 디코드/추론 전에 조회
+        "ALTER TABLE lane_wear_results ADD COLUMN IF NOT EXISTS upload_key VARCHAR(64)",
+        "CREATE INDEX IF NOT EXISTS ix_lane_wear_results_device_upload ON lane_wear_results (device_id, upload_key)",
+    ]),
+]
+
+
+def _run_step(conn: Connection, step: Step):
+    if callable(step):
+        step(conn)
+    else:
+        conn.execute(text(step))
+
+
+def migrate(engine: Engine, migrations: List[Migration] = MIGRATIONS) -> List[int]:
+    """적용되지 않은 마이그레이션을 순서대로 적용하고 새로 적용한 버전 목록 반환"""
+    applied_now = []
+    with engine.begin() as conn:
+        conn.execute(text("SELECT pg_advisory_xact_lock(:k)"), {"k": _LOCK_KEY})
+        conn.execute(text("""
+            CREATE TABLE IF NOT EXISTS schema_migrations (
+              version INTEGER PRIMARY KEY,
+              name TEXT NOT NULL,
+              applied_at TIMESTAMPTZ NOT NULL DEFAULT CURRENT_TIMESTAMP
+            )
+        """))
+        done = set(conn.execute(text("SELECT version FROM schema_migrations")).scalars().all())
+        for version, name, steps in sorted(migrations, key=lambda m: m[0]):
+            if version in done:
+                continue
+            with conn.begin_nested():
+                for step in steps:
+                    _run_step(conn, step)
+                conn.execute(text("INSERT INTO schema_migrations (version, name) VALUES (:v, :n)"),
+                             {"v": version, "n": name})
+            applied_now.append(version)
+    return applied_now
@@ -0,0 +1,165 @@
+# model_backend.py
+# YOLO 추론 백엔드 선택 (MODEL_BACKEND = torch | onnx | openvino).
+# - onnx / openvino 는 처음 로드할 때 .pt 가중치를 Ultralytics export 로 변환하고, 가중치 옆에 캐시한다
+#   (가중치가 더 새로우면 다시 변환). 여러 워커가 동시에 변환하지 않도록 파일 잠금을 건다.
+# - 변환된 모델도 YOLO(...) 로 다시 열기 때문에 predict 결과(Results, boxes.xyxy)는 .pt 와 같은 형태다.
+# - MODEL_INT8=1 이면 MODEL_CALIB_DIR 이미지로 INT8 정적 양자화
+#   (openvino: Ultralytics/NNCF, onnx: onnxruntime.quantization)
+import fcntl
+import glob
+import os
+import re
+import shutil
+import tempfile
+from contextlib import contextmanager
+from typing import Iterator, List, Optional
+
+import cv2
+import numpy as np
+
+BACKENDS = ("torch", "onnx", "openvino")
+CALIB_EXTS = (".jpg", ".jpeg", ".png", ".bmp")
+
+
+def artifact_path(weights: str, backend: str, int8: bool = False) -> str:
+    """캐시된 변환 결과 경로 (onnx: 파일, openvino: 디렉터리)"""
+    stem = os.path.splitext(weights)[0]
+    if backend == "onnx":
+        return f"{stem}.int8.onnx" if int8 else f"{stem}.onnx"
+    if backend == "openvino":
+        return f"{stem}_int8_openvino_model" if int8 else f"{stem}_openvino_model"
+    return weights
+
+
+def _is_fresh(artifact: str, weights: str) -> bool:
+    if not os.path.exists(artifact):
+        return False
+    return os.path.getmtime(artifact) >= os.path.getmtime(weights)
+
+
+@contextmanager
+def _export_lock(artifact: str) -> Iterator[None]:
+    with open(artifact + ".lock", "w") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def calibration_images(calib_dir: str, limit: int) -> List[str]:
+    files = sorted(p for p in glob.glob(os.path.join(calib_dir, "**", "*"), recursive=True)
+                   if p.lower().endswith(CALIB_EXTS))
+    if not files:
+        raise FileNotFoundError(f"no calibration images in {calib_dir}")
+    return files[:limit]
+
+
+# ---------------------------------------------------------
+# 변환
+# ---------------------------------------------------------
+def _export_onnx(weights: str, out: str, imgsz: int):
+    from ultralytics import YOLO
+
+    path = YOLO(weights).export(format="onnx", imgsz=imgsz, dynamic=True, simplify=True, verbose=False)
+    if os.path.abspath(path) != os.path.abspath(out):
+        os.replace(path, out)
+
+
+def _letterbox(img: np.ndarray, imgsz: int) -> np.ndarray:
+    """Ultralytics 전처리와 같은 정사각 letterbox → NCHW float32 RGB [0, 1]"""
+    h, w = img.shape[:2]
+    s = imgsz / max(h, w)
+    nw, nh = int(round(w * s)), int(round(h * s))
+    canvas = np.full((imgsz, imgsz, 3), 114, np.uint8)
+    top, left = (imgsz - nh) // 2, (imgsz - nw) // 2
+    canvas[top:top + nh, left:left + nw] = cv2.resize(img, (nw, nh), interpolation=cv2.INTER_LINEAR)
+    return canvas[:, :, ::-1].transpose(2, 0, 1)[None].astype(np.float32) / 255.0
+
+
+def _quantize_onnx(fp32: str, out: str, calib_dir: str, imgsz: int, limit: int):
+    import onnx
+    from onnxruntime.quantization import CalibrationDataReader, QuantType, quantize_static
+
+    files = calibration_images(calib_dir, limit)
+    graph = onnx.load(fp32, load_external_data=False).graph
+    input_name = graph.input[0].name
+    # 검출 헤드의 후처리(DFL/디코드/Concat)는 박스 좌표(수백 px)와 점수(0~1)가 한 텐서에 섞여
+    # 양자화하면 점수가 뭉개진다 → 헤드는 Conv 만 양자화
+    heads = [int(m.group(1)) for m in (re.match(r"^/model\.(\d+)/", n.name) for n in graph.node) if m]
+    head = f"/model.{max(heads)}/" if heads else None
+    exclude = [n.name for n in graph.node if head and n.name.startswith(head) and n.op_type != "Conv"]
+
+    class _Reader(CalibrationDataReader):
+        def __init__(self):
+            self._it = iter(files)
+
+        def get_next(self):
+            for p in self._it:
+                img = cv2.imread(p, cv2.IMREAD_COLOR)
+                if img is not None:
+                    return {input_name: _letterbox(img, imgsz)}
+            return None
+
+    tmp = out + ".tmp"
+    quantize_static(fp32, tmp, _Reader(), activation_type=QuantType.QUInt8, weight_type=QuantType.QInt8,
+                    per_channel=True, nodes_to_exclude=exclude)
+    # Ultralytics 가 클래스 이름/stride 등을 읽는 메타데이터를 옮긴다
+    src, dst = onnx.load(fp32), onnx.load(tmp)
+    del dst.metadata_props[:]
+    dst.metadata_props.extend(src.metadata_props)
+    onnx.save(dst, tmp)
+    os.replace(tmp, out)
+
+
+def _export_openvino(weights: str, out: str, imgsz: int, int8: bool, calib_dir: Optional[str], limit: int):
+    from ultralytics import YOLO
+
+    kwargs = dict(format="openvino", imgsz=imgsz, dynamic=True, verbose=False)
+    with tempfile.TemporaryDirectory() as tmp:
+        if int8:
+            # Ultralytics INT8 보정은 데이터셋 yaml 을 받으므로 보정 폴더를 가리키는 yaml 을 만든다
+            calibration_images(calib_dir, limit)
+            data = os.path.join(tmp, "calib.yaml")
+            with open(data, "w") as f:
+                f.write(f"path: {os.path.abspath(calib_dir)}\ntrain: .\nval: .\nnames:\n  0: object\n")
+            kwargs.update(int8=True, data=data, fraction=1.0)
+        path = YOLO(weights).export(**kwargs)
+    if os.path.abspath(path) != os.path.abspath(out):
+        shutil.rmtree(out, ignore_errors=True)
+        os.replace(path, out)
+
+
+def ensure_artifact(weights: str, backend: str, imgsz: int = 1280, int8: bool = False,
+                    calib_dir: Optional[str] = None, calib_max: int = 300) -> str:
+    """변환 결과가 없거나 오래됐으면 만들고 경로 반환"""
+    if backend not in BACKENDS:
+        raise ValueError(f"unknown MODEL_BACKEND: {backend}")
+    if backend == "torch":
+        return weights
+    if int8 and not calib_dir:
+        raise ValueError("MODEL_INT8=1 requires MODEL_CALIB_DIR")
+    out = artifact_path(weights, backend, int8)
+    if _is_fresh(out, weights):
+        return out
+    with _export_lock(out):
+        if _is_fresh(out, weights):     # 다른 워커가 먼저 변환
+            return out
+        print(f"exporting {weights} -> {out}")
+        if backend == "onnx":
+            fp32 = artifact_path(weights, "onnx")
+            if not _is_fresh(fp32, weights):
+                _export_onnx(weights, fp32, imgsz)
+            if int8:
+                _quantize_onnx(fp32, out, calib_dir, imgsz, calib_max)
+        else:
+            _export_openvino(weights, out, imgsz, int8, calib_dir, calib_max)
+    return out
+
+
+def load_model(weights: str, backend: str = "torch", imgsz: int = 1280, int8: bool = False,
+               calib_dir: Optional[str] = None, calib_max: int = 300):
+    from ultralytics import YOLO
+
+    path = ensure_artifact(weights, backend, imgsz, int8, calib_dir, calib_max)
+    return YOLO(path) if backend == "torch" else YOLO(path, task="detect")
@@ -0,0 +1,317 @@
+# model_registry.py
+# 검출 모델(face / lp / vehicle) 버전 레지스트리.
+# - kind 별로 active 모델 하나 + A/B 용 candidate 하나. 버전 문자열은 "파일명@sha256 앞 12자" 이고
+#   행의 model 컬럼에 그대로 기록한다.
+# - 새 가중치는 백그라운드에서 로드 → warmup 한 뒤 참조를 한 번에 바꾼다. 바꾸기 전에 고른 요청은
+#   이전 모델 객체를 들고 있으므로 그대로 끝난다 (재시작/지연 없음).
+# - candidate 는 percent % 의 요청에 쓰인다. route_key(device_id) 해시로 고르므로 같은 기기는 같은 버전.
+# - 설정 파일(JSON)을 주기적으로 확인해 바뀌면 적용한다 → 모든 워커가 재시작 없이 같은 설정을 따른다.
+#     {"lp": {"path": "./model/lp-v2.pt", "candidate": {"path": "./model/lp-v3.pt", "percent": 10}}}
+#   파일이 없거나 kind 가 빠져 있으면 기본 경로(YOLO_MODEL 등)를 쓴다.
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+import zlib
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+Loader = Callable[[str], Any]             # 가중치 경로 -> 모델
+Warmer = Callable[["ModelVersion"], None]  # 교체 전에 새 모델을 요청 경로로 한 번씩 돌려 본다
+LoadHook = Callable[["ModelVersion"], None]  # 로드 직후 (load_s 기록용)
+
+
+def weights_version(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return f"{os.path.splitext(os.path.basename(path))[0]}@{h.hexdigest()[:12]}"
+
+
+class ModelVersion:
+    __slots__ = ("kind", "path", "version", "model", "loaded_at", "load_s")
+
+    def __init__(self, kind: str, path: str, version: str, model: Any, load_s: Optional[float] = None):
+        self.kind = kind
+        self.path = path
+        self.version = version
+        self.model = model
+        self.loaded_at = time.time()
+        self.load_s = load_s
+
+    def info(self) -> Dict[str, Any]:
+        return {"path": self.path, "version": self.version, "loaded_at": self.loaded_at, "load_s": self.load_s}
+
+
+class ModelRegistry:
+    def __init__(self, loader: Loader, defaults: Dict[str, str], config_path: Optional[str] = None,
+                 poll_s: float = 10.0, warmer: Optional[Warmer] = None, retire_s: float = 30.0):
+        self.loader = loader
+        self.defaults = dict(defaults)
+        self.config_path = config_path
+        self.poll_s = max(0.5, float(poll_s))
+        self.warmer = warmer
+        self.load_hooks: List[LoadHook] = []
+        self.retire_s = float(retire_s)
+        self._retired: Dict[Tuple[str, str], Tuple[ModelVersion, float]] = {}
+        self._active: Dict[str, ModelVersion] = {}
+        self._candidate: Dict[str, ModelVersion] = {}
+        self._percent: Dict[str, float] = {}
+        self._errors: Dict[str, str] = {}
+        self._config: Dict[str, Any] = {}
+        self._config_mtime: Optional[float] = None
+        self._lock = threading.Lock()          # 참조 교체
+        self._load_lock = threading.Lock()     # 같은 모델을 두 번 로드하지 않도록 (preload / 첫 요청 / 설정 반영)
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.swaps = 0
+        self._read_config()
+
+    # ---------------------------------------------------------
+    # 설정
+    # ---------------------------------------------------------
+    def _read_config(self) -> bool:
+        """설정 파일이 바뀌었으면 다시 읽고 True"""
+        if not self.config_path:
+            return False
+        try:
+            mtime = os.path.getmtime(self.config_path)
+        except OSError:
+            mtime = None
+        if mtime == self._config_mtime:
+            return False
+        cfg: Dict[str, Any] = {}
+        if mtime is not None:
+            with open(self.config_path, "r", encoding="utf-8") as f:
+                cfg = json.load(f)
+            if not isinstance(cfg, dict):
+                raise ValueError(f"{self.config_path}: expected a JSON object")
+        self._config, self._config_mtime = cfg, mtime
+        return True
+
+    def kinds(self) -> List[str]:
+        return list(self.defaults)
+
+    def path_for(self, kind: str) -> str:
+        return (self._config.get(kind) or {}).get("path") or self.defaults[kind]
+
+    def candidate_for(self, kind: str) -> Optional[Dict[str, Any]]:
+        cand = (self._config.get(kind) or {}).get("candidate")
+        return cand if cand and cand.get("path") else None
+
+    def paths(self) -> List[str]:
+        """설정상 쓰이는 모든 가중치 경로 (active + candidate)"""
+        out = []
+        for kind in self.kinds():
+            out.append(self.path_for(kind))
+            cand = self.candidate_for(kind)
+            if cand: out.append(cand["path"])
+        return list(dict.fromkeys(out))
+
+    # ---------------------------------------------------------
+    # 로드 / 선택
+    # ---------------------------------------------------------
+    def _load(self, kind: str, path: str) -> ModelVersion:
+        if not os.path.isfile(path):
+            raise FileNotFoundError(f"{kind} model not found: {path}")
+        t = time.perf_counter()
+        mv = ModelVersion(kind, path, weights_version(path), self.loader(path))
+        mv.load_s = round(time.perf_counter() - t, 3)
+        for hook in self.load_hooks:
+            try: hook(mv)
+            except Exception: pass
+        return mv
+
+    def loaded(self, kinds: Iterable[str]) -> bool:
+        return all(k in self._active for k in kinds)
+
+    def get(self, kind: str) -> ModelVersion:
+        """active 모델 (없으면 설정 경로에서 로드)"""
+        mv = self._active.get(kind)
+        if mv is not None:
+            return mv
+        with self._load_lock:
+            mv = self._active.get(kind)
+            if mv is None:
+                try:
+                    mv = self._load(kind, self.path_for(kind))
+                except Exception as e:
+                    self._errors[kind] = str(e)
+                    raise
+                with self._lock:
+                    self._active[kind] = mv
+                    self._errors.pop(kind, None)
+        return mv
+
+    def pick(self, kind: str, route_key: Optional[str] = None) -> Optional[ModelVersion]:
+        """요청에 쓸 버전 (로드되지 않았으면 None). candidate 비율만큼 candidate 로 보낸다."""
+        with self._lock:
+            active, cand, pct = self._active.get(kind), self._candidate.get(kind), self._percent.get(kind, 0.0)
+        if cand is None or pct <= 0:
+            return active
+        if route_key is None:
+            bucket = random.random() * 100
+        else:
+            bucket = zlib.crc32(f"{kind}:{route_key}".encode()) % 10000 / 100
+        return cand if bucket < pct or active is None else active
+
+    def resolve(self, kind: str, version: str) -> Optional[ModelVersion]:
+        """버전 문자열 → 모델 (모델 서버용: 고른 뒤 교체된 버전도 retire_s 동안은 찾는다)"""
+        with self._lock:
+            for mv in (self._active.get(kind), self._candidate.get(kind)):
+                if mv is not None and mv.version == version:
+                    return mv
+            old = self._retired.get((kind, version))
+        return old[0] if old else None
+
+    def _retire(self, mv: Optional[ModelVersion]):
+        if mv is not None and self.retire_s > 0:
+            self._retired[(mv.kind, mv.version)] = (mv, time.monotonic())
+
+    def _expire_retired(self):
+        now = time.monotonic()
+        for key, (_, t) in list(self._retired.items()):
+            if now - t > self.retire_s:
+                del self._retired[key]
+
+    def last_error(self, kind: str) -> Optional[str]:
+        return self._errors.get(kind)
+
+    # ---------------------------------------------------------
+    # 교체
+    # ---------------------------------------------------------
+    def _prepare(self, kind: str, path: str, current: Optional[ModelVersion],
+                 reuse: Optional[ModelVersion] = None) -> Optional[ModelVersion]:
+        """path 가 current 와 다른 버전이면 로드 + warmup 한 새 버전, 같으면 None (reuse 와 같으면 그대로 재사용)"""
+        version = weights_version(path)
+        if current is not None and current.path == path and version == current.version:
+            return None
+        if reuse is not None and reuse.path == path and reuse.version == version:
+            return reuse      # candidate 승격: 이미 로드/warmup 됨
+        with self._load_lock:
+            mv = self._load(kind, path)
+        if current is not None and mv.version == current.version:
+            return None
+        if self.warmer is not None:
+            self.warmer(mv)
+        return mv
+
+    def apply(self, kinds: Optional[Iterable[str]] = None):
+        """
+        현재 설정을 반영한다. active 는 이미 로드된 것만 바꾼다 (아직 안 쓴 kind 는 첫 get() 에서 설정 경로로 로드).
+        kind 별로 실패해도 나머지는 계속하고 오류는 status() 에 남긴다.
+        """
+        for kind in (kinds or self.kinds()):
+            try:
+                cur = self._active.get(kind)
+                if cur is not None:
+                    mv = self._prepare(kind, self.path_for(kind), cur, reuse=self._candidate.get(kind))
+                    if mv is not None:
+                        with self._lock:
+                            self._active[kind] = mv
+                            self._retire(cur)
+                            self.swaps += 1
+                        print(f"model {kind}: {cur.version} -> {mv.version}")
+                cand_cfg = self.candidate_for(kind)
+                if cand_cfg is None:
+                    with self._lock:
+                        self._retire(self._candidate.pop(kind, None)); self._percent.pop(kind, None)
+                else:
+                    mv = self._prepare(kind, cand_cfg["path"], self._candidate.get(kind))
+                    with self._lock:
+                        if mv is not None:
+                            self._retire(self._candidate.get(kind))
+                            self._candidate[kind] = mv
+                            print(f"model {kind}: candidate {mv.version} ({cand_cfg.get('percent', 0)}%)")
+                        self._percent[kind] = min(100.0, max(0.0, float(cand_cfg.get("percent", 0))))
+                self._errors.pop(kind, None)
+            except Exception as e:
+                self._errors[kind] = str(e)
+                print(f"model {kind}: apply failed:", e)
+
+    def check(self) -> bool:
+        """설정 파일이 바뀌었으면 적용하고 True"""
+        with self._lock:
+            self._expire_retired()
+        try:
+            changed = self._read_config()
+        except Exception as e:
+            self._errors["config"] = str(e)
+            print("model registry: bad config:", e)
+            return False
+        self._errors.pop("config", None)
+        if changed:
+            self.apply()
+        return changed
+
+    # ---------------------------------------------------------
+    # 백그라운드 설정 감시
+    # ---------------------------------------------------------
+    def start(self):
+        if not self.config_path or (self._thread is not None and self._thread.is_alive()):
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name="model-registry", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _loop(self):
+        self.apply()        # 시작 시 설정된 candidate 로드 (active 는 preload / 첫 요청에서)
+        while not self._stop.wait(self.poll_s):
+            self.check()
+
+    def status(self) -> Dict[str, Any]:
+        with self._lock:
+            out = {}
+            for kind in self.kinds():
+                a, c = self._active.get(kind), self._candidate.get(kind)
+                out[kind] = {
+                    "active": a.info() if a else None,
+                    "candidate": {**c.info(), "percent": self._percent.get(kind, 0.0)} if c else None,
+                    "configured": {"path": self.path_for(kind), "candidate": self.candidate_for(kind)},
+                    "error": self._errors.get(kind),
+                }
+        return {"config": self.config_path, "config_error": self._errors.get("config"), "swaps": self.swaps, "models": out}
+
+
+# ---------------------------------------------------------
+# 설정 파일 편집 (manage.py)
+# ---------------------------------------------------------
+def read_config_file(path: str) -> Dict[str, Any]:
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def edit_config(cfg: Dict[str, Any], kind: str, path: Optional[str] = None, percent: Optional[float] = None,
+                promote: bool = False, clear_candidate: bool = False) -> Dict[str, Any]:
+    """
+    path + percent(None/100): active 교체 (candidate 제거)
+    path + percent(0~99): candidate 로 A/B
+    promote: candidate 를 active 로, clear_candidate: candidate 제거 (롤백)
+    """
+    entry = dict(cfg.get(kind) or {})
+    if promote:
+        cand = entry.get("candidate")
+        if not cand:
+            raise ValueError(f"{kind}: no candidate to promote")
+        entry["path"] = cand["path"]
+        entry.pop("candidate", None)
+    elif clear_candidate:
+        entry.pop("candidate", None)
+    elif path:
+        if percent is None or percent >= 100:
+            entry["path"] = path
+            entry.pop("candidate", None)
+        else:
+            entry["candidate"] = {"path": path, "percent": max(0.0, float(percent))}
+    out = dict(cfg)
+    out[kind] = entry
+    return out
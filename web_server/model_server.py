@@ -0,0 +1,249 @@
+# model_server.py
+# 로컬 모델 서버: 검출 모델을 한 프로세스만 들고, 여러 uvicorn 워커가 프레임을 넘겨 박스를 받는다.
+# - 워커(ModelClient)는 자기 공유 메모리 링(slots x slot_bytes)을 만들고, 디코드된 프레임을 빈 슬롯에 한 번 복사한 뒤
+#   (슬롯 번호, shape, 모델 kind/버전, 파라미터)만 Unix 소켓으로 보낸다. 서버는 같은 메모리를 ndarray 로 바로 읽는다
+#   (pickle / 소켓으로 픽셀을 보내지 않음). 슬롯은 답이 오면 비워진다.
+# - 빈 슬롯이 없거나 프레임이 슬롯보다 크면 그 프레임만 소켓으로 보낸다 (느리지만 막히지 않음).
+# - 서버는 모든 워커의 프레임을 한 배처에 넣으므로 워커 사이에서도 배치가 묶인다.
+# - 연결은 multiprocessing.connection (authkey HMAC 인증). 메시지를 unpickle 하므로 소켓에 붙을 수 있으면 서버에서
+#   코드를 실행할 수 있다 — authkey 는 기본값 없이 필수이고, 소켓은 0600 으로 만든다 (워커와 같은 사용자로 실행).
+import itertools
+import os
+import threading
+from concurrent.futures import Future
+from multiprocessing import resource_tracker
+from multiprocessing.connection import Client, Connection, Listener
+from multiprocessing.shared_memory import SharedMemory
+from typing import Any, Callable, Dict, Optional, Tuple
+
+import numpy as np
+
+DetectFn = Callable[[str, str, np.ndarray, float, float, int], Future]   # (kind, version, frame, conf, iou, imgsz)
+PickFn = Callable[[Optional[str]], Dict[str, str]]                        # route_key -> {kind: version}
+StatusFn = Callable[[], Dict[str, Any]]
+
+
+class ModelServerError(RuntimeError):
+    pass
+
+
+def _require_authkey(authkey: bytes):
+    if not authkey:
+        raise ModelServerError("MODEL_SERVER_AUTHKEY is required when MODEL_SERVER_ADDR is set")
+
+
+# =========================================================
+# 서버
+# =========================================================
+def _attach(name: str) -> SharedMemory:
+    shm = SharedMemory(name=name)
+    # 붙기만 한 쪽이 종료될 때 resource_tracker 가 워커의 링을 unlink 하지 않도록 (3.13 의 track=False)
+    try:
+        resource_tracker.unregister(shm._name, "shared_memory")
+    except Exception:
+        pass
+    return shm
+
+
+class _Session:
+    """워커 연결 하나 (수신 스레드 1개, 응답은 배처 스레드에서 send_lock 으로 보냄)"""
+
+    def __init__(self, conn: Connection, detect: DetectFn, pick: PickFn, status: StatusFn):
+        self.conn = conn
+        self.detect, self.pick, self.status = detect, pick, status
+        self.shm: Optional[SharedMemory] = None
+        self.slot_bytes = 0
+        self.send_lock = threading.Lock()
+
+    def _send(self, msg: tuple):
+        with self.send_lock:
+            try:
+                self.conn.send(msg)
+            except (OSError, EOFError):
+                pass    # 워커가 먼저 끊김
+
+    def _frame(self, slot: int, shape: Tuple[int, ...], inline: Optional[bytes]) -> np.ndarray:
+        if inline is not None:
+            return np.frombuffer(inline, np.uint8).reshape(shape)
+        return np.ndarray(shape, np.uint8, buffer=self.shm.buf, offset=slot * self.slot_bytes)
+
+    def _reply(self, rid: int, fut: Future):
+        e = fut.exception()
+        self._send((rid, False, str(e)) if e is not None else (rid, True, fut.result()))
+
+    def run(self):
+        try:
+            while True:
+                try:
+                    msg = self.conn.recv()
+                except (OSError, EOFError):
+                    return
+                op, rid = msg[0], msg[1]
+                try:
+                    if op == "detect":
+                        kind, version, conf, iou, imgsz, slot, shape, inline = msg[2:]
+                        fut = self.detect(kind, version, self._frame(slot, shape, inline), conf, iou, imgsz)
+                        fut.add_done_callback(lambda f, rid=rid: self._reply(rid, f))
+                    elif op == "pick":
+                        self._send((rid, True, self.pick(msg[2])))
+                    elif op == "status":
+                        self._send((rid, True, self.status()))
+                    elif op == "hello":
+                        name, self.slot_bytes = msg[2], msg[3]
+                        self.shm = _attach(name) if name else None
+                        self._send((rid, True, os.getpid()))
+                    else:
+                        raise ValueError(f"unknown op: {op}")
+                except Exception as e:
+                    self._send((rid, False, str(e)))
+        finally:
+            self.conn.close()
+            if self.shm is not None:
+                try:
+                    self.shm.close()
+                except BufferError:
+                    pass    # 배처가 아직 슬롯 view 를 들고 있음 — 프로세스 종료 시 해제
+
+
+def serve(address: str, authkey: bytes, detect: DetectFn, pick: PickFn, status: StatusFn):
+    """워커 연결을 받아 세션 스레드로 넘긴다 (블로킹)"""
+    _require_authkey(authkey)
+    if os.path.exists(address):
+        os.unlink(address)      # 이전 실행이 남긴 소켓 파일
+    old_umask = os.umask(0o177)     # bind 순간부터 소유자만 접근 (0600)
+    try:
+        listener = Listener(address, family="AF_UNIX", authkey=authkey)
+    finally:
+        os.umask(old_umask)
+    os.chmod(address, 0o600)
+    with listener:
+        print(f"model server listening on {address}")
+        while True:
+            try:
+                conn = listener.accept()
+            except (OSError, EOFError) as e:
+                print("model server: rejected connection:", e)
+                continue
+            s = _Session(conn, detect, pick, status)
+            threading.Thread(target=s.run, name="model-session", daemon=True).start()
+
+
+# =========================================================
+# 워커 쪽 클라이언트
+# =========================================================
+class ModelClient:
+    """
+    submit/pick/status 는 Future 를 돌려준다 (이벤트 루프를 막지 않음).
+    연결이 끊기면 대기 중 요청은 실패 처리되고, 다음 요청에서 다시 연결한다.
+    """
+
+    def __init__(self, address: str, authkey: bytes, slots: int = 16, slot_bytes: int = 1280 * 1280 * 3):
+        _require_authkey(authkey)
+        self.address = address
+        self.authkey = authkey
+        self.slots = max(1, int(slots))
+        self.slot_bytes = max(1, int(slot_bytes))
+        self.shm: Optional[SharedMemory] = None
+        self._free: list = []
+        self._pending: Dict[int, Tuple[Future, Optional[int]]] = {}
+        self._ids = itertools.count(1)
+        self._conn: Optional[Connection] = None
+        self._lock = threading.Lock()           # 연결/슬롯/대기 목록
+        self.inline_frames = 0                  # 슬롯 부족/초과로 소켓으로 보낸 프레임 수
+
+    # ---------------------------------------------------------
+    def _connect(self) -> Connection:
+        if self._conn is not None:
+            return self._conn
+        if self.shm is None:
+            self.shm = SharedMemory(create=True, size=self.slots * self.slot_bytes)
+            self._free = list(range(self.slots))
+        conn = Client(self.address, family="AF_UNIX", authkey=self.authkey)
+        conn.send(("hello", 0, self.shm.name, self.slot_bytes))
+        rid, ok, res = conn.recv()
+        if not ok:
+            conn.close()
+            raise ModelServerError(res)
+        self._conn = conn
+        threading.Thread(target=self._read_loop, args=(conn,), name="model-client", daemon=True).start()
+        return conn
+
+    def _read_loop(self, conn: Connection):
+        while True:
+            try:
+                rid, ok, res = conn.recv()
+            except (OSError, EOFError):
+                break
+            with self._lock:
+                fut, slot = self._pending.pop(rid, (None, None))
+                if slot is not None:
+                    self._free.append(slot)
+            if fut is None:
+                continue
+            if ok:
+                fut.set_result(res)
+            else:
+                fut.set_exception(ModelServerError(res))
+        # 연결 끊김: 대기 중 요청 실패 처리 + 그 슬롯 반환 (서버는 더 읽지 않는다)
+        with self._lock:
+            if self._conn is conn:
+                self._conn = None
+            pending, self._pending = self._pending, {}
+            self._free.extend(slot for _, slot in pending.values() if slot is not None)
+        conn.close()
+        for fut, _ in pending.values():
+            fut.set_exception(ModelServerError("model server connection lost"))
+
+    def _call(self, msg_fn: Callable[[int], tuple], slot: Optional[int] = None) -> Future:
+        fut: Future = Future()
+        rid = next(self._ids)
+        with self._lock:
+            try:
+                conn = self._connect()
+                self._pending[rid] = (fut, slot)
+                conn.send(msg_fn(rid))
+            except Exception as e:
+                self._pending.pop(rid, None)
+                if slot is not None:
+                    self._free.append(slot)
+                fut.set_exception(e if isinstance(e, ModelServerError) else ModelServerError(f"model server unavailable: {e}"))
+        return fut
+
+    # ---------------------------------------------------------
+    def submit(self, kind: str, version: str, frame: np.ndarray, conf: float, iou: float, imgsz: int) -> Future:
+        frame = np.ascontiguousarray(frame, dtype=np.uint8)
+        slot = None
+        with self._lock:
+            if frame.nbytes <= self.slot_bytes and self._free:
+                try:
+                    self._connect()
+                    slot = self._free.pop()
+                except Exception:
+                    slot = None
+        inline = None
+        if slot is None:
+            self.inline_frames += 1
+            inline = frame.tobytes()
+        else:
+            np.ndarray(frame.shape, np.uint8, buffer=self.shm.buf, offset=slot * self.slot_bytes)[...] = frame
+        return self._call(lambda rid: ("detect", rid, kind, version, float(conf), float(iou), int(imgsz),
+                                       slot, frame.shape, inline), slot)
+
+    def pick(self, route_key: Optional[str] = None) -> Future:
+        return self._call(lambda rid: ("pick", rid, route_key))
+
+    def status(self) -> Future:
+        return self._call(lambda rid: ("status", rid))
+
+    def pending(self) -> int:
+        return len(self._pending)
+
+    def close(self):
+        with self._lock:
+            conn, self._conn = self._conn, None
+        if conn is not None:
+            conn.close()
+        if self.shm is not None:
+            self.shm.close()
+            self.shm.unlink()
+            self.shm = None
@@ -0,0 +1,236 @@
+# partitions.py
+# lane_wear_results 월 단위 range 파티션 관리.
+# - 파티션 키는 created_at (UTC 월 경계), 이름은 lane_wear_results_pYYYYMM. PK 는 (id, created_at).
+# - 현재 달부터 ahead 개월 앞까지 파티션을 미리 만든다. 범위를 벗어난 행은 DEFAULT 파티션으로 간다.
+# - retention 개월보다 오래된 파티션은 DETACH → Parquet(로컬 디스크) 보관 → DROP.
+#   보관 도중 실패하면 분리된 테이블이 남고 다음 실행에서 이어서 처리한다.
+# - DROP 과 같은 트랜잭션에서 그 달의 시간별 롤업 / 공간 셀 집계 행을 지우고 기기 상태 n_total 에서 뺀다
+#   (기기 상태의 최근 ring / last_ts 는 "마지막으로 알려진 상태" 로 남긴다).
+import json
+import os
+import re
+import shutil
+import threading
+from datetime import datetime, timezone
+from typing import List, Optional, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.engine import Connection, Engine
+
+import device_state
+import geo_cells
+import rollups
+
+PARENT = "lane_wear_results"
+DEFAULT = f"{PARENT}_default"
+_NAME_RE = re.compile(rf"^{PARENT}_p(\d{{4}})(\d{{2}})$")
+_LOCK_KEY = 0x5EED_DA7E
+
+
+def month_start(ts: datetime) -> datetime:
+    ts = ts.astimezone(timezone.utc) if ts.tzinfo else ts.replace(tzinfo=timezone.utc)
+    return ts.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def add_months(ts: datetime, n: int) -> datetime:
+    m = ts.month - 1 + n
+    return ts.replace(year=ts.year + m // 12, month=m % 12 + 1)
+
+
+def partition_name(lo: datetime) -> str:
+    return f"{PARENT}_p{lo:%Y%m}"
+
+
+def _parse_name(name: str) -> Optional[datetime]:
+    m = _NAME_RE.match(name)
+    return datetime(int(m.group(1)), int(m.group(2)), 1, tzinfo=timezone.utc) if m else None
+
+
+def is_partitioned(conn: Connection) -> bool:
+    kind = conn.execute(text("SELECT relkind FROM pg_class WHERE oid = to_regclass(:t)"), {"t": PARENT}).scalar()
+    return kind == "p"
+
+
+def attached(conn: Connection) -> List[str]:
+    return conn.execute(text("""
+        SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = to_regclass(:t)
+    """), {"t": PARENT}).scalars().all()
+
+
+# ---------------------------------------------------------
+# 파티션 생성
+# ---------------------------------------------------------
+def _create_month(conn: Connection, lo: datetime):
+    name, hi = partition_name(lo), add_months(lo, 1)
+    if conn.execute(text("SELECT to_regclass(:n)"), {"n": name}).scalar():
+        return
+    bounds = f"FROM ('{lo.isoformat()}') TO ('{hi.isoformat()}')"
+    moved = conn.execute(text(f"SELECT EXISTS (SELECT 1 FROM {DEFAULT} WHERE created_at >= :lo AND created_at < :hi)"),
+                         {"lo": lo, "hi": hi}).scalar()
+    if not moved:
+        conn.execute(text(f"CREATE TABLE {name} PARTITION OF {PARENT} FOR VALUES {bounds}"))
+        return
+    # DEFAULT 파티션에 이미 이 달의 행이 있으면 새 테이블로 옮긴 뒤 붙인다
+    conn.execute(text(f"CREATE TABLE {name} (LIKE {PARENT} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)"))
+    conn.execute(text(f"""
+        WITH moved AS (DELETE FROM {DEFAULT} WHERE created_at >= :lo AND created_at < :hi RETURNING *)
+        INSERT INTO {name} SELECT * FROM moved
+    """), {"lo": lo, "hi": hi})
+    conn.execute(text(f"ALTER TABLE {PARENT} ATTACH PARTITION {name} FOR VALUES {bounds}"))
+
+
+def ensure_partitions(conn: Connection, ahead: int = 3, since: Optional[datetime] = None):
+    """since(기본: 현재) 달부터 현재 + ahead 개월까지 월 파티션과 DEFAULT 파티션 생성"""
+    conn.execute(text(f"CREATE TABLE IF NOT EXISTS {DEFAULT} PARTITION OF {PARENT} DEFAULT"))
+    now = month_start(datetime.now(timezone.utc))
+    cur = min(month_start(since), now) if since else now
+    end = add_months(now, ahead)
+    while cur <= end:
+        _create_month(conn, cur)
+        cur = add_months(cur, 1)
+
+
+# ---------------------------------------------------------
+# 기존 단일 테이블 → 파티션 테이블 전환 (마이그레이션 단계)
+# ---------------------------------------------------------
+def convert_to_partitioned(conn: Connection, ahead: int = 3):
+    """이미 파티션 테이블이면 아무것도 하지 않는다. 인덱스는 호출 측 마이그레이션에서 다시 만든다."""
+    if is_partitioned(conn):
+        return
+    old = f"{PARENT}_unpartitioned"
+    seq = conn.execute(text("SELECT pg_get_serial_sequence(:t, 'id')"), {"t": PARENT}).scalar()
+    conn.execute(text(f"UPDATE {PARENT} SET created_at = CURRENT_TIMESTAMP WHERE created_at IS NULL"))
+    conn.execute(text(f"ALTER TABLE {PARENT} RENAME TO {old}"))
+    conn.execute(text(f"ALTER TABLE {old} DROP CONSTRAINT IF EXISTS {PARENT}_pkey"))
+    conn.execute(text(f"CREATE TABLE {PARENT} (LIKE {old} INCLUDING DEFAULTS) PARTITION BY RANGE (created_at)"))
+    conn.execute(text(f"ALTER TABLE {PARENT} ALTER COLUMN created_at SET NOT NULL"))
+    conn.execute(text(f"ALTER TABLE {PARENT} ADD PRIMARY KEY (id, created_at)"))
+    first = conn.execute(text(f"SELECT MIN(created_at) FROM {old}")).scalar()
+    ensure_partitions(conn, ahead=ahead, since=first)
+    conn.execute(text(f"INSERT INTO {PARENT} SELECT * FROM {old}"))
+    if seq:
+        conn.execute(text(f"ALTER SEQUENCE {seq} OWNED BY {PARENT}.id"))
+    conn.execute(text(f"DROP TABLE {old}"))
+
+
+# ---------------------------------------------------------
+# 보관 (retention)
+# ---------------------------------------------------------
+def _export_parquet(engine: Engine, table: str, out_dir: str, chunk: int = 50000):
+    """테이블을 out_dir/part-NNNNN.parquet 로 내보낸다 (임시 디렉터리에 쓴 뒤 rename)"""
+    import polars as pl
+
+    tmp = out_dir + ".tmp"
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+    with engine.connect() as conn:
+        # JSONB 컬럼은 값 모양(dict/숫자)이 행마다 다를 수 있으므로 JSON 문자열로 저장
+        json_cols = set(conn.execute(text("""
+            SELECT column_name FROM information_schema.columns
+            WHERE table_schema = current_schema() AND table_name = :t AND data_type IN ('json', 'jsonb')
+        """), {"t": table}).scalars().all())
+        result = conn.execution_options(stream_results=True).execute(text(f"SELECT * FROM {table} ORDER BY id"))
+        cols = list(result.keys())
+        part = 0
+        while True:
+            rows = result.fetchmany(chunk)
+            if not rows:
+                break
+            data = {c: ([None if v is None else json.dumps(v, ensure_ascii=False) for v in col] if c in json_cols
+                        else list(col))
+                    for c, col in zip(cols, zip(*rows))}
+            pl.DataFrame(data, strict=False).write_parquet(os.path.join(tmp, f"part-{part:05d}.parquet"))
+            part += 1
+    os.replace(tmp, out_dir)
+
+
+def _forget_aggregates(conn: Connection, name: str):
+    """분리된 월 파티션 name 의 행이 누적해 둔 롤업 / 공간 셀 집계 / 기기 누적 건수를 되돌린다"""
+    lo = _parse_name(name)
+    hi = add_months(lo, 1)
+    for table in (rollups.TABLE, geo_cells.TABLE):
+        conn.execute(text(f"DELETE FROM {table} WHERE bucket >= :lo AND bucket < :hi"), {"lo": lo, "hi": hi})
+    conn.execute(text(f"""
+        UPDATE {device_state.TABLE} s SET n_total = GREATEST(s.n_total - d.n, 0)
+        FROM (SELECT device_id, COUNT(*) AS n FROM {name} WHERE device_id IS NOT NULL GROUP BY device_id) d
+        WHERE s.device_id = d.device_id
+    """))
+
+
+def archive_expired(engine: Engine, archive_dir: str, retention_months: int) -> List[str]:
+    """
+    retention 을 넘긴 월 파티션을 분리/보관/삭제하고 처리한 테이블 이름 반환.
+    삭제와 같은 트랜잭션에서 그 달의 집계(롤업 / 공간 셀 / 기기 n_total)도 빼므로 보관된 행은 통계에 남지 않는다.
+    """
+    cutoff = add_months(month_start(datetime.now(timezone.utc)), -int(retention_months))
+    with engine.begin() as conn:
+        for name in attached(conn):
+            lo = _parse_name(name)
+            if lo is not None and add_months(lo, 1) <= cutoff:
+                conn.execute(text(f"ALTER TABLE {PARENT} DETACH PARTITION {name}"))
+    with engine.connect() as conn:
+        names = set(attached(conn))
+        detached = [n for n in conn.execute(text(
+            "SELECT tablename FROM pg_tables WHERE schemaname = current_schema() AND tablename LIKE :p"
+        ), {"p": f"{PARENT}_p%"}).scalars().all() if _parse_name(n) and n not in names]
+    done = []
+    for name in sorted(detached):
+        out = os.path.join(archive_dir, PARENT, name[len(PARENT) + 2:])
+        if not os.path.isdir(out):
+            _export_parquet(engine, name, out)
+        with engine.begin() as conn:
+            _forget_aggregates(conn, name)
+            conn.execute(text(f"DROP TABLE {name}"))
+        print(f"archived partition {name} -> {out}")
+        done.append(name)
+    return done
+
+
+class PartitionMaintainer:
+    """주기적으로 미래 파티션 생성 + 만료 파티션 보관 (여러 워커 중 하나만 실행)"""
+
+    def __init__(self, engine: Engine, archive_dir: str, ahead: int = 3, retention_months: int = 0,
+                 interval_s: float = 3600.0):
+        self.engine = engine
+        self.archive_dir = archive_dir
+        self.ahead = ahead
+        self.retention_months = retention_months
+        self.interval_s = interval_s
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.last_error: Optional[str] = None
+
+    def run_once(self) -> Tuple[bool, List[str]]:
+        with self.engine.connect().execution_options(isolation_level="AUTOCOMMIT") as lock_conn:
+            if not lock_conn.execute(text("SELECT pg_try_advisory_lock(:k)"), {"k": _LOCK_KEY}).scalar():
+                return False, []
+            try:
+                with self.engine.begin() as conn:
+                    ensure_partitions(conn, ahead=self.ahead)
+                archived = []
+                if self.retention_months > 0:
+                    archived = archive_expired(self.engine, self.archive_dir, self.retention_months)
+                return True, archived
+            finally:
+                lock_conn.execute(text("SELECT pg_advisory_unlock(:k)"), {"k": _LOCK_KEY})
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name="partition-maint", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _loop(self):
+        while not self._stop.is_set():
+            try:
+                self.run_once()
+                self.last_error = None
+            except Exception as e:
+                self.last_error = str(e)
+                print("partition maintenance failed:", e)
+            self._stop.wait(self.interval_s)
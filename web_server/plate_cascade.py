@@ -0,0 +1,34 @@
+# plate_cascade.py
+# 차량 검출 → 번호판 검출 캐스케이드의 crop 계획.
+# - 작은 차량 검출기 결과(x1, y1, x2, y2, conf, cls)로 번호판 모델을 돌릴 영역을 정한다
+# - 확신 구간(conf >= conf_hi) 차량만 있으면: 차량 박스를 pad 만큼 넓혀 겹치는 것끼리 합친 crop 목록
+# - 차량이 없으면: 빈 목록 (번호판 모델 생략)
+# - 애매한 검출(conf_lo <= conf < conf_hi)이 있거나 crop 이 프레임 대부분을 덮으면: None (전체 프레임 검출)
+from typing import List, Optional
+
+import numpy as np
+
+from anonymize import clip_boxes, merge_boxes
+
+
+def plan_crops(dets: np.ndarray, w: int, h: int, conf_hi: float = 0.35, conf_lo: float = 0.10,
+               pad: float = 0.15, min_pad_px: int = 16, max_cover: float = 0.5) -> Optional[List[List[int]]]:
+    dets = np.asarray(dets, dtype=np.float64).reshape(-1, 6)
+    conf = dets[:, 4]
+    if ((conf >= conf_lo) & (conf < conf_hi)).any():
+        return None
+    sure = dets[conf >= conf_hi, :4]
+    if not len(sure):
+        return []
+    m = np.maximum((sure[:, 2:] - sure[:, :2]) * pad, min_pad_px)
+    crops = merge_boxes(clip_boxes(np.hstack([sure[:, :2] - m, sure[:, 2:] + m]), w, h))
+    area = sum((x2 - x1) * (y2 - y1) for x1, y1, x2, y2 in crops)
+    if area > max_cover * w * h:
+        return None
+    return crops
+
+
+def offset_boxes(boxes: np.ndarray, x: int, y: int) -> np.ndarray:
+    """crop 좌표 박스 → 프레임 좌표"""
+    boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+    return boxes + np.array([x, y, x, y], dtype=np.float64)
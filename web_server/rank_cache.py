@@ -0,0 +1,165 @@
+# rank_cache.py
+# 후보 우선순위 랭킹 스냅샷 캐시.
+# - (window_h, critical) 별로 RANK() 까지 계산된 정렬 목록과 device_id -> 위치 색인을 메모리에 둔다.
+# - 조회(rank / total / top N)는 색인 조회 + 슬라이스만 하므로 기기 수와 무관하다.
+# - 설정된 키(pinned, 대시보드 기본값)만 백그라운드 스레드가 적재(invalidate) 이후 또는 max_age 가 지나면 다시 만든다.
+#   (재계산은 refresh_s 마다 최대 한 번 — 적재가 몰려도 쿼리는 주기당 한 번)
+# - 그 밖의 키는 요청이 올 때 계산해 작은 LRU(max_keys)에 두고, 읽을 때 낡았으면(적재 후 refresh_s 경과 / max_age 초과)
+#   그 자리에서 다시 만든다. 임의의 쿼리 값이 pinned 키를 밀어내거나 적재마다 재계산 비용을 늘리지 않는다.
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+Row = Dict[str, Any]
+Key = Tuple[int, float]
+Builder = Callable[[int, float], List[Row]]   # rank 순으로 정렬된 행 목록 (각 행에 device_id, rank)
+
+
+class RankSnapshot:
+    __slots__ = ("rows", "pos", "built_at", "gen")
+
+    def __init__(self, rows: List[Row], gen: int = 0):
+        self.rows = rows
+        self.pos = {r["device_id"]: i for i, r in enumerate(rows)}
+        self.built_at = time.monotonic()
+        self.gen = gen          # 계산 시작 시점의 적재 세대
+
+    @property
+    def total(self) -> int:
+        return len(self.rows)
+
+    def get(self, device_id: str) -> Optional[Row]:
+        i = self.pos.get(device_id)
+        return None if i is None else self.rows[i]
+
+    def page(self, limit: int, offset: int = 0) -> List[Row]:
+        offset = max(0, int(offset))
+        return self.rows[offset:offset + max(0, int(limit))]
+
+
+class RankCache:
+    def __init__(self, builder: Builder, refresh_s: float = 5.0, max_age_s: float = 60.0, max_keys: int = 16,
+                 pinned: Iterable[Tuple[int, float]] = ()):
+        self.builder = builder
+        self.refresh_s = max(0.1, float(refresh_s))
+        self.max_age_s = float(max_age_s)
+        self.max_keys = max(1, int(max_keys))
+        self.pinned = {self._key(*k) for k in pinned}
+        self._pinned_snaps: Dict[Key, RankSnapshot] = {}
+        self._snaps: "OrderedDict[Key, RankSnapshot]" = OrderedDict()      # pinned 가 아닌 키 (LRU)
+        self._gen = 0
+        self._key_locks: Dict[Key, threading.Lock] = {}
+        self._lock = threading.Lock()
+        self._cond = threading.Condition()
+        self._dirty = False
+        self._stopping = False
+        self._thread: Optional[threading.Thread] = None
+        self.last_error: Optional[str] = None
+
+    @staticmethod
+    def _key(window_h: int, critical: float) -> Key:
+        return int(window_h), float(critical)
+
+    def _lookup(self, key: Key) -> Optional[RankSnapshot]:
+        if key in self.pinned:
+            return self._pinned_snaps.get(key)
+        snap = self._snaps.get(key)
+        if snap is not None:
+            self._snaps.move_to_end(key)
+        return snap
+
+    def _stale(self, key: Key, snap: Optional[RankSnapshot]) -> bool:
+        """pinned 키는 백그라운드가 갱신하므로 없을 때만, 나머지는 읽는 시점에 낡았는지 본다"""
+        if snap is None:
+            return True
+        if key in self.pinned:
+            return False
+        age = time.monotonic() - snap.built_at
+        return age >= self.max_age_s or (snap.gen != self._gen and age >= self.refresh_s)
+
+    def get(self, window_h: int, critical: float) -> RankSnapshot:
+        """스냅샷 반환. 없거나 낡은 키는 호출 스레드에서 계산한다 (같은 키 동시 요청은 한 번만)"""
+        key = self._key(window_h, critical)
+        with self._lock:
+            snap = self._lookup(key)
+            if not self._stale(key, snap):
+                return snap
+            klock = self._key_locks.setdefault(key, threading.Lock())
+        with klock:
+            with self._lock:
+                snap = self._lookup(key)
+            if self._stale(key, snap):
+                snap = self._build(key)
+            return snap
+
+    def _build(self, key: Key) -> RankSnapshot:
+        gen = self._gen
+        snap = RankSnapshot(self.builder(*key), gen)
+        with self._lock:
+            if key in self.pinned:
+                self._pinned_snaps[key] = snap
+                return snap
+            self._snaps[key] = snap
+            self._snaps.move_to_end(key)
+            while len(self._snaps) > self.max_keys:
+                old, _ = self._snaps.popitem(last=False)
+                self._key_locks.pop(old, None)
+        return snap
+
+    def invalidate(self, *_):
+        """적재 commit hook — pinned 키는 다음 주기에, 나머지는 다음 조회 때 다시 계산"""
+        with self._cond:
+            self._gen += 1
+            self._dirty = True
+            self._cond.notify_all()
+
+    def refresh(self, force: bool = False):
+        """pinned 키만 갱신 (아직 없는 키는 미리 계산)"""
+        now = time.monotonic()
+        for key in sorted(self.pinned):
+            with self._lock:
+                snap = self._pinned_snaps.get(key)
+                klock = self._key_locks.setdefault(key, threading.Lock())
+            if snap is not None and not force and now - snap.built_at < self.max_age_s:
+                continue
+            with klock:
+                self._build(key)
+
+    # ---------------------------------------------------------
+    # 백그라운드 갱신
+    # ---------------------------------------------------------
+    def start(self):
+        self._stopping = False
+        self._thread = threading.Thread(target=self._loop, name="rank-refresh", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0):
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _loop(self):
+        last = 0.0
+        while True:
+            with self._cond:
+                if not self._dirty:
+                    self._cond.wait(self.refresh_s)
+                # 적재가 계속 들어와도 직전 갱신 이후 refresh_s 간격을 지킨다
+                remain = self.refresh_s - (time.monotonic() - last)
+                if remain > 0 and not self._stopping:
+                    self._cond.wait_for(lambda: self._stopping, timeout=remain)
+                if self._stopping:
+                    return
+                dirty, self._dirty = self._dirty, False
+            try:
+                self.refresh(force=dirty)
+                self.last_error = None
+            except Exception as e:
+                self.last_error = str(e)
+                print("rank cache refresh failed:", e)
+                with self._cond:
+                    self._dirty = self._dirty or dirty
+            last = time.monotonic()
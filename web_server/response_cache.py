@@ -0,0 +1,168 @@
+# response_cache.py
+# 대시보드 폴링용 응답 캐시.
+# - 키: 엔드포인트 + 정규화된(정렬, None 제거) 쿼리 파라미터
+# - 짧은 TTL + 적재 시 무효화(세대 번호 증가). 같은 키의 동시 miss 는 한 번만 계산한다.
+# - 응답은 JSON 바이트로 한 번 직렬화해 두고 내용 해시 ETag 를 붙여 304 를 돌려줄 수 있게 한다.
+#   (Last-Modified 는 쓰지 않는다: NOW() 기준 창이나 다른 워커의 적재로 이 프로세스가 모르게 내용이 바뀔 수 있음)
+# - REDIS_URL 이 있으면 여러 워커가 같은 캐시/세대를 공유한다 (redis 패키지가 없거나 장애면 메모리 캐시로 동작).
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional
+from urllib.parse import urlencode
+
+from fastapi import Request, Response
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+Headers = Dict[str, str]
+Compute = Callable[[Headers], Any]   # 응답 payload 반환, 추가 응답 헤더는 인자로 받은 dict 에 채운다
+
+
+class Entry:
+    __slots__ = ("body", "etag", "headers")
+
+    def __init__(self, body: bytes, headers: Headers):
+        self.body = body
+        self.etag = '"%s"' % hashlib.sha1(body).hexdigest()
+        self.headers = headers
+
+
+class ResponseCache:
+    def __init__(self, ttl_s: float = 2.0, max_entries: int = 512,
+                 redis_url: Optional[str] = None, prefix: str = "seedrive:resp:"):
+        self.ttl_s = float(ttl_s)
+        self.max_entries = max(1, int(max_entries))
+        self.prefix = prefix
+        self._local: "OrderedDict[str, tuple[float, int, Entry]]" = OrderedDict()
+        self._inflight: Dict[str, threading.Lock] = {}
+        self._lock = threading.Lock()
+        self._gen = 0
+        self._redis = None
+        if redis_url:
+            if redis is None:
+                print("REDIS_URL is set but the redis package is not installed; using in-process cache")
+            else:
+                self._redis = redis.Redis.from_url(redis_url)
+
+    @staticmethod
+    def key(endpoint: str, params: Dict[str, Any]) -> str:
+        items = sorted((k, str(v)) for k, v in params.items() if v is not None)
+        return f"{endpoint}?{urlencode(items)}"
+
+    # ---------------------------------------------------------
+    # 세대 (무효화)
+    # ---------------------------------------------------------
+    def _generation(self) -> int:
+        if self._redis is not None:
+            try:
+                return int(self._redis.get(self.prefix + "gen") or 0)
+            except Exception as e:
+                print("response cache redis error:", e)
+        return self._gen
+
+    def invalidate(self, *_):
+        """적재 commit hook — 이후 요청은 새로 계산한다"""
+        with self._lock:
+            self._gen += 1
+            self._local.clear()
+        if self._redis is not None:
+            try:
+                self._redis.incr(self.prefix + "gen")
+            except Exception as e:
+                print("response cache redis error:", e)
+
+    # ---------------------------------------------------------
+    # 저장소
+    # ---------------------------------------------------------
+    def _load(self, key: str, gen: int) -> Optional[Entry]:
+        with self._lock:
+            hit = self._local.get(key)
+            if hit is not None:
+                expires, egen, entry = hit
+                if egen == gen and expires > time.monotonic():
+                    return entry
+                self._local.pop(key, None)
+        if self._redis is not None:
+            try:
+                h = self._redis.hgetall(f"{self.prefix}{gen}:{key}")
+            except Exception as e:
+                print("response cache redis error:", e)
+                return None
+            if h:
+                entry = Entry(h[b"body"], json.loads(h[b"headers"]))
+                self._store_local(key, gen, entry)
+                return entry
+        return None
+
+    def _store_local(self, key: str, gen: int, entry: Entry):
+        with self._lock:
+            self._local[key] = (time.monotonic() + self.ttl_s, gen, entry)
+            self._local.move_to_end(key)
+            while len(self._local) > self.max_entries:
+                self._local.popitem(last=False)
+
+    def _store(self, key: str, gen: int, entry: Entry):
+        self._store_local(key, gen, entry)
+        if self._redis is not None:
+            try:
+                rkey = f"{self.prefix}{gen}:{key}"
+                pipe = self._redis.pipeline()
+                pipe.hset(rkey, mapping={"body": entry.body, "headers": json.dumps(entry.headers)})
+                pipe.pexpire(rkey, max(1, int(self.ttl_s * 1000)))
+                pipe.execute()
+            except Exception as e:
+                print("response cache redis error:", e)
+
+    def get(self, key: str, compute: Compute) -> Entry:
+        gen = self._generation()
+        if self.ttl_s > 0:
+            entry = self._load(key, gen)
+            if entry is not None:
+                return entry
+        with self._lock:
+            flight = self._inflight.setdefault(key, threading.Lock())
+        with flight:
+            # 먼저 계산한 요청이 채워 둔 결과를 그대로 쓴다
+            if self.ttl_s > 0:
+                entry = self._load(key, gen)
+                if entry is not None:
+                    return entry
+            headers: Headers = {}
+            body = JSONResponse(jsonable_encoder(compute(headers))).body
+            entry = Entry(body, headers)
+            if self.ttl_s > 0:
+                self._store(key, gen, entry)
+        with self._lock:
+            if self._inflight.get(key) is flight and not flight.locked():
+                self._inflight.pop(key, None)
+        return entry
+
+    # ---------------------------------------------------------
+    # HTTP 응답 (조건부 요청 → 304)
+    # ---------------------------------------------------------
+    @staticmethod
+    def _not_modified(request: Request, entry: Entry) -> bool:
+        inm = request.headers.get("if-none-match")
+        if inm is None:
+            return False
+        tags = {t.strip().removeprefix("W/") for t in inm.split(",")}
+        return "*" in tags or entry.etag in tags
+
+    def respond(self, request: Request, endpoint: str, params: Dict[str, Any], compute: Compute) -> Response:
+        entry = self.get(self.key(endpoint, params), compute)
+        headers = {
+            "ETag": entry.etag,
+            "Cache-Control": "no-cache",
+            **entry.headers,
+        }
+        if self._not_modified(request, entry):
+            return Response(status_code=304, headers=headers)
+        return Response(entry.body, media_type="application/json", headers=headers)
@@ -0,0 +1,157 @@
+# rollups.py
+# 시간(hour) x 기기 x 마모 점수 구간(정수 bin) 별 건수를 적재 시점에 누적하는 롤업.
+# /stats/summary 는 원본 행 대신 이 테이블을 읽어 O(hours x devices) 로 계산한다.
+#
+# - wear_bin = FLOOR(wear_score). 정수 임계값 t 에 대해 wear >= t  <=>  wear_bin >= t 이므로
+#   임계값이 정수이면 원본과 같은 결과를 낸다. (정수가 아니면 호출 측에서 원본 쿼리로 대체)
+# - wear_score 가 없는 행은 NO_WEAR 구간으로 센다 (건수/기기 수에는 포함, 경보에는 제외).
+# - device_id 가 없는 행은 '' 로 저장한다 (활성 기기 수에서 제외).
+import math
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.engine import Connection
+
+TABLE = "lane_wear_rollup_hourly"
+NO_WEAR = -2147483648
+HOUR = timedelta(hours=1)
+
+DDL = [
+    f"""
+    CREATE TABLE IF NOT EXISTS {TABLE} (
+      bucket    TIMESTAMPTZ NOT NULL,
+      device_id TEXT        NOT NULL,
+      wear_bin  INTEGER     NOT NULL,
+      n         BIGINT      NOT NULL,
+      PRIMARY KEY (bucket, device_id, wear_bin)
+    )
+    """,
+]
+
+_WEAR_BIN_SQL = f"COALESCE(FLOOR((overall->>'wear_score')::float)::int, {NO_WEAR})"
+
+
+def wear_of(row: Dict[str, Any]) -> Optional[float]:
+    overall = row.get("overall")
+    if not isinstance(overall, dict):
+        return None
+    v = overall.get("wear_score")
+    try:
+        v = float(v)
+    except (TypeError, ValueError):
+        return None
+    return v if math.isfinite(v) else None
+
+
+def wear_bin(w: Optional[float]) -> int:
+    return NO_WEAR if w is None else int(math.floor(w))
+
+
+def to_utc(ts: datetime) -> datetime:
+    # naive 시각은 UTC 로 간주 (bucket 은 항상 UTC 정시)
+    return ts.replace(tzinfo=timezone.utc) if ts.tzinfo is None else ts.astimezone(timezone.utc)
+
+
+def floor_hour(ts: datetime) -> datetime:
+    return to_utc(ts).replace(minute=0, second=0, microsecond=0)
+
+
+def ceil_hour(ts: datetime) -> datetime:
+    f = floor_hour(ts)
+    return f if f == to_utc(ts) else f + HOUR
+
+
+def is_exact_threshold(*vals: float) -> bool:
+    return all(float(v).is_integer() for v in vals)
+
+
+# ---------------------------------------------------------
+# 적재 시 누적 (WriteBehindBuffer flush hook — 같은 트랜잭션)
+# ---------------------------------------------------------
+def apply_rows(conn: Connection, rows: Iterable[Dict[str, Any]]):
+    counts: Counter = Counter()
+    now = datetime.now(timezone.utc)
+    for r in rows:
+        ts = r.get("created_at") or now
+        counts[(floor_hour(ts), r.get("device_id") or "", wear_bin(wear_of(r)))] += 1
+    if not counts:
+        return
+    conn.execute(text(f"""
+        INSERT INTO {TABLE} (bucket, device_id, wear_bin, n)
+        VALUES (:bucket, :device_id, :wear_bin, :n)
+        ON CONFLICT (bucket, device_id, wear_bin) DO UPDATE SET n = {TABLE}.n + EXCLUDED.n
+    """), [{"bucket": b, "device_id": d, "wear_bin": w, "n": n}
+           for (b, d, w), n in sorted(counts.items())])
+
+
+def rebuild(conn: Connection):
+    """원본 테이블에서 롤업 전체 재계산 (backfill). 진행 중 적재는 lock 으로 대기시킨다."""
+    conn.execute(text(f"LOCK TABLE {TABLE} IN EXCLUSIVE MODE"))
+    conn.execute(text(f"TRUNCATE {TABLE}"))
+    conn.execute(text(f"""
+        INSERT INTO {TABLE} (bucket, device_id, wear_bin, n)
+        SELECT date_trunc('hour', created_at AT TIME ZONE 'UTC') AT TIME ZONE 'UTC', COALESCE(device_id, ''), {_WEAR_BIN_SQL}, COUNT(*)
+        FROM lane_wear_results
+        WHERE created_at IS NOT NULL
+        GROUP BY 1, 2, 3
+    """))
+
+
+# ---------------------------------------------------------
+# 조회
+# ---------------------------------------------------------
+def _range_source_sql(idx: int, lo: datetime, hi: Optional[datetime]) -> Tuple[str, Dict[str, Any]]:
+    """
+    [lo, hi) 구간의 (device_id, wear_bin, n) 소스.
+    정시로 나눠떨어지는 구간은 롤업, 양 끝의 자투리 시간만 원본 행(created_at 인덱스 범위)에서 읽는다.
+    hi 가 None 이면 현재까지(열린 구간) — 현재 시각 bucket 도 롤업으로 처리.
+    """
+    p = f"r{idx}_"
+    full_lo = ceil_hour(lo)
+    full_hi = None if hi is None else floor_hour(hi)
+    params: Dict[str, Any] = {}
+    parts: List[str] = []
+    raw_ranges: List[Tuple[datetime, datetime]] = []
+    if full_hi is not None and full_hi <= full_lo:
+        raw_ranges.append((lo, hi))
+    else:
+        cond = f"bucket >= :{p}flo" + ("" if full_hi is None else f" AND bucket < :{p}fhi")
+        parts.append(f"SELECT device_id, wear_bin, n FROM {TABLE} WHERE {cond}")
+        params[f"{p}flo"] = full_lo
+        if full_hi is not None:
+            params[f"{p}fhi"] = full_hi
+        if lo < full_lo:
+            raw_ranges.append((lo, full_lo))
+        if full_hi is not None and full_hi < hi:
+            raw_ranges.append((full_hi, hi))
+    for j, (a, b) in enumerate(raw_ranges):
+        parts.append(f"""
+            SELECT COALESCE(device_id, '') AS device_id, {_WEAR_BIN_SQL} AS wear_bin, 1 AS n
+            FROM lane_wear_results WHERE created_at >= :{p}a{j} AND created_at < :{p}b{j}""")
+        params[f"{p}a{j}"] = a
+        params[f"{p}b{j}"] = b
+    return " UNION ALL ".join(parts), params
+
+
+def window_counts(conn: Connection, lo: datetime, hi: Optional[datetime],
+                  warning: float, critical: float, idx: int = 0) -> Dict[str, int]:
+    src, params = _range_source_sql(idx, lo, hi)
+    params.update(warning=warning, critical=critical, no_wear=NO_WEAR)
+    row = conn.execute(text(f"""
+        SELECT
+          COALESCE(SUM(n), 0) AS detections,
+          COUNT(DISTINCT NULLIF(device_id, '')) AS active_devices,
+          COALESCE(SUM(n) FILTER (WHERE wear_bin <> :no_wear AND wear_bin >= :critical), 0) AS alerts_critical,
+          COALESCE(SUM(n) FILTER (WHERE wear_bin <> :no_wear AND wear_bin >= :warning AND wear_bin < :critical), 0)
+            AS alerts_warning
+        FROM ({src}) s
+    """), params).mappings().one()
+    return {k: int(v or 0) for k, v in row.items()}
+
+
+def device_counts_sql(lo: datetime, idx: int = 9) -> Tuple[str, Dict[str, Any]]:
+    """기기별 [lo, 현재) 건수 서브쿼리 (device_id, n)"""
+    src, params = _range_source_sql(idx, lo, None)
+    return f"SELECT device_id, SUM(n) AS n FROM ({src}) s WHERE device_id <> '' GROUP BY device_id", params
@@ -0,0 +1,5 @@
+# web_server 의 모듈은 패키지가 아니라 평평하게 놓여 있으므로 (uvicorn main:app) 그 폴더를 import 경로에 넣는다.
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,66 @@
+import random
+
+import numpy as np
+
+from anonymize import anonymize, clip_boxes, merge_boxes
+
+
+def _overlap(a, b):
+    return a[0] <= b[2] and b[0] <= a[2] and a[1] <= b[3] and b[1] <= a[3]
+
+
+def _mask(boxes, w=200, h=200):
+    m = np.zeros((h, w), bool)
+    for x1, y1, x2, y2 in boxes:
+        m[y1:y2, x1:x2] = True
+    return m
+
+
+def test_disjoint_boxes_unchanged():
+    boxes = [[0, 0, 10, 10], [20, 20, 30, 30], [50, 0, 60, 5]]
+    assert merge_boxes(boxes) == boxes
+
+
+def test_overlapping_boxes_become_bounding_box():
+    assert merge_boxes([[0, 0, 10, 10], [5, 5, 20, 15]]) == [[0, 0, 20, 15]]
+
+
+def test_touching_boxes_merge():
+    assert merge_boxes([[0, 0, 10, 10], [10, 0, 20, 10]]) == [[0, 0, 20, 10]]
+
+
+def test_merge_repeats_until_no_overlap():
+    # c 는 a 와 안 겹치지만 a+b 외접 사각형과는 겹친다
+    a, b, c = [0, 0, 10, 10], [8, 8, 30, 12], [25, 0, 28, 5]
+    assert merge_boxes([c, a, b]) == [[0, 0, 30, 12]]
+
+
+def test_input_not_mutated():
+    boxes = [[0, 0, 10, 10], [5, 5, 20, 15]]
+    merge_boxes(boxes)
+    assert boxes == [[0, 0, 10, 10], [5, 5, 20, 15]]
+
+
+def test_random_merge_covers_input_and_is_disjoint():
+    rng = random.Random(0)
+    for _ in range(50):
+        boxes = []
+        for _ in range(rng.randint(0, 12)):
+            x, y = rng.randint(0, 180), rng.randint(0, 180)
+            boxes.append([x, y, x + rng.randint(1, 20), y + rng.randint(1, 20)])
+        out = merge_boxes(boxes)
+        assert not (_mask(boxes) & ~_mask(out)).any()
+        assert all(not _overlap(out[i], out[j]) for i in range(len(out)) for j in range(i + 1, len(out)))
+
+
+def test_clip_boxes():
+    boxes = np.array([[-5.5, -1, 10.2, 8.9], [90, 90, 120, 130], [50, 50, 50, 60], [200, 0, 210, 10]])
+    assert clip_boxes(boxes, 100, 100) == [[0, 0, 11, 9], [90, 90, 100, 100]]
+
+
+def test_fill_touches_only_merged_boxes():
+    img = np.full((100, 100, 3), 255, np.uint8)
+    boxes = np.array([[10, 10, 30, 30], [25, 25, 40, 35], [70, 70, 80, 80]], float)
+    anonymize(img, boxes, method="fill", fill_color=(0, 0, 0))
+    expect = _mask([[10, 10, 40, 35], [70, 70, 80, 80]], 100, 100)
+    assert ((img == 0).all(axis=2) == expect).all()
@@ -0,0 +1,92 @@
+import random
+
+import numpy as np
+import pytest
+
+import geo_cells
+from geo_cells import HIST_BINS, ZMAX, CellStats, _compact, _spread, cell_at, cell_id, lonlat_to_tile
+
+
+def _morton(x: int, y: int) -> int:
+    return _spread(x) | (_spread(y) << 1)
+
+
+def test_zmax_is_24():
+    assert ZMAX == 24
+
+
+@pytest.mark.parametrize("x, y", [(0, 0), (1, 0), (0, 1), ((1 << ZMAX) - 1, (1 << ZMAX) - 1),
+                                  (0xABCDEF, 0x123456)] + [(random.Random(s).randrange(1 << ZMAX),
+                                                            random.Random(-s).randrange(1 << ZMAX)) for s in range(1, 50)])
+def test_morton_round_trip(x, y):
+    cell = _morton(x, y)
+    assert cell < 1 << (2 * ZMAX)
+    assert (_compact(cell), _compact(cell >> 1)) == (x, y)
+    assert cell_at(cell, ZMAX) == (x, y)
+    for z in (0, 1, 14, 18, 23):
+        # 상위 줌 셀은 비트 시프트와 같다
+        assert cell_at(cell, z) == (x >> (ZMAX - z), y >> (ZMAX - z))
+
+
+def test_children_are_contiguous_range():
+    x, y, z = 1234, 5678, 14
+    lo = _morton(x, y) << (2 * (ZMAX - z))
+    hi = (_morton(x, y) + 1) << (2 * (ZMAX - z))
+    for cx, cy in [(x << 10, y << 10), ((x << 10) + 1023, (y << 10) + 1023), ((x << 10) + 5, (y << 10) + 900)]:
+        assert lo <= _morton(cx, cy) < hi
+
+
+def test_cell_id_matches_tile():
+    lat, lon = 37.5665, 126.9780
+    cell = cell_id(lat, lon)
+    for z in (14, 18, ZMAX):
+        assert cell_at(cell, z) == lonlat_to_tile(lat, lon, z)
+    assert cell_id(None, lon) is None
+    assert cell_id(float("nan"), lon) is None
+
+
+def _stats(values):
+    st = CellStats()
+    for v in values:
+        st.add(v, None)
+    return st
+
+
+def test_quantile_exact_on_bin_centers():
+    # 1점 구간마다 가운데 값 하나 → 보간 결과가 PERCENTILE_CONT 와 같다
+    values = [i + 0.5 for i in range(100)]
+    st = _stats(values)
+    assert len(st.hist) == HIST_BINS
+    for q in (0.0, 0.1, 0.5, 0.9, 1.0):
+        assert st.quantile(q) == pytest.approx(float(np.percentile(values, q * 100)))
+    assert st.quantile(0.9) == pytest.approx(89.6)
+
+
+def test_quantile_known_histogram():
+    # 0~10 구간에 90 개, 90~100 구간에 10 개 → p90 은 두 무리 사이
+    st = _stats([5.5] * 90 + [95.5] * 10)
+    assert st.quantile(0.5) == pytest.approx(5.5, abs=0.5)
+    assert 5.0 <= st.quantile(0.9) <= 96.0
+    assert st.quantile(0.95) == pytest.approx(95.5, abs=0.5)
+
+
+def test_quantile_edges():
+    assert CellStats().quantile(0.9) is None
+    assert _stats([42.0]).quantile(0.9) == 42.0
+    st = _stats([-5.0, 150.0])          # 범위 밖 값은 양 끝 구간 → [min, max] 로 보정
+    qs = [st.quantile(q) for q in (0.0, 0.5, 0.9, 1.0)]
+    assert all(-5.0 <= v <= 150.0 for v in qs)
+    assert qs == sorted(qs)
+
+
+def test_merge_equals_add():
+    values = [random.Random(i).uniform(0, 100) for i in range(200)]
+    whole = _stats(values)
+    merged = CellStats()
+    for part in (values[:70], values[70:]):
+        p = _stats(part)
+        merged.merge({"n": p.n, "wear_n": p.wear_n, "wear_sum": p.wear_sum, "wear_min": p.wear_min,
+                      "wear_max": p.wear_max, "hist": p.hist, "last_ts": None})
+    assert merged.hist == whole.hist
+    assert merged.quantile(0.9) == pytest.approx(whole.quantile(0.9))
+    assert geo_cells.HIST_LO <= merged.quantile(0.9) <= geo_cells.HIST_HI
@@ -0,0 +1,47 @@
+import numpy as np
+
+from plate_cascade import offset_boxes, plan_crops
+
+W, H = 1280, 720
+
+
+def _det(x1, y1, x2, y2, conf, cls=2):
+    return [x1, y1, x2, y2, conf, cls]
+
+
+def test_no_vehicles_skips_plate_model():
+    assert plan_crops(np.empty((0, 6)), W, H) == []
+    # conf_lo 미만은 무시
+    assert plan_crops(np.array([_det(0, 0, 100, 100, 0.05)]), W, H) == []
+
+
+def test_ambiguous_detection_falls_back_to_full_frame():
+    dets = np.array([_det(100, 100, 200, 200, 0.9), _det(600, 300, 700, 400, 0.2)])
+    assert plan_crops(dets, W, H) is None
+
+
+def test_large_cover_falls_back_to_full_frame():
+    assert plan_crops(np.array([_det(0, 0, W, H, 0.9)]), W, H) is None
+    assert plan_crops(np.array([_det(0, 0, 600, 400, 0.9)]), W, H, max_cover=0.1) is None
+
+
+def test_sure_vehicles_become_padded_crops():
+    crops = plan_crops(np.array([_det(100, 100, 200, 300, 0.9)]), W, H, pad=0.15, min_pad_px=16)
+    # 가로 100*0.15=15 -> 최소 16, 세로 200*0.15=30
+    assert crops == [[84, 70, 216, 330]]
+
+
+def test_crops_are_clipped_and_merged():
+    dets = np.array([_det(0, 0, 50, 50, 0.8), _det(40, 40, 120, 90, 0.8), _det(1000, 500, 1100, 600, 0.5)])
+    crops = plan_crops(dets, W, H)
+    assert len(crops) == 2
+    assert crops[0][:2] == [0, 0]                     # 프레임 밖으로 넓힌 부분은 잘림
+    assert all(0 <= x1 < x2 <= W and 0 <= y1 < y2 <= H for x1, y1, x2, y2 in crops)
+    for x1, y1, x2, y2, *_ in dets:                  # 모든 차량 박스가 crop 안에 들어간다
+        assert any(c[0] <= x1 and c[1] <= y1 and x2 <= c[2] and y2 <= c[3] for c in crops)
+
+
+def test_offset_boxes():
+    out = offset_boxes(np.array([[1, 2, 3, 4]]), 10, 20)
+    assert out.tolist() == [[11, 22, 13, 24]]
+    assert offset_boxes(np.empty((0, 4)), 5, 5).shape == (0, 4)
@@ -0,0 +1,60 @@
+import pytest
+
+from tiles import EXTENT, POINT, POLYGON, Layer, _cell_ring, _varint, _zigzag, encode_tile
+
+mvt = pytest.importorskip("mapbox_vector_tile")
+
+
+def test_varint_and_zigzag():
+    assert _varint(0) == b"\x00"
+    assert _varint(1) == b"\x01"
+    assert _varint(300) == b"\xac\x02"
+    assert _varint(1 << 35) == b"\x80\x80\x80\x80\x80\x01"
+    assert [_zigzag(v) for v in (0, -1, 1, -2, 2, -4096)] == [0, 1, 2, 3, 4, 8191]
+
+
+def _signed_area(ring):
+    """vector tile 스펙의 면적 공식 (y 아래 방향 좌표에서 외곽 링은 양수)"""
+    pts = list(ring)
+    if pts[0] == pts[-1]:
+        pts = pts[:-1]
+    return sum(x0 * y1 - x1 * y0 for (x0, y0), (x1, y1) in zip(pts, pts[1:] + pts[:1])) / 2
+
+
+def _decode(data):
+    return mvt.decode(data, default_options={"y_coord_down": True})
+
+
+def test_cell_ring_is_exterior():
+    ring = _cell_ring(16, 2 * 10 + 1, 2 * 20, 15, 10, 20)
+    assert ring == [(EXTENT // 2, 0), (EXTENT, 0), (EXTENT, EXTENT // 2), (EXTENT // 2, EXTENT // 2)]
+    assert _signed_area(ring) > 0
+
+
+def test_encoded_tile_decodes_with_reference_decoder():
+    cells = Layer("cells")
+    ring = _cell_ring(16, 2 * 10 + 1, 2 * 20, 15, 10, 20)
+    cells.add(POLYGON, ring, {"z": 16, "count": 3, "wear_avg": 41.5, "wear_p90": None, "last_ts": "2026-10-18T10:00:00+00:00"})
+    cells.add(POLYGON, _cell_ring(16, 2 * 10, 2 * 20 + 1, 15, 10, 20), {"z": 16, "count": -2, "ok": True})
+    points = Layer("detections")
+    points.add(POINT, [(100, 4000)], {"id": 7, "wear": 88.25, "device_id": "dev1"}, fid=7)
+    data = encode_tile([cells, points, Layer("empty")])
+
+    tile = _decode(data)
+    assert set(tile) == {"cells", "detections"}          # 빈 레이어는 넣지 않는다
+    assert tile["cells"]["extent"] == EXTENT
+    assert tile["cells"]["version"] == 2
+
+    f0, f1 = tile["cells"]["features"]
+    assert f0["geometry"]["type"] == "Polygon"
+    outer = [tuple(p) for p in f0["geometry"]["coordinates"][0]]
+    assert outer[0] == outer[-1]                          # 디코더가 ClosePath 로 닫는다
+    assert outer[:-1] == ring
+    assert _signed_area(outer) > 0
+    assert f0["properties"] == {"z": 16, "count": 3, "wear_avg": 41.5, "last_ts": "2026-10-18T10:00:00+00:00"}
+    assert f1["properties"] == {"z": 16, "count": -2, "ok": True}
+
+    (p,) = tile["detections"]["features"]
+    assert p["id"] == 7
+    assert p["geometry"] == {"type": "Point", "coordinates": [100, 4000]}
+    assert p["properties"] == {"id": 7, "wear": 88.25, "device_id": "dev1"}
@@ -0,0 +1,234 @@
+# tiles.py
+# /tiles/{z}/{x}/{y}.mvt 용 Mapbox Vector Tile(v2) 인코더와 디스크 타일 캐시.
+# - "cells"      : 타일보다 cell_detail 줌 깊은 공간 셀(geo_cells 집계) 폴리곤 + 마모 통계
+# - "detections" : detection_min_zoom 이상에서 개별 행 포인트 (geo_cell 범위 인덱스로 조회)
+# - 생성한 타일은 {root}/{window_h}/{z}/{x}/{y}.mvt 로 저장하고, 행이 들어오면 그 행이 속한 타일만 지운다.
+import math
+import os
+import struct
+import time
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.engine import Connection
+
+import geo_cells
+from image_store import write_atomic
+
+EXTENT = 4096
+MEDIA_TYPE = "application/vnd.mapbox-vector-tile"
+
+POINT, POLYGON = 1, 3
+
+
+# ---------------------------------------------------------
+# protobuf 최소 인코더 (vector_tile.proto 의 필요한 필드만)
+# ---------------------------------------------------------
+def _varint(v: int) -> bytes:
+    out = bytearray()
+    while True:
+        b = v & 0x7F
+        v >>= 7
+        if v:
+            out.append(b | 0x80)
+        else:
+            out.append(b)
+            return bytes(out)
+
+
+def _zigzag(v: int) -> int:
+    return (v << 1) ^ (v >> 63)
+
+
+def _key(field: int, wire: int) -> bytes:
+    return _varint((field << 3) | wire)
+
+
+def _len_field(field: int, data: bytes) -> bytes:
+    return _key(field, 2) + _varint(len(data)) + data
+
+
+def _packed(field: int, values: Iterable[int]) -> bytes:
+    return _len_field(field, b"".join(_varint(v) for v in values))
+
+
+def _value(v: Any) -> bytes:
+    if isinstance(v, bool):
+        return _key(7, 0) + _varint(int(v))
+    if isinstance(v, int):
+        return _key(6, 0) + _varint(_zigzag(v))
+    if isinstance(v, float):
+        return _key(3, 1) + struct.pack("<d", v)
+    return _len_field(1, str(v).encode("utf-8"))
+
+
+def _command(cmd: int, count: int) -> int:
+    return (cmd & 0x7) | (count << 3)
+
+
+def _geometry(kind: int, pts: List[Tuple[int, int]]) -> List[int]:
+    """POINT: 한 점, POLYGON: 닫히지 않은 외곽 링 (시계 방향)"""
+    out = [_command(1, 1)]
+    cx = cy = 0
+    for i, (x, y) in enumerate(pts):
+        if i == 1:
+            out.append(_command(2, len(pts) - 1))
+        out += [_zigzag(x - cx), _zigzag(y - cy)]
+        cx, cy = x, y
+    if kind == POLYGON:
+        out.append(_command(7, 1))
+    return out
+
+
+class Layer:
+    def __init__(self, name: str, extent: int = EXTENT):
+        self.name = name
+        self.extent = extent
+        self._keys: Dict[str, int] = {}
+        self._values: Dict[Tuple[type, Any], int] = {}
+        self._features: List[bytes] = []
+
+    def __len__(self):
+        return len(self._features)
+
+    def add(self, kind: int, pts: List[Tuple[int, int]], props: Dict[str, Any], fid: Optional[int] = None):
+        tags = []
+        for k, v in props.items():
+            if v is None:
+                continue
+            tags.append(self._keys.setdefault(k, len(self._keys)))
+            tags.append(self._values.setdefault((type(v), v), len(self._values)))
+        f = b""
+        if fid is not None:
+            f += _key(1, 0) + _varint(int(fid))
+        f += _packed(2, tags) + _key(3, 0) + _varint(kind) + _packed(4, _geometry(kind, pts))
+        self._features.append(f)
+
+    def encode(self) -> bytes:
+        out = _key(15, 0) + _varint(2) + _len_field(1, self.name.encode("utf-8"))
+        out += b"".join(_len_field(2, f) for f in self._features)
+        out += b"".join(_len_field(3, k.encode("utf-8")) for k in self._keys)
+        out += b"".join(_len_field(4, _value(v)) for (_, v) in self._values)
+        out += _key(5, 0) + _varint(self.extent)
+        return out
+
+
+def encode_tile(layers: Iterable[Layer]) -> bytes:
+    return b"".join(_len_field(3, l.encode()) for l in layers if len(l))
+
+
+# ---------------------------------------------------------
+# 타일 좌표 변환
+# ---------------------------------------------------------
+def _project(lat: float, lon: float, z: int, x: int, y: int) -> Tuple[int, int]:
+    n = 1 << z
+    lat = max(-geo_cells.MAX_LAT, min(geo_cells.MAX_LAT, lat))
+    r = math.radians(lat)
+    gx = (lon + 180.0) / 360.0 * n
+    gy = (1.0 - math.log(math.tan(r) + 1.0 / math.cos(r)) / math.pi) / 2.0 * n
+    return int(round((gx - x) * EXTENT)), int(round((gy - y) * EXTENT))
+
+
+def _cell_ring(cz: int, cx: int, cy: int, z: int, x: int, y: int) -> List[Tuple[int, int]]:
+    s = 2.0 ** (z - cz)
+    l, r = int(round((cx * s - x) * EXTENT)), int(round(((cx + 1) * s - x) * EXTENT))
+    t, b = int(round((cy * s - y) * EXTENT)), int(round(((cy + 1) * s - y) * EXTENT))
+    return [(l, t), (r, t), (r, b), (l, b)]
+
+
+def _f(v) -> Optional[float]:
+    return None if v is None else float(v)
+
+
+def build_tile(conn: Connection, z: int, x: int, y: int, lo: datetime,
+               cell_detail: int = 5, detection_min_zoom: int = 16, max_points: int = 5000) -> bytes:
+    """
+    [lo, 현재) 구간의 셀/검출을 MVT 바이트로.
+    z + cell_detail 이 가장 거친 집계 줌(min ZOOMS)보다 낮으면 셀 레이어는 비운다
+    (올려 잡으면 타일 하나가 수백만 셀을 읽게 되므로 타일당 셀 수를 4^cell_detail 이하로 유지).
+    """
+    cells = Layer("cells")
+    cz = min(max(geo_cells.ZOOMS), z + cell_detail)
+    if cz >= min(geo_cells.ZOOMS):
+        if cz >= z:
+            d = cz - z
+            x0, x1, y0, y1 = x << d, ((x + 1) << d) - 1, y << d, ((y + 1) << d) - 1
+        else:
+            x0 = x1 = x >> (z - cz)
+            y0 = y1 = y >> (z - cz)
+        for (cx, cy), st in geo_cells.range_cells(conn, cz, x0, x1, y0, y1, lo).items():
+            cells.add(POLYGON, _cell_ring(cz, cx, cy, z, x, y), {
+                "z": cz, "count": int(st.n),
+                "wear_avg": _f(st.wear_avg), "wear_max": _f(st.wear_max), "wear_p90": _f(st.quantile(0.9)),
+                "last_ts": st.last_ts.isoformat() if st.last_ts else None,
+            })
+
+    points = Layer("detections")
+    if z >= detection_min_zoom:
+        clo, chi = geo_cells.tile_cell_range(z, x, y)
+        rows = conn.execute(text("""
+            SELECT id, gps_lat, gps_lon, (overall->>'wear_score')::float AS wear, device_id, created_at
+            FROM lane_wear_results
+            WHERE geo_cell >= :clo AND geo_cell < :chi AND created_at >= :lo
+            ORDER BY created_at DESC LIMIT :n
+        """), {"clo": clo, "chi": chi, "lo": lo, "n": max_points}).mappings().all()
+        for r in rows:
+            points.add(POINT, [_project(r["gps_lat"], r["gps_lon"], z, x, y)], {
+                "id": int(r["id"]), "wear": _f(r["wear"]), "device_id": r["device_id"],
+                "created_at": r["created_at"].isoformat() if r["created_at"] else None,
+            }, fid=r["id"])
+    return encode_tile([cells, points])
+
+
+# ---------------------------------------------------------
+# 디스크 캐시
+# ---------------------------------------------------------
+class TileCache:
+    def __init__(self, root: str, min_zoom: int = 0, max_zoom: int = 22, max_age_s: float = 300.0):
+        self.root = root
+        self.min_zoom = min_zoom
+        self.max_zoom = max_zoom
+        self.max_age_s = float(max_age_s)
+
+    def path_for(self, window_h: int, z: int, x: int, y: int) -> str:
+        return os.path.join(self.root, str(int(window_h)), str(z), str(x), f"{y}.mvt")
+
+    def get(self, window_h: int, z: int, x: int, y: int, build: Callable[[], bytes]) -> bytes:
+        """캐시된 타일(없거나 max_age 가 지났으면 build 후 저장)"""
+        path = self.path_for(window_h, z, x, y)
+        try:
+            if time.time() - os.path.getmtime(path) < self.max_age_s:
+                with open(path, "rb") as f:
+                    return f.read()
+        except OSError:
+            pass
+        data = build()
+        write_atomic(path, data)
+        return data
+
+    def invalidate_rows(self, rows: List[Dict[str, Any]]):
+        """적재 commit hook — 새 행이 속한 타일 파일 삭제 (디스크에 있는 창/줌 디렉터리만 확인)"""
+        cells = {r.get("geo_cell") for r in rows} - {None}
+        if not cells:
+            return
+        try:
+            windows = [e.path for e in os.scandir(self.root) if e.is_dir()]
+        except OSError:
+            return
+        by_zoom: Dict[int, set] = {}
+        for w in windows:
+            try:
+                zooms = [int(e.name) for e in os.scandir(w) if e.name.isdigit()]
+            except OSError:
+                continue
+            for z in zooms:
+                if not (self.min_zoom <= z <= self.max_zoom):
+                    continue
+                if z not in by_zoom:
+                    by_zoom[z] = {geo_cells.cell_at(c, z) for c in cells}
+                for x, y in by_zoom[z]:
+                    try:
+                        os.remove(os.path.join(w, str(z), str(x), f"{y}.mvt"))
+                    except OSError:
+                        pass
@@ -0,0 +1,270 @@
+# video_ingest.py
+# 블랙박스 영상 업로드 처리.
+# - 영상은 cv2.VideoCapture 로 프레임 단위 스트리밍 디코드 (전체를 메모리에 올리지 않음)
+# - 시간 간격 또는 GPS 이동 거리 간격이 지난 프레임만 샘플링해 행으로 저장
+# - 얼굴/번호판 검출은 키프레임(주기 / 장면 전환 / 추적 실패)에서만 하고,
+#   사이 프레임은 LK 광류로 박스를 옮겨 블러한다
+import bisect
+import math
+from datetime import datetime
+from typing import Any, Iterator, List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+EARTH_R = 6371008.8
+
+
+def haversine_m(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    p1, p2 = math.radians(lat1), math.radians(lat2)
+    dp, dl = p2 - p1, math.radians(lon2 - lon1)
+    a = math.sin(dp / 2) ** 2 + math.cos(p1) * math.cos(p2) * math.sin(dl / 2) ** 2
+    return 2 * EARTH_R * math.asin(min(1.0, math.sqrt(a)))
+
+
+# ---------------------------------------------------------
+# GPS 궤적 (영상 시작 기준 초 → 위경도 선형 보간)
+# ---------------------------------------------------------
+class GpsTrack:
+    def __init__(self, points: List[Tuple[float, float, float]]):
+        if not points:
+            raise ValueError("empty gps track")
+        points = sorted(points)
+        self.ts = [p[0] for p in points]
+        self.pts = [(p[1], p[2]) for p in points]
+
+    @classmethod
+    def parse(cls, entries: Any, start: datetime) -> "GpsTrack":
+        """[{"t": 초} 또는 {"timestamp": ISO}, "lat", "lon"}, ...]"""
+        if not isinstance(entries, list):
+            raise ValueError("gps_track must be a JSON array")
+        points = []
+        for e in entries:
+            if "t" in e:
+                t = float(e["t"])
+            else:
+                ts = datetime.fromisoformat(str(e["timestamp"]).replace("Z", "+00:00"))
+                if (ts.tzinfo is None) != (start.tzinfo is None):
+                    ts = ts.replace(tzinfo=start.tzinfo)
+                t = (ts - start).total_seconds()
+            points.append((t, float(e["lat"]), float(e["lon"])))
+        return cls(points)
+
+    @classmethod
+    def fixed(cls, lat: float, lon: float) -> "GpsTrack":
+        return cls([(0.0, lat, lon)])
+
+    def at(self, t: float) -> Tuple[float, float]:
+        i = bisect.bisect_right(self.ts, t)
+        if i == 0:
+            return self.pts[0]
+        if i == len(self.ts):
+            return self.pts[-1]
+        t0, t1 = self.ts[i - 1], self.ts[i]
+        (a0, o0), (a1, o1) = self.pts[i - 1], self.pts[i]
+        f = (t - t0) / (t1 - t0) if t1 > t0 else 0.0
+        return a0 + (a1 - a0) * f, o0 + (o1 - o0) * f
+
+
+# ---------------------------------------------------------
+# 박스 추적 (키프레임 박스 → 이후 프레임)
+# ---------------------------------------------------------
+_LK_PARAMS = dict(winSize=(15, 15), maxLevel=3,
+                  criteria=(cv2.TERM_CRITERIA_EPS | cv2.TERM_CRITERIA_COUNT, 20, 0.03))
+
+
+class BoxTracker:
+    """
+    박스마다 내부 특징점을 잡아 피라미드 LK 광류로 따라간다 (축소 회색조 영상에서).
+    박스 이동 = 특징점 이동의 중앙값, 크기 = 중심까지 거리 비의 중앙값.
+    순방향/역방향 오차가 큰 점은 버리고, 점이 min_points 미만으로 남은 박스가 있으면 추적 실패(update → False).
+    """
+
+    def __init__(self, pad: float = 0.15, min_points: int = 3, fb_max_px: float = 1.5, inner_margin: float = 0.2):
+        self.pad = pad
+        self.inner_margin = inner_margin
+        self.min_points = min_points
+        self.fb_max_px = fb_max_px
+        self._gray: Optional[np.ndarray] = None
+        self._scale = 1.0
+        self._base: List[np.ndarray] = []       # 키프레임 박스, 축소 좌표 (x1, y1, x2, y2)
+        self._boxes: List[np.ndarray] = []      # 현재 박스
+        self._base_pts: List[np.ndarray] = []   # 박스별 키프레임 특징점 (N, 1, 2) — 살아남은 점만
+        self._pts: List[np.ndarray] = []        # 박스별 현재 특징점
+
+    @property
+    def active(self) -> bool:
+        return bool(self._boxes)
+
+    def _seed_points(self, gray: np.ndarray, box: np.ndarray) -> np.ndarray:
+        # 박스 가장자리의 점은 배경에 붙어 움직이지 않으므로 안쪽 영역에서만 고른다
+        h, w = gray.shape
+        m = (box[2:] - box[:2]) * self.inner_margin
+        x1, y1 = max(int(box[0] + m[0]), 0), max(int(box[1] + m[1]), 0)
+        x2, y2 = min(int(math.ceil(box[2] - m[0])), w), min(int(math.ceil(box[3] - m[1])), h)
+        pts = None
+        if x2 - x1 >= 4 and y2 - y1 >= 4:
+            mask = np.zeros_like(gray)
+            mask[y1:y2, x1:x2] = 255
+            pts = cv2.goodFeaturesToTrack(gray, maxCorners=20, qualityLevel=0.01, minDistance=2, mask=mask)
+        if pts is None or len(pts) < self.min_points:
+            # 질감이 없는 작은 박스는 3x3 격자점으로 추적
+            gx, gy = np.meshgrid(np.linspace(x1, x2, 3), np.linspace(y1, y2, 3))
+            pts = np.stack([gx.ravel(), gy.ravel()], axis=1).reshape(-1, 1, 2)
+        return pts.astype(np.float32)
+
+    def reset(self, gray: np.ndarray, boxes: np.ndarray, scale: float):
+        """키프레임 검출 결과로 다시 시작 (scale = 축소 영상 / 원본 프레임)"""
+        self._gray, self._scale = gray, scale
+        self._base = [np.asarray(b, np.float64) * scale for b in boxes]
+        self._boxes = list(self._base)
+        self._pts = [self._seed_points(gray, b) for b in self._base]
+        self._base_pts = [p.copy() for p in self._pts]
+
+    def update(self, gray: np.ndarray) -> bool:
+        if not self._boxes:
+            self._gray = gray
+            return True
+        counts = np.cumsum([len(p) for p in self._pts])[:-1]
+        p0 = np.concatenate(self._pts)
+        p1, st1, _ = cv2.calcOpticalFlowPyrLK(self._gray, gray, p0, None, **_LK_PARAMS)
+        back, st2, _ = cv2.calcOpticalFlowPyrLK(gray, self._gray, p1, None, **_LK_PARAMS)
+        good = (st1.ravel() == 1) & (st2.ravel() == 1) & (np.linalg.norm((p0 - back).reshape(-1, 2), axis=1) < self.fb_max_px)
+        ok = True
+        for i, (cur, g) in enumerate(zip(np.split(p1, counts), np.split(good, counts))):
+            if g.sum() < self.min_points:
+                ok = False          # 박스는 마지막 위치에 두고 (호출 측이 다시 검출) 계속 진행
+                continue
+            # 단계별 오차가 쌓이지 않도록 키프레임 점 배치와 비교해 이동/크기를 구한다
+            base, cur = self._base_pts[i][g].reshape(-1, 2), cur[g].reshape(-1, 2)
+            box = self._base[i]
+            # 배경에 걸려 멈춘 점(이동량이 중앙값에서 크게 벗어남)은 버린다
+            d = np.median(cur - base, axis=0)
+            keep = np.linalg.norm(cur - base - d, axis=1) <= max(2.0, 0.1 * float(np.mean(box[2:] - box[:2])))
+            if keep.sum() < self.min_points:
+                ok = False
+                continue
+            base, cur = base[keep], cur[keep]
+            d = np.median(cur - base, axis=0)
+            rb = np.linalg.norm(base - base.mean(axis=0), axis=1)
+            rc = np.linalg.norm(cur - cur.mean(axis=0), axis=1)
+            s = float(np.median(rc[rb > 1e-3] / rb[rb > 1e-3])) if (rb > 1e-3).sum() >= 2 else 1.0
+            c = (box[:2] + box[2:]) / 2 + d
+            half = (box[2:] - box[:2]) / 2 * s
+            self._boxes[i] = np.concatenate([c - half, c + half])
+            self._pts[i] = cur.reshape(-1, 1, 2).astype(np.float32)
+            self._base_pts[i] = base.reshape(-1, 1, 2)
+        self._gray = gray
+        return ok
+
+    def boxes(self) -> np.ndarray:
+        """원본 프레임 좌표 박스 (추적 오차를 덮도록 pad 비율만큼 확장)"""
+        if not self._boxes:
+            return np.empty((0, 4), float)
+        b = np.stack(self._boxes) / self._scale
+        m = (b[:, 2:] - b[:, :2]) * self.pad
+        return np.concatenate([b[:, :2] - m, b[:, 2:] + m], axis=1)
+
+
+# ---------------------------------------------------------
+# 샘플링
+# ---------------------------------------------------------
+class Sample:
+    __slots__ = ("index", "t", "frame", "gray", "lat", "lon", "keyframe")
+
+    def __init__(self, index, t, frame, gray, lat, lon, keyframe):
+        self.index = index
+        self.t = t
+        self.frame = frame
+        self.gray = gray
+        self.lat = lat
+        self.lon = lon
+        self.keyframe = keyframe
+
+
+class FrameSampler:
+    """
+    영상 파일을 순서대로 읽으며 샘플 프레임을 내보낸다.
+    - 마지막 샘플 이후 time_stride_s 초 또는 dist_stride_m 미터가 지나면 샘플 (0 이면 해당 기준 사용 안 함)
+    - 추적 중인 박스가 있으면 track_every 프레임마다 추적기만 갱신 (샘플 아님)
+    - 샘플의 keyframe: 첫 샘플 / 마지막 키프레임 후 keyframe_s 초 / 장면 전환 / 추적 실패
+      keyframe 샘플을 받으면 호출 측이 검출 후 tracker.reset(sample.gray, boxes, sampler.track_scale) 을 불러야 한다.
+    """
+
+    def __init__(self, path: str, track: GpsTrack, time_stride_s: float = 1.0, dist_stride_m: float = 0.0,
+                 max_edge: int = 1280, keyframe_s: float = 2.0, track_every: int = 2, track_edge: int = 480,
+                 scene_diff: float = 25.0, max_samples: int = 600, tracker: Optional[BoxTracker] = None):
+        self.path = path
+        self.track = track
+        self.time_stride_s = time_stride_s
+        self.dist_stride_m = dist_stride_m
+        self.max_edge = max_edge
+        self.keyframe_s = keyframe_s
+        self.track_every = max(1, track_every)
+        self.track_edge = track_edge
+        self.scene_diff = scene_diff
+        self.max_samples = max_samples
+        self.tracker = tracker or BoxTracker()
+        self.track_scale = 1.0
+        self.fps = 0.0
+        self.frames_decoded = 0
+        self.truncated = False
+
+    def _prepare(self, frame: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        h, w = frame.shape[:2]
+        if max(w, h) > self.max_edge:
+            s = self.max_edge / max(w, h)
+            frame = cv2.resize(frame, (int(w * s), int(h * s)), interpolation=cv2.INTER_AREA)
+            h, w = frame.shape[:2]
+        self.track_scale = min(1.0, self.track_edge / max(w, h))
+        small = frame if self.track_scale >= 1.0 else cv2.resize(
+            frame, (max(1, int(w * self.track_scale)), max(1, int(h * self.track_scale))), interpolation=cv2.INTER_AREA)
+        return frame, cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+
+    @staticmethod
+    def _signature(gray: np.ndarray) -> np.ndarray:
+        return cv2.resize(gray, (32, 18), interpolation=cv2.INTER_AREA).astype(np.int16)
+
+    def __iter__(self) -> Iterator[Sample]:
+        cap = cv2.VideoCapture(self.path)
+        if not cap.isOpened():
+            raise ValueError("cannot open video")
+        try:
+            fps = cap.get(cv2.CAP_PROP_FPS)
+            self.fps = fps if fps and math.isfinite(fps) and fps > 0 else 30.0
+            n_samples = 0
+            last_t = last_key_t = None
+            last_pos = key_sig = None
+            lost = False
+            idx = -1
+            while cap.grab():       # grab 은 픽셀 변환 없이 다음 프레임으로 이동
+                idx += 1
+                self.frames_decoded += 1
+                t = idx / self.fps
+                lat, lon = self.track.at(t)
+                due = last_t is None or (self.time_stride_s > 0 and t - last_t >= self.time_stride_s) or \
+                    (self.dist_stride_m > 0 and haversine_m(last_pos[0], last_pos[1], lat, lon) >= self.dist_stride_m)
+                tracking = self.tracker.active and idx % self.track_every == 0
+                if not (due or tracking):
+                    continue
+                ok, frame = cap.retrieve()
+                if not ok:
+                    continue
+                frame, gray = self._prepare(frame)
+                lost = not self.tracker.update(gray) or lost     # 사이 프레임에서 잃어도 다음 샘플은 키프레임
+                if not due:
+                    continue
+                if n_samples >= self.max_samples:
+                    self.truncated = True
+                    break
+                sig = self._signature(gray)
+                key = (last_key_t is None or t - last_key_t >= self.keyframe_s or lost
+                       or float(np.abs(sig - key_sig).mean()) > self.scene_diff)
+                if key:
+                    last_key_t, key_sig, lost = t, sig, False
+                last_t, last_pos = t, (lat, lon)
+                n_samples += 1
+                yield Sample(idx, t, frame, gray, lat, lon, key)
+        finally:
+            cap.release()
+